@@ -0,0 +1,98 @@
+"""
+Blocking call check.
+
+Scans the bot's modules for calls inside `async def` functions that block
+the event loop (synchronous HTTP, sleeps, subprocesses, file writes of
+the whole store, ...). Calls that are awaited, or that sit in a nested
+plain function or lambda (e.g. one handed to run_in_executor), are not
+counted. Fails (exit code 1) on any call not listed in KNOWN_BLOCKING, so
+a new blocking call is caught before it stalls the live bot.
+
+    python blocking_check.py
+"""
+import ast
+import glob
+import os
+import sys
+
+BLOCKING_CALLS = {
+    "time.sleep", "open", "input",
+    "requests.get", "requests.post", "requests.put", "requests.delete", "requests.head", "requests.request",
+    "urllib.request.urlopen", "socket.create_connection",
+    "subprocess.run", "subprocess.call", "subprocess.check_call", "subprocess.check_output",
+    "json.dump", "json.load", "shutil.copyfile", "shutil.move",
+    # The bot's own synchronous file writes
+    "write_json_atomic", "export_json", "save_snapshot", "write_snapshot", "write_json_records", "file_lock"
+}
+# Any not-awaited call to a method with one of these names, e.g. the SDK's model.generate_content
+BLOCKING_METHODS = {"generate_content", "save_user", "write_user", "load_all", "sleep"}
+
+# (file, async function, call) sites that are known and accepted; the loop
+# lag monitor (loop_monitor.py) shows how long they take in production
+KNOWN_BLOCKING = {
+    # Opens the empty lock file; the lock itself is polled without blocking
+    ("shared_store.py", "async_file_lock", "open"),
+}
+
+
+def _dotted(node) -> str:
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        base = _dotted(node.value)
+        return f"{base}.{node.attr}" if base else node.attr
+    return ""
+
+
+def _calls(function):
+    """Calls made directly by an async function, with whether each is awaited"""
+    awaited = set()
+    pending = list(function.body)
+    while pending:
+        node = pending.pop()
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.ClassDef)):
+            continue  # Runs elsewhere (an executor, a callback) or is checked on its own
+        if isinstance(node, ast.Await) and isinstance(node.value, ast.Call):
+            awaited.add(id(node.value))
+        if isinstance(node, ast.Call):
+            yield node, id(node) in awaited
+        pending.extend(ast.iter_child_nodes(node))
+
+
+def find_blocking_calls(directory: str):
+    """(file, async function, call, line) of every blocking call in the directory's modules"""
+    found = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.py"))):
+        filename = os.path.basename(path)
+        with open(path, encoding="utf-8") as f:
+            tree = ast.parse(f.read(), filename)
+        for function in ast.walk(tree):
+            if not isinstance(function, ast.AsyncFunctionDef):
+                continue
+            for call, awaited in _calls(function):
+                name = _dotted(call.func)
+                if awaited or not name:
+                    continue
+                method = name.rsplit(".", 1)[-1]
+                if name in BLOCKING_CALLS or method in BLOCKING_METHODS:
+                    found.append((filename, function.name, name, call.lineno))
+    return found
+
+
+def main():
+    directory = os.path.dirname(os.path.abspath(__file__))
+    found = find_blocking_calls(directory)
+    new = [site for site in found if site[:3] not in KNOWN_BLOCKING]
+    for filename, function, name, line in found:
+        status = "NEW  " if (filename, function, name) not in KNOWN_BLOCKING else "known"
+        print(f"{status} {filename}:{line} {name}() in async {function}")
+    stale = KNOWN_BLOCKING - {site[:3] for site in found}
+    for filename, function, name in sorted(stale):
+        print(f"gone  {filename} {name}() in async {function} (remove it from KNOWN_BLOCKING)")
+    if new:
+        print(f"FAIL: {len(new)} new blocking call(s) in async code; run them in an executor or await an async version")
+    sys.exit(1 if new else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,81 @@ load_dotenv()
 DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
 COMMAND_PREFIX = os.getenv('COMMAND_PREFIX', '!')
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-1.5-flash')
+
+# Local model server with an OpenAI-compatible API (Ollama, llama.cpp, vLLM, ...), used instead of or alongside Gemini
+LOCAL_MODEL_URL = os.getenv('LOCAL_MODEL_URL')  # e.g. http://localhost:11434/v1 for Ollama
+LOCAL_MODEL_NAME = os.getenv('LOCAL_MODEL_NAME', 'llava')
+LOCAL_MODEL_API_KEY = os.getenv('LOCAL_MODEL_API_KEY')
+LOCAL_MODEL_VISION = os.getenv('LOCAL_MODEL_VISION', 'true').lower() in ('1', 'true', 'yes')  # False sends only text requests to it
+
+# Which backend answers: 'gemini', 'local' or 'auto' (the fastest available), optionally per request kind
+MODEL_BACKEND = os.getenv('MODEL_BACKEND', 'gemini' if GEMINI_API_KEY or not LOCAL_MODEL_URL else 'local').lower()
+MODEL_ROUTES = {  # e.g. MODEL_ROUTES=estimate=local,image=auto (kinds: image, describe, estimate, test)
+    kind.strip(): backend.strip().lower()
+    for kind, _, backend in (route.partition('=') for route in os.getenv('MODEL_ROUTES', '').split(','))
+    if backend.strip()
+}
+
+# Recording model answers and replaying them instead of calling a model (deterministic runs, no network)
+MODEL_RECORD_PATH = os.getenv('MODEL_RECORD_PATH')  # Append every answer to this corpus (gzip'd JSON lines)
+MODEL_REPLAY_PATH = os.getenv('MODEL_REPLAY_PATH')  # Serve answers from this corpus; no model is called
+MODEL_REPLAY_LATENCY = os.getenv('MODEL_REPLAY_LATENCY', 'recorded').lower()  # 'recorded', or seconds per answer (0 = full speed)
+
+# Gemini client resilience settings
+GEMINI_MAX_RETRIES = int(os.getenv('GEMINI_MAX_RETRIES', '3'))
+GEMINI_DEADLINE_SECONDS = float(os.getenv('GEMINI_DEADLINE_SECONDS', '30'))
+GEMINI_HEDGE_DELAY = float(os.getenv('GEMINI_HEDGE_DELAY')) if os.getenv('GEMINI_HEDGE_DELAY') else None  # Unset disables hedging
+GEMINI_BREAKER_THRESHOLD = int(os.getenv('GEMINI_BREAKER_THRESHOLD', '5'))
+GEMINI_BREAKER_RESET_SECONDS = float(os.getenv('GEMINI_BREAKER_RESET_SECONDS', '30'))
+
+# Model usage accounting and daily budgets (USD; 0 means no budget)
+GEMINI_PROMPT_PRICE = float(os.getenv('GEMINI_PROMPT_PRICE', '0.075'))  # USD per million prompt tokens
+GEMINI_OUTPUT_PRICE = float(os.getenv('GEMINI_OUTPUT_PRICE', '0.30'))  # USD per million output tokens
+USAGE_USER_DAILY_BUDGET = float(os.getenv('USAGE_USER_DAILY_BUDGET', '0'))
+USAGE_GUILD_DAILY_BUDGET = float(os.getenv('USAGE_GUILD_DAILY_BUDGET', '0'))
+USAGE_ECONOMY_SHARE = float(os.getenv('USAGE_ECONOMY_SHARE', '0.8'))  # Share of a budget after which cheaper paths are used
+ECONOMY_IMAGE_SIZE = int(os.getenv('ECONOMY_IMAGE_SIZE', '384'))  # Longest side of images sent in economy mode
+
+# Adaptive image resolution: a thumbnail first, the full image only when the answer is unsure
+ADAPTIVE_IMAGE_SIZE = int(os.getenv('ADAPTIVE_IMAGE_SIZE', '0'))  # Longest side of the first pass (e.g. 384); 0 (default) always sends the full image
+ADAPTIVE_MIN_CONFIDENCE = float(os.getenv('ADAPTIVE_MIN_CONFIDENCE', '70'))  # Below this the full image is sent as well
+
+# Storage settings
+CALORIES_FORMAT = os.getenv('CALORIES_FORMAT', 'snapshot').lower()  # 'snapshot' (binary) or 'json'
+SNAPSHOT_MMAP = os.getenv('SNAPSHOT_MMAP', 'true').lower() in ('1', 'true', 'yes')  # Memory-map the snapshot when loading
+SAVE_DELAY_SECONDS = float(os.getenv('SAVE_DELAY_SECONDS', '2'))  # Changes within this window share one save of the snapshot/JSON file
+RETENTION_POLICY = os.getenv('RETENTION_POLICY', 'off').lower()  # 'off' (keep everything), 'archive' (gzip per user-month) or 'summary' (totals only)
+RETENTION_HOT_DAYS = int(os.getenv('RETENTION_HOT_DAYS', '365'))  # Days kept in memory (at least 31)
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'calorie_archive')  # Where older days are moved to
+
+# Multi-process / sharding settings (set per worker by launcher.py)
+SHARD_COUNT = int(os.getenv('SHARD_COUNT')) if os.getenv('SHARD_COUNT') else None
+SHARD_IDS = [int(shard_id) for shard_id in os.getenv('SHARD_IDS').split(',')] if os.getenv('SHARD_IDS') else None
+SHARED_STORE_DIR = os.getenv('SHARED_STORE_DIR')  # Per-user files shared by all workers; unset uses user_calories.json
+IMAGE_PROCESS_WORKERS = int(os.getenv('IMAGE_PROCESS_WORKERS', '2'))  # 0 decodes images in a thread instead
+
+# Logging (written by a background thread)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()  # 'text' or 'json' (one object per line)
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '1'))  # Lines per second each INFO/DEBUG call site may log after a burst, 0 disables sampling
+LOG_SAMPLE_BURST = int(os.getenv('LOG_SAMPLE_BURST', '10'))
+
+# Event loop monitoring
+LOOP_LAG_THRESHOLD_MS = float(os.getenv('LOOP_LAG_THRESHOLD_MS', '250'))  # Log where the loop was stuck when it is this late
+LOOP_DEBUG = os.getenv('LOOP_DEBUG', 'false').lower() in ('1', 'true', 'yes')  # asyncio debug mode names slow callbacks (slower)
+
+# Shutdown
+SHUTDOWN_DRAIN_SECONDS = float(os.getenv('SHUTDOWN_DRAIN_SECONDS', '20'))  # How long running analyses get to finish on SIGTERM
+
+# Slash commands
+SYNC_APP_COMMANDS = os.getenv('SYNC_APP_COMMANDS', 'true').lower() in ('1', 'true', 'yes')  # Push slash commands to Discord on startup
+APP_COMMAND_GUILD_ID = int(os.getenv('APP_COMMAND_GUILD_ID')) if os.getenv('APP_COMMAND_GUILD_ID') else None  # Sync to one guild only (instant, for testing)
+
+# Daily digest settings
+DIGEST_TIME = os.getenv('DIGEST_TIME', '21:00')  # Local time (HH:MM) the end-of-day summaries go out
+DIGEST_BATCH_SIZE = int(os.getenv('DIGEST_BATCH_SIZE', '25'))  # Messages sent per batch
+DIGEST_BATCH_INTERVAL = float(os.getenv('DIGEST_BATCH_INTERVAL', '1.0'))  # Minimum seconds between batches
 
 # Bot settings
 BOT_NAME = "CalorieCountingBot"
@@ -18,5 +93,5 @@ BOT_DESCRIPTION = "A Discord bot to help track calories and nutrition with AI im
 if not DISCORD_TOKEN:
     raise ValueError("DISCORD_TOKEN environment variable is not set. Please check your .env file.")
 
-if not GEMINI_API_KEY:
+if not GEMINI_API_KEY and not LOCAL_MODEL_URL and not MODEL_REPLAY_PATH:
     print("Warning: GEMINI_API_KEY not set. Image recognition features will be disabled.")
@@ -0,0 +1,176 @@
+import cProfile
+import io
+import itertools
+import marshal
+import pstats
+import sys
+import time
+import tracemalloc
+
+PROFILE_MAX_SECONDS = 300  # A forgotten profile stops itself after this long
+PROFILE_REPORT_LINES = 40
+TRACEMALLOC_FRAMES = 1  # One frame per allocation keeps tracing overhead low
+MEMSNAP_TOP = 25
+SIZE_SAMPLE_USERS = 50
+
+
+class LoopProfiler:
+    """
+    cProfile over the event loop's thread between start() and stop(), so it
+    shows what holds up the loop (executor threads are not profiled). Only
+    one profile runs at a time and it is switched off after max_seconds
+    even if nobody stops it, bounding the overhead; the result is kept
+    until stop() collects it.
+    """
+
+    def __init__(self, max_seconds: int = PROFILE_MAX_SECONDS):
+        self.max_seconds = max_seconds
+        self._profile = None
+        self._started = None
+        self._elapsed = None
+        self._expiry = None
+
+    @property
+    def running(self) -> bool:
+        return self._profile is not None and self._elapsed is None
+
+    def start(self, loop) -> bool:
+        """Start profiling the thread running loop (call from that loop); False if already running"""
+        if self.running:
+            return False
+        self._profile = cProfile.Profile()
+        self._elapsed = None
+        self._started = time.monotonic()
+        self._profile.enable()
+        self._expiry = loop.call_later(self.max_seconds, self._finish)
+        return True
+
+    def _finish(self):
+        if self.running:
+            self._profile.disable()
+            self._elapsed = time.monotonic() - self._started
+        if self._expiry:
+            self._expiry.cancel()
+            self._expiry = None
+
+    def stop(self):
+        """(profile, seconds profiled) of the running or expired profile, or None"""
+        if self._profile is None:
+            return None
+        self._finish()
+        profile, self._profile = self._profile, None
+        return profile, self._elapsed
+
+
+def profile_report(profile: cProfile.Profile, elapsed: float):
+    """(text report, pstats dump) of a finished profile; slow for big profiles, so run it in a worker thread"""
+    stats = pstats.Stats(profile, stream=io.StringIO())
+    report = io.StringIO()
+    report.write(f"Event loop profile over {elapsed:.1f}s\n")
+    for order in (pstats.SortKey.CUMULATIVE, pstats.SortKey.TIME):
+        report.write(f"\n=== Top {PROFILE_REPORT_LINES} by {order.value} time ===\n")
+        stats.stream = report
+        stats.sort_stats(order).print_stats(PROFILE_REPORT_LINES)
+    # The raw stats open in snakeviz or pstats for a closer look
+    return report.getvalue(), marshal.dumps(stats.stats)
+
+
+def start_tracing() -> bool:
+    """Start tracemalloc; False if it was already tracing"""
+    if tracemalloc.is_tracing():
+        return False
+    tracemalloc.start(TRACEMALLOC_FRAMES)
+    return True
+
+
+def stop_tracing() -> bool:
+    if not tracemalloc.is_tracing():
+        return False
+    tracemalloc.stop()
+    return True
+
+
+def top_allocations(limit: int = MEMSNAP_TOP) -> dict:
+    """
+    Current and peak traced memory plus the source lines holding the most of
+    it, or None when not tracing. Grouping the traces is slow with many
+    allocations, so run this in a worker thread.
+    """
+    if not tracemalloc.is_tracing():
+        return None
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+    ))
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "current": current,
+        "peak": peak,
+        "overhead": tracemalloc.get_tracemalloc_memory(),
+        "top": [(str(stat.traceback[0]), stat.size, stat.count) for stat in snapshot.statistics("lineno")[:limit]]
+    }
+
+
+def _entry_size(food) -> int:
+    size = sys.getsizeof(food) + sys.getsizeof(food.id)
+    if food.macros is not None:
+        size += sys.getsizeof(food.macros) + sum(sys.getsizeof(grams) for grams in food.macros)
+    return size  # Names are interned and shared, so not counted per entry
+
+
+def _user_size(user_data: dict) -> int:
+    size = sys.getsizeof(user_data)
+    for day, day_log in user_data.items():
+        size += sys.getsizeof(day) + sys.getsizeof(day_log) + sys.getsizeof(day_log.foods)
+        size += sum(_entry_size(food) for food in day_log.foods)
+    return size
+
+
+def store_stats(user_calories) -> dict:
+    """
+    Users, days and entries held in memory, and an estimate of their size
+    from a sample of users. Users a snapshot has not decoded yet are only
+    counted, so this never loads anyone.
+    """
+    decoded_ids = getattr(user_calories, "decoded_ids", None)
+    user_ids = decoded_ids if decoded_ids is not None else list(user_calories)
+    days = entries = 0
+    for user_id_str in user_ids:
+        user_data = user_calories[user_id_str]
+        days += len(user_data)
+        entries += sum(len(day_log.foods) for day_log in user_data.values())
+
+    sample = list(itertools.islice(user_ids, SIZE_SAMPLE_USERS))
+    sample_entries = sum(len(day_log.foods) for user_id_str in sample for day_log in user_calories[user_id_str].values())
+    sample_bytes = sum(_user_size(user_calories[user_id_str]) for user_id_str in sample)
+    if sample_entries:
+        estimate = round(sample_bytes * entries / sample_entries)
+    else:
+        estimate = sample_bytes
+    return {
+        "users": len(user_calories),
+        "decoded_users": len(user_ids),
+        "days": days,
+        "entries": entries,
+        "estimated_bytes": estimate
+    }
+
+
+def format_bytes(size: float) -> str:
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def format_allocations(allocations: dict) -> str:
+    lines = [
+        f"Traced memory: {format_bytes(allocations['current'])} now, {format_bytes(allocations['peak'])} peak "
+        f"(tracemalloc itself uses {format_bytes(allocations['overhead'])})",
+        "",
+        f"Top {len(allocations['top'])} allocating lines since tracing started:"
+    ]
+    for location, size, count in allocations["top"]:
+        lines.append(f"{format_bytes(size):>10}  {count:>8} blocks  {location}")
+    return "\n".join(lines) + "\n"
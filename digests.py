@@ -0,0 +1,291 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, date, timedelta
+from shared_store import async_file_lock, read_json, write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+DM = "dm"
+GUILD = "guild"
+
+
+class DigestSettings:
+    """
+    Who opted in to the end-of-day summary and where it goes. Stored as a
+    small JSON file; every change re-reads it under a file lock, so worker
+    processes sharing the file don't overwrite each other's changes. Changes
+    wait for the lock without blocking the event loop and do the file I/O
+    in a thread.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._data = None
+        self._version = None
+
+    def _version_on_disk(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _read(self) -> tuple:
+        """(version, data) as stored on disk"""
+        version = self._version_on_disk()
+        data = read_json(self.path, {})
+        return version, {"users": data.get("users", {}), "guilds": data.get("guilds", {})}
+
+    def _write(self, data: dict):
+        write_json_atomic(self.path, data, indent=2)
+        return self._version_on_disk()
+
+    def _load(self) -> dict:
+        if self._data is None or self._version_on_disk() != self._version:
+            self._version, self._data = self._read()
+        return self._data
+
+    async def _update(self, change):
+        loop = asyncio.get_running_loop()
+        async with async_file_lock(f"{self.path}.lock"):
+            # Re-read under the lock, another worker may have just changed the file
+            self._version, self._data = await loop.run_in_executor(None, self._read)
+            change(self._data)
+            self._version = await loop.run_in_executor(None, self._write, self._data)
+
+    def user(self, user_id_str: str):
+        """A user's digest settings (mode is None if they only set a goal), or None"""
+        return self._load()["users"].get(user_id_str)
+
+    def guild_channel(self, guild_id_str: str):
+        return self._load()["guilds"].get(guild_id_str)
+
+    async def subscribe(self, user_id_str: str, mode: str, target_id: int, goal: int = None):
+        """Opt a user in; target_id is their DM channel (mode dm) or the guild (mode guild)"""
+        def change(data):
+            previous = data["users"].get(user_id_str, {})
+            data["users"][user_id_str] = {
+                "mode": mode,
+                "target": target_id,
+                "goal": goal if goal is not None else previous.get("goal")
+            }
+        await self._update(change)
+
+    async def unsubscribe(self, user_id_str: str) -> bool:
+        """Stop a user's summaries (their goal is kept), returning whether they were subscribed"""
+        removed = []
+        def change(data):
+            settings = data["users"].get(user_id_str)
+            if settings and settings["mode"]:
+                removed.append(True)
+                if settings.get("goal"):
+                    settings["mode"] = settings["target"] = None
+                else:
+                    del data["users"][user_id_str]
+        await self._update(change)
+        return bool(removed)
+
+    async def set_goal(self, user_id_str: str, goal: int):
+        """Set a user's daily calorie goal, whether or not they get summaries"""
+        def change(data):
+            settings = data["users"].setdefault(user_id_str, {"mode": None, "target": None})
+            settings["goal"] = goal
+        await self._update(change)
+
+    def goal(self, user_id_str: str):
+        settings = self.user(user_id_str)
+        return settings.get("goal") if settings else None
+
+    async def set_guild_channel(self, guild_id_str: str, channel_id: int = None):
+        """Post a guild's roll-up in channel_id (None turns it off)"""
+        def change(data):
+            if channel_id is None:
+                data["guilds"].pop(guild_id_str, None)
+            else:
+                data["guilds"][guild_id_str] = channel_id
+        await self._update(change)
+
+    def subscribers(self, after: str = None):
+        """(user_id_str, settings) in a stable order, optionally resuming after a user"""
+        users = self._load()["users"]
+        for user_id_str in sorted(users, key=int):
+            if after is None or int(user_id_str) > int(after):
+                yield user_id_str, users[user_id_str]
+
+
+class DigestCheckpoint:
+    """
+    Progress of the fan-out for one day. The cursor is written before each
+    batch is sent, so a restart skips anything that may already have gone
+    out: a crash can drop at most one batch but never sends a digest twice.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        data = read_json(path, {})
+        self.day = data.get("day")
+        self.cursor = data.get("cursor")
+        self.guilds_done = set(data.get("guilds_done", []))
+        self.finished = data.get("finished", False)
+
+    def start(self, day: str):
+        if self.day != day:
+            self.day = day
+            self.cursor = None
+            self.guilds_done = set()
+            self.finished = False
+            self.save()
+
+    def save(self):
+        write_json_atomic(self.path, {
+            "day": self.day,
+            "cursor": self.cursor,
+            "guilds_done": sorted(self.guilds_done),
+            "finished": self.finished
+        }, indent=2)
+
+    def pending_day(self):
+        """Day whose fan-out was interrupted, if any"""
+        return self.day if self.day and not self.finished else None
+
+
+def _batches(items, size: int):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def seconds_until(send_time: str, now: datetime) -> float:
+    """Seconds from now until the next HH:MM local time"""
+    hour, minute = (int(part) for part in send_time.split(":"))
+    target = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if target <= now:
+        target += timedelta(days=1)
+    return (target - now).total_seconds()
+
+
+class DigestScheduler:
+    """
+    Sends the end-of-day summaries once a day at send_time. Subscribers are
+    walked in ID order and each user's day is looked up on its own, so the
+    calorie store is never copied and lazily loaded users stay undecoded
+    unless they opted in. Sends go out in batches of batch_size with at
+    least batch_interval seconds between batch starts, keeping the fan-out
+    well below Discord's global limit of 50 requests per second.
+    """
+
+    def __init__(self, settings: DigestSettings, checkpoint_path: str, *, day_log, send_dm, send_rollup,
+                 send_time: str = "21:00", batch_size: int = 25, batch_interval: float = 1.0,
+                 send_dms: bool = True, owns_guild=lambda guild_id: True, retry_delay: float = 60.0):
+        self.settings = settings
+        self.checkpoint_path = checkpoint_path
+        self.day_log = day_log            # (user_id_str, day) -> DayLog or None
+        self.send_dm = send_dm            # async (user_id_str, settings, day, day_log)
+        self.send_rollup = send_rollup    # async (guild_id_str, channel_id, day, [(user_id_str, settings, day_log)])
+        self.send_time = send_time
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.send_dms = send_dms
+        self.owns_guild = owns_guild
+        self.retry_delay = retry_delay    # Before resuming a fan-out that raised
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return self._task
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            checkpoint = DigestCheckpoint(self.checkpoint_path)
+            day = checkpoint.pending_day()
+            if day:
+                # Interrupted by a restart or a failed send: carry on after the saved cursor, same day
+                logger.info(f"Resuming digest fan-out for {day} after user {checkpoint.cursor}")
+                delay = 0
+            else:
+                now = datetime.now()
+                day = None
+                hour, minute = (int(part) for part in self.send_time.split(":"))
+                due_today = now >= now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+                # Started after send_time without having sent today's digests yet
+                if due_today and checkpoint.day != now.date().isoformat():
+                    delay = 0
+                else:
+                    delay = seconds_until(self.send_time, now)
+            await asyncio.sleep(delay)
+            try:
+                await self.fan_out(day or date.today().isoformat())
+            except Exception as e:
+                # Left unfinished in the checkpoint, resumed on the next pass
+                logger.error(f"Digest fan-out failed, resuming in {self.retry_delay:.0f}s: {e}")
+                await asyncio.sleep(self.retry_delay)
+
+    async def fan_out(self, day: str):
+        """Send every digest for a day, resuming from the checkpoint"""
+        checkpoint = DigestCheckpoint(self.checkpoint_path)
+        checkpoint.start(day)
+        if checkpoint.finished:
+            return
+        started = time.monotonic()
+        sent = 0
+
+        if self.send_dms:
+            dm_subscribers = (
+                (user_id_str, settings) for user_id_str, settings in self.settings.subscribers(after=checkpoint.cursor)
+                if settings["mode"] == DM
+            )
+            for batch in _batches(dm_subscribers, self.batch_size):
+                batch_started = time.monotonic()
+                # Claim the batch before sending it, see DigestCheckpoint
+                checkpoint.cursor = batch[-1][0]
+                checkpoint.save()
+                sends = []
+                for user_id_str, settings in batch:
+                    day_log = self.day_log(user_id_str, day)
+                    if day_log and day_log.foods:
+                        sends.append(self._send(self.send_dm(user_id_str, settings, day, day_log)))
+                sent += sum(await asyncio.gather(*sends))
+                await asyncio.sleep(max(0.0, self.batch_interval - (time.monotonic() - batch_started)))
+
+        # One message per guild, listing the members who opted in there
+        rollups = {}
+        for user_id_str, settings in self.settings.subscribers():
+            guild_id_str = str(settings["target"])
+            if settings["mode"] != GUILD or guild_id_str in checkpoint.guilds_done or not self.owns_guild(int(guild_id_str)):
+                continue
+            day_log = self.day_log(user_id_str, day)
+            if day_log and day_log.foods:
+                rollups.setdefault(guild_id_str, []).append((user_id_str, settings, day_log))
+        for guild_id_str, rows in rollups.items():
+            channel_id = self.settings.guild_channel(guild_id_str)
+            if not channel_id:
+                continue
+            checkpoint.guilds_done.add(guild_id_str)
+            checkpoint.save()
+            sent += await self._send(self.send_rollup(guild_id_str, channel_id, day, rows))
+            await asyncio.sleep(self.batch_interval / self.batch_size)
+
+        checkpoint.finished = True
+        checkpoint.save()
+        logger.info(f"Digest fan-out for {day} sent {sent} messages in {time.monotonic() - started:.1f}s")
+
+    async def _send(self, send) -> int:
+        try:
+            await send
+            return 1
+        except Exception as e:
+            # Closed DMs, deleted channels etc. must not stop the fan-out
+            logger.warning(f"Could not send digest: {e}")
+            return 0
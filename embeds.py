@@ -0,0 +1,605 @@
+import discord
+from config import COMMAND_PREFIX
+from diagnostics import format_bytes
+from usage import NORMAL, ECONOMY, EXHAUSTED, REQUESTS, PROMPT_TOKENS, OUTPUT_TOKENS, COST
+
+LOG_HINT = "Click ✅ to log calories"
+DISCLAIMER = "Estimates may vary - consult nutritional labels for accuracy"
+
+
+def _add_nutrition_field(embed: discord.Embed, nutrition: dict):
+    """Add the nutritional breakdown returned by Gemini, if any"""
+    if not nutrition:
+        return
+    nutrition_text = []
+    for nutrient, amount in nutrition.items():
+        if amount and str(amount) != "0":
+            nutrition_text.append(f"**{nutrient.title()}:** {amount}")
+
+    if nutrition_text:
+        embed.add_field(
+            name="📊 Nutritional Info",
+            value="\n".join(nutrition_text),
+            inline=False
+        )
+
+
+MACRO_LABELS = {"protein": "🥩 Protein", "carbs": "🍞 Carbs", "fat": "🧈 Fat", "fiber": "🥦 Fiber", "sugar": "🍬 Sugar"}
+
+
+def _add_macros_field(embed: discord.Embed, daily_data):
+    """A day's macro totals, from the sums kept on the DayLog"""
+    if not daily_data.macro_entries:
+        return
+    totals = daily_data.macros
+    name = "🧮 Macros"
+    if daily_data.macro_entries < len(daily_data.foods):
+        name += f" ({daily_data.macro_entries} of {len(daily_data.foods)} entries)"
+    embed.add_field(
+        name=name,
+        value=" • ".join(f"{label} **{totals[macro]:g} g**" for macro, label in MACRO_LABELS.items()),
+        inline=False
+    )
+
+
+def _add_health_notes_field(embed: discord.Embed, health_notes: str):
+    if health_notes:
+        embed.add_field(
+            name="💡 Health Notes",
+            value=health_notes,
+            inline=False
+        )
+
+
+def build_analysis_error_embed(error: str) -> discord.Embed:
+    return discord.Embed(
+        title="❌ Analysis Failed",
+        description=error,
+        color=0xff0000
+    )
+
+
+def build_image_analysis_embed(result: dict, author_name: str, image_url: str) -> discord.Embed:
+    """Result of an image-only analysis"""
+    confidence = result.get("confidence", 0)
+
+    # Choose color based on confidence
+    if confidence >= 80:
+        color = 0x00ff00  # Green - high confidence
+        confidence_emoji = "🎯"
+    elif confidence >= 60:
+        color = 0xffff00  # Yellow - medium confidence
+        confidence_emoji = "⚠️"
+    else:
+        color = 0xff9900  # Orange - low confidence
+        confidence_emoji = "❓"
+
+    embed = discord.Embed(
+        title="🍽️ Food Analysis Results",
+        description=f"**{result['food_name']}**",
+        color=color
+    )
+
+    # Add calorie information
+    embed.add_field(
+        name="🔥 Estimated Calories",
+        value=f"**{result['calories']} kcal**",
+        inline=True
+    )
+
+    embed.add_field(
+        name=f"{confidence_emoji} Confidence",
+        value=f"{confidence}%",
+        inline=True
+    )
+
+    embed.add_field(
+        name="📏 Portion Size",
+        value=result.get('portion_size', 'Unknown'),
+        inline=True
+    )
+
+    _add_nutrition_field(embed, result.get('nutritional_info', {}))
+    _add_health_notes_field(embed, result.get('health_notes', ''))
+
+    # Add footer with disclaimer and logging instructions
+    embed.set_footer(text=f"Analyzed by {author_name} • {LOG_HINT} • {DISCLAIMER}")
+
+    # Add thumbnail with the analyzed image
+    embed.set_thumbnail(url=image_url)
+    return embed
+
+
+def build_enhanced_analysis_embed(result: dict, author_name: str, image_url: str) -> discord.Embed:
+    """Result of an image analysis that may have used the user's description"""
+    confidence = result.get("confidence", 0)
+
+    # Choose color based on confidence (enhanced accuracy should have higher confidence)
+    if confidence >= 85:
+        color = 0x00aa00  # Darker green - very high confidence
+        confidence_emoji = "🎯"
+    elif confidence >= 70:
+        color = 0x00ff00  # Green - high confidence
+        confidence_emoji = "✅"
+    elif confidence >= 50:
+        color = 0xffff00  # Yellow - medium confidence
+        confidence_emoji = "⚠️"
+    else:
+        color = 0xff9900  # Orange - low confidence
+        confidence_emoji = "❓"
+
+    # Title changes based on whether description was used
+    title = "🍽️ Enhanced Food Analysis Results" if result.get("user_description_used") else "🍽️ Food Analysis Results"
+
+    embed = discord.Embed(
+        title=title,
+        description=f"**{result['food_name']}**",
+        color=color
+    )
+
+    # Add calorie information
+    embed.add_field(
+        name="🔥 Estimated Calories",
+        value=f"**{result['calories']} kcal**",
+        inline=True
+    )
+
+    embed.add_field(
+        name=f"{confidence_emoji} Confidence",
+        value=f"{confidence}%",
+        inline=True
+    )
+
+    embed.add_field(
+        name="📏 Portion Size",
+        value=result.get('portion_size', 'Unknown'),
+        inline=True
+    )
+
+    # Show if user description was used and accuracy
+    if result.get("user_description_used"):
+        description_accuracy = result.get("description_accuracy", "")
+        accuracy_emoji = {
+            "good": "✅",
+            "partial": "⚠️",
+            "poor": "❌"
+        }.get(description_accuracy.lower(), "ℹ️")
+
+        embed.add_field(
+            name="📝 Description Used",
+            value=f"{accuracy_emoji} {description_accuracy.title() if description_accuracy else 'Yes'} match with image",
+            inline=True
+        )
+
+        embed.add_field(
+            name="💬 Your Description",
+            value=f"*{result.get('original_description', 'N/A')}*",
+            inline=False
+        )
+
+    _add_nutrition_field(embed, result.get('nutritional_info', {}))
+    _add_health_notes_field(embed, result.get('health_notes', ''))
+
+    # Enhanced footer with logging instructions
+    footer_text = f"Analyzed by {author_name}"
+    if result.get("user_description_used"):
+        footer_text += " • Enhanced with description"
+    footer_text += f" • {LOG_HINT} • {DISCLAIMER}"
+    embed.set_footer(text=footer_text)
+
+    # Add thumbnail with the analyzed image
+    embed.set_thumbnail(url=image_url)
+    return embed
+
+
+def build_estimate_embed(result: dict, description: str, author_name: str) -> discord.Embed:
+    """Result of a text-only estimation"""
+    confidence = result.get("confidence", 0)
+
+    # Color based on confidence
+    if confidence >= 75:
+        color = 0x00ff00  # Green
+        confidence_emoji = "✅"
+    elif confidence >= 50:
+        color = 0xffff00  # Yellow
+        confidence_emoji = "⚠️"
+    else:
+        color = 0xff9900  # Orange
+        confidence_emoji = "❓"
+
+    embed = discord.Embed(
+        title="📝 Text-based Calorie Estimation",
+        description=f"**{result['food_name']}**",
+        color=color
+    )
+
+    embed.add_field(
+        name="🔥 Estimated Calories",
+        value=f"**{result['calories']} kcal**",
+        inline=True
+    )
+
+    embed.add_field(
+        name=f"{confidence_emoji} Confidence",
+        value=f"{confidence}%",
+        inline=True
+    )
+
+    embed.add_field(
+        name="📏 Portion Summary",
+        value=result.get('portion_size', 'See description'),
+        inline=True
+    )
+
+    embed.add_field(
+        name="💭 Your Description",
+        value=f"*{description}*",
+        inline=False
+    )
+
+    # Add interpretation if available
+    interpretation = result.get('interpretation', '')
+    if interpretation:
+        embed.add_field(
+            name="🧠 AI Interpretation",
+            value=interpretation,
+            inline=False
+        )
+
+    _add_nutrition_field(embed, result.get('nutritional_info', {}))
+    _add_health_notes_field(embed, result.get('health_notes', ''))
+
+    embed.set_footer(text=f"Text-based analysis by {author_name} • {LOG_HINT} • For better accuracy, use {COMMAND_PREFIX}analyzefood with an image")
+    return embed
+
+
+def build_calories_added_embed(calories: int, food_name: str, total_today: int, user_name: str) -> discord.Embed:
+    """Confirmation after logging an analysis result"""
+    embed = discord.Embed(
+        title="✅ Calories Added!",
+        description=f"Added **{calories} kcal** for **{food_name}**",
+        color=0x00ff00
+    )
+    embed.add_field(
+        name="📊 Today's Total",
+        value=f"**{total_today} kcal**",
+        inline=True
+    )
+    embed.set_footer(text=f"Logged for {user_name}")
+    return embed
+
+
+LOGGED_FIELD_NAME = "✅ Logged"
+MAX_LOGGED_LINES = 10
+
+
+def _logged_line_prefix(user_name: str) -> str:
+    return f"**{user_name}** +"
+
+
+def logged_by(embed: discord.Embed, user_name: str) -> bool:
+    """Whether the result's ✅ Logged field has a line for this user"""
+    prefix = _logged_line_prefix(user_name)
+    return any(
+        line.startswith(prefix)
+        for field in embed.fields if field.name == LOGGED_FIELD_NAME
+        for line in field.value.split("\n")
+    )
+
+
+def add_logged_entry(embed: discord.Embed, user_name: str, calories: int, total_today: int) -> discord.Embed:
+    """Record on an analysis result that someone logged it, replacing a separate confirmation message"""
+    line = f"{_logged_line_prefix(user_name)}{calories} kcal • today {total_today} kcal"
+    for index, field in enumerate(embed.fields):
+        if field.name == LOGGED_FIELD_NAME:
+            lines = (field.value.split("\n") + [line])[-MAX_LOGGED_LINES:]
+            return embed.set_field_at(index, name=LOGGED_FIELD_NAME, value="\n".join(lines), inline=False)
+    return embed.add_field(name=LOGGED_FIELD_NAME, value=line, inline=False)
+
+
+def build_calories_declined_embed(user_name: str) -> discord.Embed:
+    embed = discord.Embed(
+        title="❌ Calories Not Added",
+        description="No worries! The analysis wasn't added to your daily total.",
+        color=0xff6b6b
+    )
+    embed.set_footer(text=f"Declined by {user_name}")
+    return embed
+
+
+def build_today_embed(display_name: str, daily_data) -> discord.Embed:
+    """Today's total and the last 10 entries"""
+    total_calories = daily_data.total_calories
+    foods = daily_data.foods
+
+    embed = discord.Embed(
+        title=f"📊 {display_name}'s Calories Today",
+        description=f"**Total: {total_calories} kcal**",
+        color=0x0099ff
+    )
+    _add_macros_field(embed, daily_data)
+
+    if foods:
+        food_list = []
+        # Show last 10 entries with numbers for easy reference
+        display_foods = foods[-10:]
+        start_index = max(0, len(foods) - 10)
+
+        for i, food in enumerate(display_foods, start=start_index + 1):
+            time_str = food.logged_at.strftime("%H:%M")
+            food_list.append(f"`{i}.` `{time_str}` **{food.name}** - {food.calories} kcal `#{food.id}`")
+
+        embed.add_field(
+            name="🍽️ Recent Foods",
+            value="\n".join(food_list),
+            inline=False
+        )
+
+        if len(foods) > 10:
+            embed.set_footer(text=f"Showing last 10 of {len(foods)} entries • Use !history for all entries • Use !remove <# or ID> to delete entries")
+        else:
+            embed.set_footer(text="Use !remove <# or ID> to delete entries • Use !history for detailed view")
+    else:
+        embed.add_field(
+            name="🍽️ No foods logged today",
+            value="Use `!addcalories` or analyze food images to start tracking!",
+            inline=False
+        )
+    return embed
+
+
+def build_history_embed(display_name: str, daily_data, day_label: str) -> discord.Embed:
+    """Every entry of one day, split over several fields if needed"""
+    total_calories = daily_data.total_calories
+    foods = daily_data.foods
+
+    embed = discord.Embed(
+        title=f"📈 {display_name}'s Full History {day_label}",
+        description=f"**Total: {total_calories} kcal**",
+        color=0x9932cc
+    )
+    _add_macros_field(embed, daily_data)
+
+    if foods:
+        # Group foods into chunks to avoid Discord message limits
+        food_chunks = []
+        current_chunk = []
+
+        for i, food in enumerate(foods, 1):
+            time_str = food.logged_at.strftime("%H:%M")
+            entry = f"`{i}.` `{time_str}` **{food.name}** - {food.calories} kcal `#{food.id}`"
+
+            # Check if adding this entry would exceed Discord's field limit
+            if len('\n'.join(current_chunk + [entry])) > 1000:
+                food_chunks.append(current_chunk)
+                current_chunk = [entry]
+            else:
+                current_chunk.append(entry)
+
+        if current_chunk:
+            food_chunks.append(current_chunk)
+
+        # Add fields for each chunk
+        for i, chunk in enumerate(food_chunks):
+            field_name = "🍽️ Foods" if i == 0 else f"🍽️ Foods (continued {i+1})"
+            embed.add_field(
+                name=field_name,
+                value="\n".join(chunk),
+                inline=False
+            )
+
+        embed.set_footer(text=f"Total: {len(foods)} entries • Use !remove <# or ID> to delete entries")
+    else:
+        embed.add_field(
+            name=f"🍽️ No foods logged {day_label.lower()}",
+            value="Use `!addcalories` or analyze food images to start tracking!",
+            inline=False
+        )
+    return embed
+
+
+def _goal_line(total_calories: int, goal: int) -> str:
+    if not goal:
+        return f"**{total_calories} kcal**"
+    if total_calories <= goal:
+        return f"**{total_calories} / {goal} kcal** • {goal - total_calories} kcal left"
+    return f"**{total_calories} / {goal} kcal** • {total_calories - goal} kcal over"
+
+
+def build_digest_embed(day: str, daily_data, goal: int = None) -> discord.Embed:
+    """End-of-day summary sent to a subscriber"""
+    embed = discord.Embed(
+        title=f"🌙 Your Day in Calories • {day}",
+        description=_goal_line(daily_data.total_calories, goal),
+        color=0x00ff00 if not goal or daily_data.total_calories <= goal else 0xff9900
+    )
+    top_foods = sorted(daily_data.foods, key=lambda food: food.calories, reverse=True)[:5]
+    embed.add_field(
+        name=f"🍽️ {len(daily_data.foods)} entries • biggest",
+        value="\n".join(f"**{food.name}** - {food.calories} kcal" for food in top_foods),
+        inline=False
+    )
+    embed.set_footer(text="Use !digest off to stop these summaries • !digest goal <kcal> to set a goal")
+    return embed
+
+
+def build_rollup_embed(guild_name: str, day: str, rows: list) -> discord.Embed:
+    """End-of-day roll-up of everyone in a server who opted in; rows are (user_id_str, settings, daily_data)"""
+    embed = discord.Embed(
+        title=f"🌙 {guild_name} • Daily Roll-up {day}",
+        description=f"{len(rows)} members logged food today",
+        color=0x9932cc
+    )
+    lines = [
+        f"<@{user_id_str}> {_goal_line(daily_data.total_calories, settings.get('goal'))}"
+        for user_id_str, settings, daily_data in sorted(rows, key=lambda row: row[2].total_calories, reverse=True)
+    ]
+    # Split over several fields to stay under Discord's field limit
+    chunk = []
+    for line in lines:
+        if len("\n".join(chunk + [line])) > 1000:
+            embed.add_field(name="📊 Totals" if not embed.fields else "📊 Totals (continued)", value="\n".join(chunk), inline=False)
+            chunk = []
+        chunk.append(line)
+        if len(embed.fields) >= 20:
+            break
+    if chunk and len(embed.fields) < 20:
+        embed.add_field(name="📊 Totals" if not embed.fields else "📊 Totals (continued)", value="\n".join(chunk), inline=False)
+    embed.set_footer(text="Use !digest here to join this roll-up • !digest off to leave")
+    return embed
+
+
+LEADERBOARD_TITLES = {
+    "streak": ("🔥", "Logging Streaks", "days in a row"),
+    "consistency": ("📅", "Consistency", "of the last 30 days"),
+    "goal": ("🎯", "Closest to Goal", "% on target this week")
+}
+
+
+def build_leaderboard_embed(guild_name: str, board: str, top: list, standing: tuple) -> discord.Embed:
+    """Top members of one leaderboard plus the caller's own position"""
+    emoji, title, unit = LEADERBOARD_TITLES[board]
+    embed = discord.Embed(title=f"{emoji} {guild_name} • {title}", color=0xffaa00)
+    medals = ["🥇", "🥈", "🥉"]
+    if top:
+        embed.description = "\n".join(
+            f"{medals[i] if i < len(medals) else f'`{i + 1}.`'} <@{user_id_str}> - **{score:g}** {unit}"
+            for i, (user_id_str, score) in enumerate(top)
+        )
+    else:
+        embed.description = "Nobody is ranked yet. Join with `!leaderboard join` and start logging!"
+
+    rank, score, ranked = standing
+    if rank:
+        embed.add_field(name="Your position", value=f"#{rank} of {ranked} • **{score:g}** {unit}", inline=False)
+    if board == "goal":
+        embed.set_footer(text="Set your goal with !digest goal <kcal> • Only members who ran !leaderboard join are ranked")
+    else:
+        embed.set_footer(text="Only members who ran !leaderboard join are ranked • !leaderboard streak|consistency|goal")
+    return embed
+
+
+def build_food_matches_embed(title: str, foods: list) -> discord.Embed:
+    """Foods from a user's history, for quick logging"""
+    embed = discord.Embed(
+        title=title,
+        description="\n".join(
+            f"`{i}.` **{food.name}** - {food.calories} kcal • logged {food.count}×"
+            for i, food in enumerate(foods, 1)
+        ),
+        color=0x0099ff
+    )
+    embed.set_footer(text="Click a button to log it again with the same calories")
+    return embed
+
+
+def build_month_embed(display_name: str, month: str, days: dict) -> discord.Embed:
+    """Totals for one month; days is {day: (total_calories, entry_count)}"""
+    embed = discord.Embed(title=f"🗓️ {display_name}'s Month • {month}", color=0x9932cc)
+    if not days:
+        embed.description = "No calories logged this month."
+        return embed
+
+    totals = [total for total, _ in days.values()]
+    embed.description = f"**{sum(totals)} kcal** over {len(days)} logged days • average **{sum(totals) // len(days)} kcal**"
+    highest = max(days, key=lambda day: days[day][0])
+    lowest = min(days, key=lambda day: days[day][0])
+    embed.add_field(name="⬆️ Highest", value=f"{highest}: {days[highest][0]} kcal", inline=True)
+    embed.add_field(name="⬇️ Lowest", value=f"{lowest}: {days[lowest][0]} kcal", inline=True)
+    embed.add_field(
+        name="📅 Days",
+        value="\n".join(f"`{day[8:]}` {total} kcal • {count} entries" for day, (total, count) in sorted(days.items()))[:1024],
+        inline=False
+    )
+    embed.set_footer(text="Use !history YYYY-MM-DD for a day's entries")
+    return embed
+
+
+def build_recipe_embed(recipe: dict, items: list, updated: list = None) -> discord.Embed:
+    """A recipe's ingredients and cached totals; items are (quantity, ingredient) pairs"""
+    per_serving = round(recipe["calories"] / recipe["servings"])
+    embed = discord.Embed(
+        title=f"🍲 {recipe['name']}",
+        description=f"**{recipe['calories']} kcal** in total • serves {recipe['servings']} • **{per_serving} kcal** per serving",
+        color=0x00ff00
+    )
+    embed.add_field(
+        name="🥕 Ingredients",
+        value="\n".join(
+            f"{quantity:g} × **{ingredient['name']}** - {round(quantity * ingredient['calories'])} kcal"
+            for quantity, ingredient in items
+        )[:1024],
+        inline=False
+    )
+    if updated:
+        embed.add_field(name="🔄 Also updated", value=", ".join(updated)[:1024], inline=False)
+    embed.set_footer(text=f"Log it with !eat {recipe['name']} [servings]")
+    return embed
+
+
+def build_recipe_list_embed(display_name: str, recipes: list) -> discord.Embed:
+    embed = discord.Embed(title=f"🍲 {display_name}'s Recipes", color=0x0099ff)
+    if recipes:
+        embed.description = "\n".join(
+            f"**{recipe['name']}** - {round(recipe['calories'] / recipe['servings'])} kcal per serving (serves {recipe['servings']})"
+            for recipe in recipes
+        )[:4096]
+    else:
+        embed.description = "No recipes yet. Add one with `!recipe add <name> [serves N]: <ingredients>`"
+    embed.set_footer(text="!recipe show <name> • !eat <name> [servings] • !recipe ingredient <name> <kcal>")
+    return embed
+
+
+def build_memory_embed(store: dict, caches: dict, allocations: dict = None) -> discord.Embed:
+    """!memsnap summary; store is diagnostics.store_stats, caches is {name: description}"""
+    embed = discord.Embed(title="🧠 Memory Snapshot", color=0x808080)
+    embed.add_field(
+        name="📒 user_calories",
+        value=(
+            f"{store['decoded_users']} of {store['users']} users in memory\n"
+            f"{store['days']} days • {store['entries']} entries\n"
+            f"≈ {format_bytes(store['estimated_bytes'])}"
+        ),
+        inline=False
+    )
+    embed.add_field(name="🗃️ Caches", value="\n".join(f"{name}: {value}" for name, value in caches.items()), inline=False)
+    if allocations:
+        top = "\n".join(f"`{format_bytes(size)}` {location}" for location, size, _ in allocations["top"][:5])
+        embed.add_field(
+            name=f"🔎 Traced: {format_bytes(allocations['current'])} (peak {format_bytes(allocations['peak'])})",
+            value=top[:1024] or "Nothing traced yet",
+            inline=False
+        )
+        embed.set_footer(text="Full list attached • !memsnap stop ends tracing")
+    else:
+        embed.set_footer(text="!memsnap start traces allocations from now on")
+    return embed
+
+
+def _usage_lines(rows: dict, budget: float) -> str:
+    """One line per period of a usage.UsageLedger row, then today's share of the budget"""
+    lines = [
+        f"**{label}:** {row[REQUESTS]} requests • {row[PROMPT_TOKENS] + row[OUTPUT_TOKENS]:,} tokens • ${row[COST]:.4f}"
+        for label, row in rows.items()
+    ]
+    if budget > 0:
+        today = next(iter(rows.values()))
+        lines.append(f"Daily budget: ${today[COST]:.4f} of ${budget:.2f} ({today[COST] / budget:.0%})")
+    return "\n".join(lines)
+
+
+def build_usage_embed(author_name: str, user_rows: dict, user_budget: float, mode: str,
+                      guild_name: str = None, guild_rows: dict = None, guild_budget: float = 0) -> discord.Embed:
+    """!usage report; rows are {period label: usage row}, today first"""
+    colors = {NORMAL: 0x00ff00, ECONOMY: 0xffff00, EXHAUSTED: 0xff0000}
+    embed = discord.Embed(title="💸 AI Usage", color=colors[mode])
+    embed.add_field(name=f"👤 {author_name}", value=_usage_lines(user_rows, user_budget), inline=False)
+    if guild_rows:
+        embed.add_field(name=f"🏠 {guild_name}", value=_usage_lines(guild_rows, guild_budget), inline=False)
+    if mode == ECONOMY:
+        embed.set_footer(text="Near today's budget: analyses use known foods, cached answers and smaller images first")
+    elif mode == EXHAUSTED:
+        embed.set_footer(text="Today's budget is used up: only free paths (known foods, cached answers, local model)")
+    else:
+        embed.set_footer(text="Tokens and cost of AI analyses, counted per day")
+    return embed
@@ -0,0 +1,181 @@
+import random
+import sys
+import time
+from datetime import datetime
+from nutrition import MACROS, macros_to_dict, macros_from_dict
+
+ENTRY_ID_ALPHABET = "0123456789abcdefghijklmnopqrstuvwxyz"
+ENTRY_ID_LENGTH = 6
+
+
+def new_entry_id() -> str:
+    """Short random base36 ID used to address a food entry"""
+    return "".join(random.choices(ENTRY_ID_ALPHABET, k=ENTRY_ID_LENGTH))
+
+
+class FoodEntry:
+    """
+    A single logged food. Timestamps are kept as int epoch seconds and food
+    names are interned, since the same meals are logged over and over.
+    Macros are grams in nutrition.MACROS order, or None if unknown.
+    """
+    __slots__ = ("id", "_name", "calories", "timestamp", "macros")
+
+    def __init__(self, entry_id: str, name: str, calories: int, timestamp: int = None, macros: tuple = None):
+        self.id = entry_id
+        self.name = name
+        self.calories = calories
+        self.timestamp = int(time.time()) if timestamp is None else timestamp
+        self.macros = macros
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @name.setter
+    def name(self, value: str):
+        self._name = sys.intern(value)
+
+    @property
+    def logged_at(self) -> datetime:
+        """Local time the entry was logged"""
+        return datetime.fromtimestamp(self.timestamp)
+
+    def to_dict(self) -> dict:
+        """Stored form, the original JSON layout plus macros when known"""
+        data = {
+            "id": self.id,
+            "name": self.name,
+            "calories": self.calories,
+            "timestamp": self.logged_at.isoformat()
+        }
+        if self.macros:
+            data["macros"] = macros_to_dict(self.macros)
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "FoodEntry":
+        """Build an entry from its stored form, assigning an ID if it predates IDs"""
+        timestamp = data.get("timestamp")
+        if isinstance(timestamp, str):
+            timestamp = int(datetime.fromisoformat(timestamp).timestamp())
+        return cls(data.get("id") or new_entry_id(), data["name"], data["calories"], timestamp, macros_from_dict(data.get("macros")))
+
+
+class DayLog:
+    """
+    All of a user's entries for one day plus running totals: calories, and
+    grams of each macro over the entries that have them. Entries should be
+    added and removed through add_food/remove_food to keep the sums in step.
+    """
+    __slots__ = ("total_calories", "foods", "macro_totals", "macro_entries")
+
+    def __init__(self, total_calories: int = 0, foods: list = None):
+        self.total_calories = total_calories
+        self.foods = [] if foods is None else foods
+        self.recount_macros()
+
+    def recount_macros(self):
+        """Recompute the macro sums from the entries (after replacing self.foods)"""
+        self.macro_totals = [0.0] * len(MACROS)
+        self.macro_entries = 0
+        for food in self.foods:
+            self._count_macros(food, 1)
+
+    def _count_macros(self, food: FoodEntry, sign: int):
+        if food.macros:
+            for i, grams in enumerate(food.macros):
+                self.macro_totals[i] += sign * grams
+            self.macro_entries += sign
+
+    def add_food(self, food: FoodEntry):
+        self.foods.append(food)
+        self.total_calories += food.calories
+        self._count_macros(food, 1)
+
+    def remove_food(self, food: FoodEntry):
+        self.foods.remove(food)
+        self.total_calories -= food.calories
+        self._count_macros(food, -1)
+
+    def update_food(self, food: FoodEntry, calories: int, macros: tuple):
+        """Change an entry's calories and macros in place"""
+        self._count_macros(food, -1)
+        self.total_calories += calories - food.calories
+        food.calories = calories
+        food.macros = macros
+        self._count_macros(food, 1)
+
+    @property
+    def macros(self) -> dict:
+        """Grams of each macro logged this day (rounded)"""
+        return {macro: round(grams, 1) for macro, grams in zip(MACROS, self.macro_totals)}
+
+    def to_dict(self) -> dict:
+        return {
+            "total_calories": self.total_calories,
+            "foods": [food.to_dict() for food in self.foods]
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DayLog":
+        return cls(data["total_calories"], [FoodEntry.from_dict(food) for food in data["foods"]])
+
+
+def user_data_to_dict(user_data: dict) -> dict:
+    """Serialize one user's {day: DayLog} mapping"""
+    return {day: day_log.to_dict() for day, day_log in user_data.items()}
+
+
+def user_data_from_dict(data: dict) -> dict:
+    """Deserialize one user's stored days into DayLog records"""
+    return {day: DayLog.from_dict(day_data) for day, day_data in data.items()}
+
+
+class EntryIndex:
+    """Maps each user's entry IDs to the day and entry they belong to"""
+
+    def __init__(self):
+        self._store = {}
+        # user_id_str -> {entry_id: (day, entry)}, filled in lazily per user
+        self._entries = {}
+
+    def attach(self, user_calories):
+        """Index a (new) store; each user is indexed on first lookup"""
+        self._store = user_calories
+        self._entries = {}
+
+    def index_user(self, user_id_str: str, user_data: dict):
+        """(Re)index all entries of one user"""
+        self._entries[user_id_str] = {
+            food.id: (day, food)
+            for day, day_log in user_data.items()
+            for food in day_log.foods
+        }
+
+    @property
+    def indexed_users(self) -> int:
+        return len(self._entries)
+
+    def _user_entries(self, user_id_str: str) -> dict:
+        if user_id_str not in self._entries:
+            self.index_user(user_id_str, self._store.get(user_id_str, {}))
+        return self._entries[user_id_str]
+
+    def new_id(self, user_id_str: str) -> str:
+        """Entry ID not yet used by this user"""
+        existing = self._user_entries(user_id_str)
+        entry_id = new_entry_id()
+        while entry_id in existing:
+            entry_id = new_entry_id()
+        return entry_id
+
+    def add(self, user_id_str: str, day: str, entry: FoodEntry):
+        self._user_entries(user_id_str)[entry.id] = (day, entry)
+
+    def discard(self, user_id_str: str, entry_id: str):
+        self._user_entries(user_id_str).pop(entry_id, None)
+
+    def get(self, user_id_str: str, entry_id: str):
+        """(day, entry) for an entry ID, or None"""
+        return self._user_entries(user_id_str).get(entry_id)
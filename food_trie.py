@@ -0,0 +1,119 @@
+from collections import OrderedDict
+
+
+class FoodStats:
+    """How often a user logged a food, and what it was last logged as"""
+    __slots__ = ("name", "calories", "count", "last_used", "macros")
+
+    def __init__(self, name: str, calories: int, last_used: int, macros: tuple = None):
+        self.name = name
+        self.calories = calories
+        self.count = 0
+        self.last_used = last_used
+        self.macros = macros
+
+
+class FoodTrie:
+    """
+    Prefix trie over one user's food names. Every word of a name is indexed,
+    so "chick" finds both "Chicken salad" and "Grilled chicken". Matches are
+    ranked by how often the food was logged, then by how recently.
+    """
+
+    def __init__(self):
+        self._root = {}
+        self._foods = {}  # lowercased name -> FoodStats
+
+    def record(self, name: str, calories: int, timestamp: int, macros: tuple = None):
+        """Count one logged entry (entries must be recorded oldest first)"""
+        key = name.strip().lower()
+        if not key:
+            return
+        stats = self._foods.get(key)
+        if stats is None:
+            stats = self._foods[key] = FoodStats(name, calories, timestamp, macros)
+            words = key.split()
+            for start in range(len(words)):
+                self._insert(" ".join(words[start:]), stats)
+        stats.name = name
+        stats.calories = calories
+        stats.macros = macros
+        stats.count += 1
+        stats.last_used = timestamp
+
+    def _insert(self, text: str, stats: FoodStats):
+        node = self._root
+        for char in text:
+            node = node.setdefault(char, {})
+        node.setdefault(None, []).append(stats)
+
+    def search(self, prefix: str, limit: int = 5) -> list:
+        """Best FoodStats whose name (or a word in it) starts with prefix"""
+        node = self._root
+        for char in prefix.strip().lower():
+            node = node.get(char)
+            if node is None:
+                return []
+        found = {}
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for char, child in node.items():
+                if char is None:
+                    for stats in child:
+                        found[id(stats)] = stats
+                else:
+                    stack.append(child)
+        return sorted(found.values(), key=lambda stats: (stats.count, stats.last_used), reverse=True)[:limit]
+
+    def favorites(self, limit: int = 10) -> list:
+        """The user's most logged foods"""
+        return sorted(self._foods.values(), key=lambda stats: (stats.count, stats.last_used), reverse=True)[:limit]
+
+    def exact(self, name: str):
+        return self._foods.get(name.strip().lower())
+
+    def __len__(self):
+        return len(self._foods)
+
+
+class FoodSuggestions:
+    """
+    Per-user food tries, built from a user's stored entries the first time
+    they are needed and updated as new entries are logged. Only the most
+    recently used max_users tries are kept in memory.
+    """
+
+    def __init__(self, user_data, max_users: int = 1000):
+        self._user_data = user_data  # user_id_str -> {day: DayLog} or None
+        self._tries = OrderedDict()
+        self.max_users = max_users
+
+    @property
+    def cached_users(self) -> int:
+        return len(self._tries)
+
+    def trie(self, user_id_str: str) -> FoodTrie:
+        trie = self._tries.get(user_id_str)
+        if trie is None:
+            trie = FoodTrie()
+            user_data = self._user_data(user_id_str) or {}
+            for day in sorted(user_data):
+                for food in user_data[day].foods:
+                    trie.record(food.name, food.calories, food.timestamp, food.macros)
+            self._tries[user_id_str] = trie
+            if len(self._tries) > self.max_users:
+                self._tries.popitem(last=False)
+        else:
+            self._tries.move_to_end(user_id_str)
+        return trie
+
+    def record(self, user_id_str: str, name: str, calories: int, timestamp: int, macros: tuple = None):
+        """A new entry was logged; users without a trie yet pick it up when it is built"""
+        trie = self._tries.get(user_id_str)
+        if trie is not None:
+            trie.record(name, calories, timestamp, macros)
+
+    def forget(self, user_id_str: str):
+        """Entries were edited or removed; rebuild this user's trie on next use"""
+        self._tries.pop(user_id_str, None)
@@ -0,0 +1,258 @@
+import asyncio
+import functools
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+API_KEY_HELP_URL = "https://aistudio.google.com/app/apikey"
+
+
+class GeminiError(Exception):
+    """Base class for classified Gemini API failures"""
+    retryable = False
+    user_message = "❌ Gemini API error"
+
+    def __init__(self, message: str = "", cause: Exception = None):
+        super().__init__(message or self.user_message)
+        self.cause = cause
+
+    def describe(self) -> str:
+        """Message suitable for showing to a Discord user"""
+        return self.user_message
+
+
+class InvalidAPIKeyError(GeminiError):
+    user_message = f"❌ Invalid Gemini API key. Please update your API key in the .env file.\n\n🔑 Get a new key at: {API_KEY_HELP_URL}"
+
+
+class PermissionDeniedError(GeminiError):
+    user_message = "❌ API access denied. Please check your Gemini API permissions and billing settings."
+
+
+class QuotaExceededError(GeminiError):
+    user_message = "❌ API quota exceeded. Please check your usage limits or upgrade your plan."
+
+
+class RateLimitedError(GeminiError):
+    retryable = True
+    user_message = "❌ Gemini is rate limiting requests right now. Please try again in a minute."
+
+
+class TransientError(GeminiError):
+    retryable = True
+    user_message = "❌ Gemini is temporarily unavailable. Please try again shortly."
+
+
+class DeadlineExceededError(GeminiError):
+    user_message = "⏰ Gemini took too long to respond. Please try again."
+
+
+class CircuitOpenError(GeminiError):
+    user_message = "🚧 Gemini is currently unavailable. Requests are paused for a short while, please try again soon."
+
+
+class UnknownGeminiError(GeminiError):
+    def describe(self) -> str:
+        return f"❌ Gemini API error: {self}"
+
+
+def classify_error(error: Exception) -> GeminiError:
+    """Map a raw exception from the Gemini SDK onto a GeminiError subclass"""
+    if isinstance(error, GeminiError):
+        return error
+
+    message = str(error)
+    # google.api_core exceptions carry the HTTP status in ``code``
+    code = getattr(error, "code", None)
+    if not isinstance(code, int):
+        code = None
+
+    if "API_KEY_INVALID" in message or "API key not valid" in message:
+        return InvalidAPIKeyError(message, error)
+    if "QUOTA_EXCEEDED" in message:
+        return QuotaExceededError(message, error)
+    if "PERMISSION_DENIED" in message or code in (401, 403):
+        return PermissionDeniedError(message, error)
+    if code == 429 or "RESOURCE_EXHAUSTED" in message:
+        return RateLimitedError(message, error)
+    if code == 504 or "DEADLINE_EXCEEDED" in message:
+        return TransientError(message, error)
+    if (code is not None and code >= 500) or "UNAVAILABLE" in message or "INTERNAL" in message:
+        return TransientError(message, error)
+    if isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return TransientError(message, error)
+    return UnknownGeminiError(message, error)
+
+
+class CircuitBreaker:
+    """Fails fast after repeated transient failures until a cool-down has passed"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._failures = 0
+        self._opened_at = 0.0
+        self._state = self.CLOSED
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+        return self._state
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now (only one probe while half-open)"""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self._failures = 0
+        self._probe_in_flight = False
+        self._state = self.CLOSED
+
+    def record_failure(self):
+        self._probe_in_flight = False
+        self._failures += 1
+        if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self._state != self.OPEN:
+                logger.warning(f"Gemini circuit breaker opened after {self._failures} failures")
+            self._state = self.OPEN
+            self._opened_at = self._clock()
+
+    def release(self):
+        """Give back a half-open probe slot without recording an outcome"""
+        self._probe_in_flight = False
+
+
+class ResilientGeminiClient:
+    """
+    Wraps a blocking ``GenerativeModel`` with classified errors, retries with
+    jittered exponential backoff, a circuit breaker, per-call deadlines and
+    optional hedged requests.
+    """
+
+    def __init__(self, model, *, max_retries: int = 3, base_delay: float = 0.5, max_delay: float = 8.0,
+                 deadline: float = 30.0, hedge_delay: float = None, breaker: CircuitBreaker = None):
+        self.model = model
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.hedge_delay = hedge_delay
+        self.breaker = breaker or CircuitBreaker()
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given retry attempt (0-based)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def generate_content(self, contents, *, deadline: float = None, hedge: bool = None):
+        """
+        Call ``model.generate_content`` without blocking the event loop
+
+        Args:
+            contents: Prompt or list of prompt parts passed through to the model
+            deadline: Overall time budget in seconds, including retries
+            hedge: Send a second request if the first is slower than ``hedge_delay``
+
+        Returns:
+            The raw model response
+
+        Raises:
+            GeminiError: A classified failure once retries are exhausted
+        """
+        deadline = self.deadline if deadline is None else deadline
+        hedge = self.hedge_delay is not None if hedge is None else hedge
+        expires_at = time.monotonic() + deadline
+        attempt = 0
+
+        # The breaker is asked once per call and hears one outcome per call,
+        # so the retries of a single call don't add up to opening it
+        if not self.breaker.allow():
+            raise CircuitOpenError()
+
+        while True:
+            remaining = expires_at - time.monotonic()
+            if remaining <= 0:
+                self.breaker.record_failure()
+                raise DeadlineExceededError()
+
+            if hedge and self.hedge_delay is not None:
+                call = asyncio.ensure_future(self._hedged_call(contents))
+            else:
+                call = asyncio.ensure_future(self._call(contents))
+            try:
+                # Only running out of time here is the deadline; a TimeoutError
+                # raised by the backend itself comes out of call.result() below
+                done, _ = await asyncio.wait({call}, timeout=remaining)
+            except asyncio.CancelledError:
+                call.cancel()
+                self.breaker.release()
+                raise
+            if not done:
+                call.cancel()
+                self.breaker.record_failure()
+                raise DeadlineExceededError()
+
+            try:
+                response = call.result()
+            except Exception as e:
+                error = classify_error(e)
+                if not error.retryable:
+                    self.breaker.release()
+                    raise error from e
+
+                delay = self.backoff_delay(attempt)
+                if attempt >= self.max_retries or time.monotonic() + delay >= expires_at or self.breaker.state == self.breaker.OPEN:
+                    self.breaker.record_failure()
+                    raise error from e
+                logger.warning(f"Gemini call failed ({type(error).__name__}), retrying in {delay:.2f}s")
+                attempt += 1
+                try:
+                    await asyncio.sleep(delay)
+                except asyncio.CancelledError:
+                    self.breaker.release()
+                    raise
+                continue
+
+            self.breaker.record_success()
+            return response
+
+    async def _call(self, contents):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(self.model.generate_content, contents))
+
+    async def _hedged_call(self, contents):
+        """Start a backup request if the primary has not answered within ``hedge_delay``"""
+        primary = asyncio.ensure_future(self._call(contents))
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_delay)
+        if done:
+            return primary.result()
+
+        logger.info(f"Gemini call slower than {self.hedge_delay}s, sending hedged request")
+        backup = asyncio.ensure_future(self._call(contents))
+        pending = {primary, backup}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
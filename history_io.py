@@ -0,0 +1,179 @@
+import csv
+import io
+import json
+from datetime import date, datetime, timedelta
+from entries import ENTRY_ID_LENGTH
+from nutrition import MACROS, parse_amount
+
+FORMATS = ("csv", "jsonl")
+FIELDS = ["date", "time", "id", "food", "calories", *MACROS, "timestamp"]
+
+MAX_FOOD_NAME_LENGTH = 200
+MAX_ENTRY_CALORIES = 20000
+MAX_ENTRY_ID_LENGTH = 32
+
+
+class ImportRowError(ValueError):
+    """A row of an import file that cannot be used"""
+
+
+def parse_day_range(text: str, today: date):
+    """
+    (start, end) days, inclusive, for an export range; None means unbounded.
+    Accepts: all, 7d (last 7 days), 2025-06 (a month), 2025-06-04 (one day),
+    2025-06-01..2025-06-30
+    """
+    text = (text or "all").lower()
+    if text == "all":
+        return None, None
+    if text.endswith("d") and text[:-1].isdigit() and int(text[:-1]) > 0:
+        return today - timedelta(days=int(text[:-1]) - 1), today
+    if ".." in text:
+        start, end = text.split("..", 1)
+        start = date.fromisoformat(start) if start else None
+        end = date.fromisoformat(end) if end else None
+        if start and end and start > end:
+            raise ValueError("range starts after it ends")
+        return start, end
+    if len(text) == 7:  # YYYY-MM
+        start = date.fromisoformat(f"{text}-01")
+        end = (start.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+        return start, end
+    day = date.fromisoformat(text)
+    return day, day
+
+
+def iter_entries(days):
+    """(day, FoodEntry) for every entry of a stream of (day, DayLog) pairs"""
+    for day, day_log in days:
+        for entry in day_log.foods:
+            yield day, entry
+
+
+def entry_record(day: str, entry) -> dict:
+    """One export row; macro columns are empty (null) when the entry has none"""
+    logged_at = entry.logged_at
+    record = {
+        "date": day,
+        "time": logged_at.strftime("%H:%M"),
+        "id": entry.id,
+        "food": entry.name,
+        "calories": entry.calories
+    }
+    for macro, grams in zip(MACROS, entry.macros or (None,) * len(MACROS)):
+        record[macro] = grams
+    record["timestamp"] = logged_at.isoformat()
+    return record
+
+
+class _TextToBinary:
+    """Lets csv/json write text straight into a binary file, one row at a time"""
+
+    def __init__(self, binary_file):
+        self.binary_file = binary_file
+
+    def write(self, text: str):
+        return self.binary_file.write(text.encode("utf-8"))
+
+
+def write_entries(entries, binary_file, file_format: str) -> int:
+    """Stream (day, entry) pairs into a binary file as CSV or JSONL, returning the row count"""
+    out = _TextToBinary(binary_file)
+    count = 0
+    if file_format == "csv":
+        writer = csv.DictWriter(out, fieldnames=FIELDS)
+        writer.writeheader()
+        for day, entry in entries:
+            writer.writerow(entry_record(day, entry))
+            count += 1
+    else:
+        for day, entry in entries:
+            out.write(json.dumps(entry_record(day, entry)) + "\n")
+            count += 1
+    return count
+
+
+def read_records(binary_file, file_format: str):
+    """(line number, dict or ImportRowError) for each row, read one line at a time"""
+    text = io.TextIOWrapper(binary_file, encoding="utf-8-sig", newline="")
+    if file_format == "csv":
+        for line_number, row in enumerate(csv.DictReader(text), start=2):
+            yield line_number, row
+    else:
+        for line_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                yield line_number, ImportRowError("not valid JSON")
+                continue
+            yield line_number, record if isinstance(record, dict) else ImportRowError("not a JSON object")
+
+
+def validate_record(record: dict):
+    """(day, food name, calories, epoch timestamp, entry ID or None, macros or None) from an import row"""
+    food = str(record.get("food") or "").strip()
+    if not food:
+        raise ImportRowError("missing food name")
+    if len(food) > MAX_FOOD_NAME_LENGTH:
+        raise ImportRowError(f"food name longer than {MAX_FOOD_NAME_LENGTH} characters")
+
+    try:
+        calories = int(float(record.get("calories")))
+    except (TypeError, ValueError, OverflowError):
+        raise ImportRowError("calories must be a number")
+    if not 0 < calories <= MAX_ENTRY_CALORIES:
+        raise ImportRowError(f"calories must be between 1 and {MAX_ENTRY_CALORIES}")
+
+    try:
+        if record.get("timestamp"):
+            logged_at = datetime.fromisoformat(str(record["timestamp"]))
+            day = str(record.get("date") or logged_at.date().isoformat())
+            date.fromisoformat(day)
+        elif record.get("date"):
+            day = date.fromisoformat(str(record["date"])).isoformat()
+            logged_at = datetime.fromisoformat(f"{day}T{record.get('time') or '12:00'}")
+        else:
+            raise ImportRowError("missing date or timestamp")
+        # Out-of-range dates (e.g. year 9999 with a UTC offset) overflow here, or once shown in local time
+        timestamp = int(logged_at.timestamp())
+        datetime.fromtimestamp(timestamp)
+    except (ValueError, OverflowError, OSError) as e:
+        if isinstance(e, ImportRowError):
+            raise
+        raise ImportRowError("invalid date, time or timestamp")
+
+    # Keep IDs from our own exports so re-importing a file is a no-op; short
+    # numeric IDs would read as entry numbers in !remove and !edit, so those get new ones
+    entry_id = str(record.get("id") or "").strip().lower()
+    if not (entry_id.isalnum() and len(entry_id) <= MAX_ENTRY_ID_LENGTH):
+        entry_id = None
+    elif entry_id.isdigit() and len(entry_id) < ENTRY_ID_LENGTH:
+        entry_id = None
+
+    grams = [parse_amount(record.get(macro)) for macro in MACROS]
+    macros = tuple(amount or 0.0 for amount in grams) if any(amount is not None for amount in grams) else None
+    return day, food, calories, timestamp, entry_id, macros
+
+
+def validated_batches(binary_file, file_format: str, batch_size: int):
+    """
+    Read and validate an import file, yielding (rows, rejected) for every
+    batch_size valid rows: rows as returned by validate_record, rejected the
+    (line number, reason) of rows skipped since the previous batch. Errors
+    that stop the reading (UnicodeDecodeError, csv.Error) are raised.
+    """
+    rows, rejected = [], []
+    for line_number, record in read_records(binary_file, file_format):
+        try:
+            if isinstance(record, ImportRowError):
+                raise record
+            rows.append(validate_record(record))
+        except ImportRowError as e:
+            rejected.append((line_number, str(e)))
+        if len(rows) >= batch_size or len(rejected) >= batch_size:
+            yield rows, rejected
+            rows, rejected = [], []
+    if rows or rejected:
+        yield rows, rejected
@@ -1,45 +1,431 @@
-import google.generativeai as genai
+import aiohttp
+import asyncio
 import io
-import requests
-from PIL import Image
+import json
 import logging
-from config import GEMINI_API_KEY
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from config import (
+    GEMINI_API_KEY, GEMINI_MODEL, GEMINI_MAX_RETRIES, GEMINI_DEADLINE_SECONDS, GEMINI_HEDGE_DELAY,
+    GEMINI_BREAKER_THRESHOLD, GEMINI_BREAKER_RESET_SECONDS, IMAGE_PROCESS_WORKERS,
+    LOCAL_MODEL_URL, LOCAL_MODEL_NAME, LOCAL_MODEL_API_KEY, LOCAL_MODEL_VISION, MODEL_BACKEND, MODEL_ROUTES,
+    MODEL_RECORD_PATH, MODEL_REPLAY_PATH, MODEL_REPLAY_LATENCY, ECONOMY_IMAGE_SIZE, ADAPTIVE_IMAGE_SIZE,
+    ADAPTIVE_MIN_CONFIDENCE
+)
+from nutrition import parse_macros
+from gemini_client import ResilientGeminiClient, CircuitBreaker, GeminiError, InvalidAPIKeyError, API_KEY_HELP_URL
+from model_backends import ModelRouter, LocalModelBackend, GEMINI, LOCAL
+from model_replay import ResponseRecorder, ReplayBackend, REPLAY
+from usage import NORMAL, EXHAUSTED
 
 logger = logging.getLogger(__name__)
 
-# Configure Gemini API
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-    model = genai.GenerativeModel('gemini-1.5-flash')
+# The Gemini SDK takes most of a second to import, so it is loaded by warm_up()
+# once the bot is connected (or by the first analysis, whichever comes first)
+model = None
+gemini_client = None
+_configure_lock = threading.Lock()
+_warm_up = None
+
+def _resilient(model) -> ResilientGeminiClient:
+    return ResilientGeminiClient(
+        model,
+        max_retries=GEMINI_MAX_RETRIES,
+        deadline=GEMINI_DEADLINE_SECONDS,
+        hedge_delay=GEMINI_HEDGE_DELAY,
+        breaker=CircuitBreaker(GEMINI_BREAKER_THRESHOLD, GEMINI_BREAKER_RESET_SECONDS)
+    )
+
+# Every request goes through the router, which picks Gemini or the local model per kind of request,
+# or answers everything from a recorded corpus in replay mode
+if MODEL_REPLAY_PATH:
+    model_router = ModelRouter(REPLAY)
+    model_router.add(REPLAY, ReplayBackend(MODEL_REPLAY_PATH, MODEL_REPLAY_LATENCY))
 else:
-    model = None
+    model_router = ModelRouter(MODEL_BACKEND, MODEL_ROUTES, recorder=ResponseRecorder(MODEL_RECORD_PATH) if MODEL_RECORD_PATH else None)
+if LOCAL_MODEL_URL and not MODEL_REPLAY_PATH:
+    model_router.add(
+        LOCAL,
+        _resilient(LocalModelBackend(LOCAL_MODEL_URL, LOCAL_MODEL_NAME, LOCAL_MODEL_API_KEY, timeout=GEMINI_DEADLINE_SECONDS)),
+        vision=LOCAL_MODEL_VISION
+    )
+
+def _configure_model():
+    """Import the Gemini SDK and create the model (runs in a thread)"""
+    global model, gemini_client
+    with _configure_lock:
+        if model is not None:
+            return
+        try:
+            import google.generativeai as genai
+            genai.configure(api_key=GEMINI_API_KEY)
+            configured = genai.GenerativeModel(GEMINI_MODEL)
+        except Exception as e:
+            logger.error(f"Could not set up Gemini: {e}")
+            return
+        gemini_client = _resilient(configured)
+        model_router.add(GEMINI, gemini_client)
+        model = configured
+
+def warm_up():
+    """Start setting up Gemini in a thread, returning an awaitable for it (None without an API key)"""
+    global _warm_up
+    if _warm_up is None and GEMINI_API_KEY and not MODEL_REPLAY_PATH:
+        _warm_up = asyncio.get_running_loop().run_in_executor(None, _configure_model)
+    return _warm_up
+
+async def _get_router() -> ModelRouter:
+    """The model router, waiting for the Gemini warm-up if it is still running (falsy with no backend)"""
+    if model is None and GEMINI_API_KEY and not MODEL_REPLAY_PATH:
+        await warm_up()
+    return model_router
+
+# Image decoding is CPU-bound, so it runs in a process pool created on first use
+_image_pool = None
+
+def _jpeg_blob(image) -> dict:
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return {"mime_type": "image/jpeg", "data": buffer.getvalue()}
+
+def _prepare_image(image_bytes: bytes, max_size: int = None) -> dict:
+    """Decode an uploaded image, shrink it to max_size pixels on its longest side if given, and re-encode it as JPEG (runs in a worker process)"""
+    from PIL import Image
+    image = Image.open(io.BytesIO(image_bytes))
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    if max_size:
+        image.thumbnail((max_size, max_size))
+    return _jpeg_blob(image)
+
+def _prepare_image_tiers(image_bytes: bytes, thumbnail_size: int) -> tuple:
+    """(thumbnail, full image) from one decode; thumbnail is None if the image is no bigger than thumbnail_size (worker process)"""
+    from PIL import Image
+    image = Image.open(io.BytesIO(image_bytes))
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    full = _jpeg_blob(image)
+    if max(image.size) <= thumbnail_size:
+        return None, full
+    image.thumbnail((thumbnail_size, thumbnail_size))
+    return _jpeg_blob(image), full
+
+def _get_image_pool():
+    global _image_pool
+    if _image_pool is None and IMAGE_PROCESS_WORKERS > 0:
+        _image_pool = ProcessPoolExecutor(max_workers=IMAGE_PROCESS_WORKERS)
+    return _image_pool
+
+def shutdown_image_pool():
+    """Stop the image worker processes (at shutdown, once no analysis is running)"""
+    global _image_pool
+    if _image_pool is not None:
+        _image_pool.shutdown(wait=False, cancel_futures=True)
+        _image_pool = None
+
+def close_recording():
+    """Write the last recorded model answers (at shutdown); an awaitable, or None when not recording"""
+    if model_router.recorder is not None:
+        return asyncio.get_running_loop().run_in_executor(None, model_router.recorder.close)
+
+async def prepare_image(image_bytes: bytes, max_size: int = None) -> dict:
+    """Decode an image off the event loop, returning a blob Gemini accepts directly"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_image_pool(), _prepare_image, image_bytes, max_size)
+
+async def prepare_image_tiers(image_bytes: bytes, thumbnail_size: int) -> tuple:
+    """Decode an image off the event loop into (thumbnail or None, full image) blobs"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_image_pool(), _prepare_image_tiers, image_bytes, thumbnail_size)
+
+# Cheaper paths taken when a user or guild is close to its daily budget (see usage.py)
+BUDGET_EXHAUSTED_MESSAGE = "❌ Today's AI budget is used up. Try again tomorrow, or log food with `!add` or `!quick`."
+FREE_BACKENDS = (LOCAL, REPLAY)  # Backends that cost nothing per request
+ESTIMATE_CACHE_SIZE = 1000
 
-async def analyze_food_image(image_url: str) -> dict:
+# Estimates by normalized description, served instead of asking the model again under a budget
+_estimate_cache = OrderedDict()
+
+def _budget_backend(kind: str, images: bool, budget: str):
+    """A free backend for the request when over budget (None routes it as usual)"""
+    if budget == NORMAL:
+        return None
+    for name in FREE_BACKENDS:
+        chosen = model_router.choose(kind, images, name)
+        if chosen and chosen[0] == name:
+            return name
+    return None
+
+def _usage(backend: str, response) -> dict:
+    """Token counts of an answer, as recorded by usage.UsageLedger"""
+    metadata = getattr(response, "usage_metadata", None)
+    return {
+        "backend": backend,
+        "prompt_tokens": getattr(metadata, "prompt_token_count", 0) or 0,
+        "output_tokens": getattr(metadata, "candidates_token_count", 0) or 0
+    }
+
+def _budget_exhausted() -> dict:
+    return {
+        "error": BUDGET_EXHAUSTED_MESSAGE,
+        "calories": 0,
+        "food_name": "Unknown",
+        "confidence": 0,
+        "nutritional_info": {}
+    }
+
+class ResolutionStats:
+    """How many image analyses a thumbnail answered, and the bytes and model time that saved"""
+
+    def __init__(self):
+        self.thumbnail_answers = 0
+        self.full_answers = 0  # The thumbnail answer was unsure, so the full image was sent too
+        self.failed_escalations = 0  # The full image was sent too but its request failed; the thumbnail answer stood
+        self.bytes_saved = 0
+        self._thumbnail_seconds = 0.0  # Spent on thumbnails that answered
+        self._wasted_seconds = 0.0  # Spent on thumbnails that didn't
+        self._full_seconds = 0.0
+
+    def record_thumbnail(self, thumbnail_bytes: int, full_bytes: int, seconds: float):
+        self.thumbnail_answers += 1
+        self.bytes_saved += full_bytes - thumbnail_bytes
+        self._thumbnail_seconds += seconds
+
+    def record_full(self, thumbnail_bytes: int, thumbnail_seconds: float, full_seconds: float):
+        self.full_answers += 1
+        self.bytes_saved -= thumbnail_bytes
+        self._wasted_seconds += thumbnail_seconds
+        self._full_seconds += full_seconds
+
+    def record_failed_escalation(self, thumbnail_bytes: int, thumbnail_seconds: float):
+        # The failed full request would have been made without a thumbnail too, only the thumbnail was extra
+        self.failed_escalations += 1
+        self.bytes_saved -= thumbnail_bytes
+        self._wasted_seconds += thumbnail_seconds
+
+    def summary(self) -> dict:
+        """Share answered from a thumbnail, bytes saved, and model seconds saved (None until a full image was timed)"""
+        total = self.thumbnail_answers + self.full_answers + self.failed_escalations
+        seconds_saved = None
+        if self.full_answers:
+            full_average = self._full_seconds / self.full_answers
+            seconds_saved = self.thumbnail_answers * full_average - self._thumbnail_seconds - self._wasted_seconds
+        return {
+            "requests": total,
+            "thumbnail_share": self.thumbnail_answers / total if total else 0,
+            "failed_escalations": self.failed_escalations,
+            "bytes_saved": self.bytes_saved,
+            "seconds_saved": seconds_saved
+        }
+
+image_resolution = ResolutionStats()
+
+def _needs_full_image(result: dict) -> str:
+    """Why a thumbnail answer isn't good enough, or "" if it is"""
+    if result.get("error"):
+        return "unreadable answer"
+    try:
+        confidence = float(result.get("confidence", 0))
+    except (TypeError, ValueError):
+        confidence = 0
+    if confidence < ADAPTIVE_MIN_CONFIDENCE:
+        return f"confidence {confidence:g}"
+    accuracy = str(result.get("description_accuracy") or "").strip().lower()
+    if accuracy and not accuracy.startswith("good"):
+        return f"description match {accuracy}"
+    return ""
+
+async def _ask_about_image(kind: str, prompt: str, image_bytes: bytes, parse, backend: str = None,
+                           budget: str = NORMAL) -> dict:
+    """
+    Ask the model about an image and parse the answer. Normally a thumbnail
+    goes first and the full image only follows when that answer is unsure;
+    under a budget only the small image is sent. Raises GeminiError.
+    """
+    if budget != NORMAL or not ADAPTIVE_IMAGE_SIZE:
+        thumbnail, full = None, await prepare_image(image_bytes, ECONOMY_IMAGE_SIZE if budget != NORMAL else None)
+    else:
+        thumbnail, full = await prepare_image_tiers(image_bytes, ADAPTIVE_IMAGE_SIZE)
+    if thumbnail is None:  # One image only: under a budget, not adaptive, or already small
+        backend, response = await model_router.generate(kind, [prompt, full], backend)
+        result = parse(response.text.strip())
+        result["usage"] = _usage(backend, response)
+        return result
+
+    started = time.monotonic()
+    backend, response = await model_router.generate(kind, [prompt, thumbnail], backend)
+    thumbnail_seconds = time.monotonic() - started
+    result = parse(response.text.strip())
+    usage = _usage(backend, response)
+    reason = _needs_full_image(result)
+    if not reason:
+        image_resolution.record_thumbnail(len(thumbnail["data"]), len(full["data"]), thumbnail_seconds)
+        result["usage"] = usage
+        return result
+
+    logger.info(f"Thumbnail answer for {kind} unsure ({reason}), sending the full image")
+    started = time.monotonic()
+    try:
+        # Same backend, so the second answer is comparable to the first
+        backend, response = await model_router.generate(kind, [prompt, full], backend)
+    except GeminiError as e:
+        logger.warning(f"Full image request failed ({type(e).__name__}), keeping the thumbnail answer")
+        image_resolution.record_failed_escalation(len(thumbnail["data"]), thumbnail_seconds)
+        result["usage"] = usage
+        return result
+    image_resolution.record_full(len(thumbnail["data"]), thumbnail_seconds, time.monotonic() - started)
+    full_usage = _usage(backend, response)
+    result = parse(response.text.strip())
+    result["usage"] = {
+        "backend": backend,
+        "prompt_tokens": usage["prompt_tokens"] + full_usage["prompt_tokens"],
+        "output_tokens": usage["output_tokens"] + full_usage["output_tokens"]
+    }
+    return result
+
+IMAGE_DOWNLOAD_TIMEOUT = 10
+
+async def download_image(image_url: str) -> bytes:
+    """Fetch an attachment without blocking the event loop"""
+    timeout = aiohttp.ClientTimeout(total=IMAGE_DOWNLOAD_TIMEOUT)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        async with session.get(image_url) as response:
+            response.raise_for_status()
+            return await response.read()
+
+def _extract_json(response_text: str) -> dict:
+    """The JSON object in a model answer, which is sometimes wrapped in markdown (raises JSONDecodeError)"""
+    if "```json" in response_text:
+        json_start = response_text.find("```json") + 7
+        json_end = response_text.find("```", json_start)
+        json_text = response_text[json_start:json_end].strip()
+    elif "{" in response_text and "}" in response_text:
+        json_start = response_text.find("{")
+        json_end = response_text.rfind("}") + 1
+        json_text = response_text[json_start:json_end]
+    else:
+        json_text = response_text
+    return json.loads(json_text)
+
+def _calories_from_text(response_text: str) -> dict:
+    """Best-effort result from an answer that isn't valid JSON"""
+    logger.warning(f"Could not parse JSON from Gemini response: {response_text}")
+    calorie_match = re.search(r'(\d+)\s*calorie', response_text.lower())
+    return {
+        "calories": int(calorie_match.group(1)) if calorie_match else 0,
+        "food_name": "Food item (analysis incomplete)",
+        "confidence": 30,
+        "portion_size": "Unknown",
+        "nutritional_info": {},
+        "health_notes": response_text[:200] + "..." if len(response_text) > 200 else response_text,
+        "error": "Could not parse detailed analysis"
+    }
+
+def parse_image_analysis(response_text: str) -> dict:
+    """Result dict from the model's answer to the image prompt"""
+    try:
+        result = _extract_json(response_text)
+    except json.JSONDecodeError:
+        return _calories_from_text(response_text)
+    return {
+        "calories": result.get("estimated_calories", 0),
+        "food_name": result.get("food_name", "Unknown food"),
+        "confidence": result.get("confidence", 50),
+        "portion_size": result.get("portion_size", "Unknown portion"),
+        "nutritional_info": result.get("nutritional_info", {}),
+        "macros": parse_macros(result.get("nutritional_info", {})),  # Grams, parsed once
+        "health_notes": result.get("health_notes", ""),
+        "error": None
+    }
+
+def parse_described_analysis(response_text: str, description: str = None) -> dict:
+    """Result dict from the model's answer to the image-and-description prompt"""
+    try:
+        result = _extract_json(response_text)
+    except json.JSONDecodeError:
+        fallback = _calories_from_text(response_text)
+        fallback.update({
+            "user_description_used": bool(description),
+            "description_accuracy": "",
+            "original_description": description if description else ""
+        })
+        return fallback
+    return {
+        "calories": result.get("estimated_calories", 0),
+        "food_name": result.get("food_name", "Unknown food"),
+        "confidence": result.get("confidence", 50),
+        "portion_size": result.get("portion_size", "Unknown portion"),
+        "nutritional_info": result.get("nutritional_info", {}),
+        "macros": parse_macros(result.get("nutritional_info", {})),  # Grams, parsed once
+        "health_notes": result.get("health_notes", ""),
+        "user_description_used": result.get("user_description_used", False),
+        "description_accuracy": result.get("description_accuracy", ""),
+        "original_description": description if description else "",
+        "error": None
+    }
+
+def parse_estimate(response_text: str) -> dict:
+    """Result dict from the model's answer to the text-only prompt"""
+    try:
+        result = _extract_json(response_text)
+    except json.JSONDecodeError:
+        logger.warning(f"Could not parse JSON from Gemini response: {response_text}")
+        return {
+            "error": "Could not parse the analysis results. Please try rephrasing your description.",
+            "calories": 0,
+            "food_name": "Unknown",
+            "confidence": 0,
+            "nutritional_info": {}
+        }
+    return {
+        "calories": result.get("estimated_calories", 0),
+        "food_name": result.get("food_name", "Unknown food"),
+        "confidence": result.get("confidence", 0),
+        "portion_size": result.get("portion_size", "See description"),
+        "nutritional_info": result.get("nutritional_info", {}),
+        "macros": parse_macros(result.get("nutritional_info", {})),  # Grams, parsed once
+        "health_notes": result.get("health_notes", ""),
+        "interpretation": result.get("interpretation", ""),
+        "error": None
+    }
+
+# Parser for each kind of model request, e.g. for replaying a recorded corpus
+PARSERS = {
+    "image": parse_image_analysis,
+    "describe": parse_described_analysis,
+    "estimate": parse_estimate
+}
+
+async def analyze_food_image(image_url: str, budget: str = NORMAL) -> dict:
     """
     Analyze a food image and return calorie estimation and nutritional info
     
     Args:
         image_url: URL of the image to analyze
+        budget: usage.NORMAL, or ECONOMY/EXHAUSTED to take cheaper paths (local model, smaller image)
         
     Returns:
         dict: Contains calories, food_name, confidence, and nutritional_info
     """
-    if not model:
+    if not await _get_router():
         return {
-            "error": "Image analysis is not available. Gemini API key not configured.",
+            "error": "Image analysis is not available. No AI model configured.",
             "calories": 0,
             "food_name": "Unknown",
             "confidence": 0,
             "nutritional_info": {}
         }
     
+    backend = _budget_backend("image", True, budget)
+    if budget == EXHAUSTED and backend is None:
+        return _budget_exhausted()
+    
     try:
         # Download the image
-        response = requests.get(image_url, timeout=10)
-        response.raise_for_status()
-        
-        # Open and process the image
-        image = Image.open(io.BytesIO(response.content))
+        image_bytes = await download_image(image_url)
         
         # Create a detailed prompt for food analysis
         prompt = """
@@ -69,96 +455,19 @@ async def analyze_food_image(image_url: str) -> dict:
         """
           # Generate content using Gemini
         try:
-            response = model.generate_content([prompt, image])
-            response_text = response.text.strip()
-        except Exception as gemini_error:
-            error_msg = str(gemini_error)
-            logger.error(f"Gemini API error: {error_msg}")
-            
-            # Check for specific API key errors
-            if "API_KEY_INVALID" in error_msg or "API key not valid" in error_msg:
-                return {
-                    "error": "❌ Invalid Gemini API key. Please update your API key in the .env file.\n\n🔑 Get a new key at: https://aistudio.google.com/app/apikey",
-                    "calories": 0,
-                    "food_name": "Unknown",
-                    "confidence": 0,
-                    "nutritional_info": {}
-                }
-            elif "PERMISSION_DENIED" in error_msg:
-                return {
-                    "error": "❌ API access denied. Please check your Gemini API permissions and billing settings.",
-                    "calories": 0,
-                    "food_name": "Unknown",
-                    "confidence": 0,
-                    "nutritional_info": {}
-                }
-            elif "QUOTA_EXCEEDED" in error_msg:
-                return {
-                    "error": "❌ API quota exceeded. Please check your usage limits or upgrade your plan.",
-                    "calories": 0,
-                    "food_name": "Unknown",
-                    "confidence": 0,
-                    "nutritional_info": {}
-                }
-            else:
-                return {
-                    "error": f"❌ Gemini API error: {error_msg}",
-                    "calories": 0,
-                    "food_name": "Unknown",
-                    "confidence": 0,
-                    "nutritional_info": {}
-                }
-        
-        # Parse the response
-        
-        # Try to extract JSON from the response
-        import json
-        try:
-            # Find JSON in the response (sometimes it's wrapped in markdown)
-            if "```json" in response_text:
-                json_start = response_text.find("```json") + 7
-                json_end = response_text.find("```", json_start)
-                json_text = response_text[json_start:json_end].strip()
-            elif "{" in response_text and "}" in response_text:
-                json_start = response_text.find("{")
-                json_end = response_text.rfind("}") + 1
-                json_text = response_text[json_start:json_end]
-            else:
-                json_text = response_text
-            
-            result = json.loads(json_text)
-            
-            # Validate and format the result
-            return {
-                "calories": result.get("estimated_calories", 0),
-                "food_name": result.get("food_name", "Unknown food"),
-                "confidence": result.get("confidence", 50),
-                "portion_size": result.get("portion_size", "Unknown portion"),
-                "nutritional_info": result.get("nutritional_info", {}),
-                "health_notes": result.get("health_notes", ""),
-                "error": None
-            }
-            
-        except json.JSONDecodeError:
-            # Fallback: parse manually or return a basic response
-            logger.warning(f"Could not parse JSON from Gemini response: {response_text}")
-            
-            # Try to extract calories manually
-            import re
-            calorie_match = re.search(r'(\d+)\s*calorie', response_text.lower())
-            calories = int(calorie_match.group(1)) if calorie_match else 0
-            
+            # Decoded in the process pool, sent as a thumbnail first
+            return await _ask_about_image("image", prompt, image_bytes, parse_image_analysis, backend, budget)
+        except GeminiError as gemini_error:
+            logger.error(f"Gemini API error ({type(gemini_error).__name__}): {gemini_error}")
             return {
-                "calories": calories,
-                "food_name": "Food item (analysis incomplete)",
-                "confidence": 30,
-                "portion_size": "Unknown",
-                "nutritional_info": {},
-                "health_notes": response_text[:200] + "..." if len(response_text) > 200 else response_text,
-                "error": "Could not parse detailed analysis"
+                "error": gemini_error.describe(),
+                "calories": 0,
+                "food_name": "Unknown",
+                "confidence": 0,
+                "nutritional_info": {}
             }
             
-    except requests.RequestException as e:
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         logger.error(f"Error downloading image: {e}")
         return {
             "error": f"Could not download image: {str(e)}",
@@ -180,65 +489,76 @@ async def analyze_food_image(image_url: str) -> dict:
 
 def is_image_analysis_available() -> bool:
     """Check if image analysis is available"""
-    return model is not None
+    return bool(GEMINI_API_KEY or LOCAL_MODEL_URL or MODEL_REPLAY_PATH)
 
-async def test_gemini_api() -> dict:
-    """Test if the Gemini API is working properly"""
-    if not model:
+async def test_gemini_api(backend: str = None) -> dict:
+    """Test if the AI model is working properly (the one routed for tests, or the named backend)"""
+    router = await _get_router()
+    chosen = router.choose("test", backend=backend)
+    if chosen is None or (backend and chosen[0] != backend):
         return {
             "status": "error",
-            "message": "Gemini API key not configured"
+            "message": f"Model backend '{backend}' not configured" if backend else "Gemini API key not configured"
         }
+    name = chosen[0]
     
     try:
-        # Test with a simple text prompt
-        response = model.generate_content("Say 'API test successful' if you can read this.")
+        # Test with a simple text prompt and a short deadline
+        started = time.monotonic()
+        response = await router.generate_content(
+            "test",
+            "Say 'API test successful' if you can read this.",
+            backend=name,
+            deadline=15,
+            hedge=False
+        )
         return {
             "status": "success",
-            "message": "Gemini API is working correctly",
-            "response": response.text.strip()
+            "message": f"{name} model is working correctly",
+            "response": response.text.strip(),
+            "backend": name,
+            "latency": time.monotonic() - started
+        }
+    except InvalidAPIKeyError:
+        return {
+            "status": "error",
+            "message": "Invalid API key. Please update your GEMINI_API_KEY in the .env file.",
+            "help_url": API_KEY_HELP_URL
+        }
+    except GeminiError as e:
+        return {
+            "status": "error",
+            "message": e.describe()
         }
-    except Exception as e:
-        error_msg = str(e)
-        if "API_KEY_INVALID" in error_msg:
-            return {
-                "status": "error",
-                "message": "Invalid API key. Please update your GEMINI_API_KEY in the .env file.",
-                "help_url": "https://aistudio.google.com/app/apikey"
-            }
-        else:
-            return {
-                "status": "error",
-                "message": f"API error: {error_msg}"
-            }
 
-async def analyze_food_with_description(image_url: str, description: str = None) -> dict:
+async def analyze_food_with_description(image_url: str, description: str = None, budget: str = NORMAL) -> dict:
     """
     Analyze a food image with optional text description for enhanced accuracy
     
     Args:
         image_url: URL of the image to analyze
         description: Optional text description with measurements (e.g., "350g chicken and salad")
+        budget: usage.NORMAL, or ECONOMY/EXHAUSTED to take cheaper paths (local model, smaller image)
         
     Returns:
         dict: Contains calories, food_name, confidence, and nutritional_info with enhanced accuracy
     """
-    if not model:
+    if not await _get_router():
         return {
-            "error": "Image analysis is not available. Gemini API key not configured.",
+            "error": "Image analysis is not available. No AI model configured.",
             "calories": 0,
             "food_name": "Unknown",
             "confidence": 0,
             "nutritional_info": {}
         }
     
+    backend = _budget_backend("describe", True, budget)
+    if budget == EXHAUSTED and backend is None:
+        return _budget_exhausted()
+    
     try:
         # Download the image
-        response = requests.get(image_url, timeout=10)
-        response.raise_for_status()
-        
-        # Open and process the image
-        image = Image.open(io.BytesIO(response.content))
+        image_bytes = await download_image(image_url)
         
         # Create enhanced prompt that incorporates description
         if description:
@@ -307,100 +627,20 @@ async def analyze_food_with_description(image_url: str, description: str = None)
 
         # Generate content using Gemini
         try:
-            response = model.generate_content([prompt, image])
-            response_text = response.text.strip()
-        except Exception as gemini_error:
-            error_msg = str(gemini_error)
-            logger.error(f"Gemini API error: {error_msg}")
-            
-            # Check for specific API key errors
-            if "API_KEY_INVALID" in error_msg or "API key not valid" in error_msg:
-                return {
-                    "error": "❌ Invalid Gemini API key. Please update your API key in the .env file.\n\n🔑 Get a new key at: https://aistudio.google.com/app/apikey",
-                    "calories": 0,
-                    "food_name": "Unknown",
-                    "confidence": 0,
-                    "nutritional_info": {}
-                }
-            elif "PERMISSION_DENIED" in error_msg:
-                return {
-                    "error": "❌ API access denied. Please check your Gemini API permissions and billing settings.",
-                    "calories": 0,
-                    "food_name": "Unknown",
-                    "confidence": 0,
-                    "nutritional_info": {}
-                }
-            elif "QUOTA_EXCEEDED" in error_msg:
-                return {
-                    "error": "❌ API quota exceeded. Please check your usage limits or upgrade your plan.",
-                    "calories": 0,
-                    "food_name": "Unknown",
-                    "confidence": 0,
-                    "nutritional_info": {}
-                }
-            else:
-                return {
-                    "error": f"❌ Gemini API error: {error_msg}",
-                    "calories": 0,
-                    "food_name": "Unknown",
-                    "confidence": 0,
-                    "nutritional_info": {}
-                }
-        
-        # Parse the response
-        import json
-        try:
-            # Find JSON in the response (sometimes it's wrapped in markdown)
-            if "```json" in response_text:
-                json_start = response_text.find("```json") + 7
-                json_end = response_text.find("```", json_start)
-                json_text = response_text[json_start:json_end].strip()
-            elif "{" in response_text and "}" in response_text:
-                json_start = response_text.find("{")
-                json_end = response_text.rfind("}") + 1
-                json_text = response_text[json_start:json_end]
-            else:
-                json_text = response_text
-            
-            result = json.loads(json_text)
-            
-            # Validate and format the result
-            return {
-                "calories": result.get("estimated_calories", 0),
-                "food_name": result.get("food_name", "Unknown food"),
-                "confidence": result.get("confidence", 50),
-                "portion_size": result.get("portion_size", "Unknown portion"),
-                "nutritional_info": result.get("nutritional_info", {}),
-                "health_notes": result.get("health_notes", ""),
-                "user_description_used": result.get("user_description_used", False),
-                "description_accuracy": result.get("description_accuracy", ""),
-                "original_description": description if description else "",
-                "error": None
-            }
-            
-        except json.JSONDecodeError:
-            # Fallback: parse manually or return a basic response
-            logger.warning(f"Could not parse JSON from Gemini response: {response_text}")
-            
-            # Try to extract calories manually
-            import re
-            calorie_match = re.search(r'(\d+)\s*calorie', response_text.lower())
-            calories = int(calorie_match.group(1)) if calorie_match else 0
-            
+            # Decoded in the process pool, sent as a thumbnail first
+            parse = lambda text: parse_described_analysis(text, description)
+            return await _ask_about_image("describe", prompt, image_bytes, parse, backend, budget)
+        except GeminiError as gemini_error:
+            logger.error(f"Gemini API error ({type(gemini_error).__name__}): {gemini_error}")
             return {
-                "calories": calories,
-                "food_name": "Food item (analysis incomplete)",
-                "confidence": 30,
-                "portion_size": "Unknown",
-                "nutritional_info": {},
-                "health_notes": response_text[:200] + "..." if len(response_text) > 200 else response_text,
-                "user_description_used": bool(description),
-                "description_accuracy": "",
-                "original_description": description if description else "",
-                "error": "Could not parse detailed analysis"
+                "error": gemini_error.describe(),
+                "calories": 0,
+                "food_name": "Unknown",
+                "confidence": 0,
+                "nutritional_info": {}
             }
             
-    except requests.RequestException as e:
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         logger.error(f"Error downloading image: {e}")
         return {
             "error": f"Could not download image: {str(e)}",
@@ -419,3 +659,91 @@ async def analyze_food_with_description(image_url: str, description: str = None)
             "confidence": 0,
             "nutritional_info": {}
         }
+
+async def estimate_food_from_text(description: str, budget: str = NORMAL) -> dict:
+    """
+    Estimate calories and nutrition from a text description only
+    
+    Args:
+        description: What the user ate, ideally with measurements
+        budget: usage.NORMAL, or ECONOMY/EXHAUSTED to take cheaper paths (cached estimate, local model)
+        
+    Returns:
+        dict: Contains calories, food_name, confidence, nutritional_info and interpretation
+    """
+    if not await _get_router():
+        return {
+            "error": "Calorie estimation is not available. No AI model configured.",
+            "calories": 0,
+            "food_name": "Unknown",
+            "confidence": 0,
+            "nutritional_info": {}
+        }
+    
+    cache_key = " ".join(description.lower().split())
+    if budget != NORMAL and cache_key in _estimate_cache:
+        _estimate_cache.move_to_end(cache_key)
+        return dict(_estimate_cache[cache_key], usage=None)
+    backend = _budget_backend("estimate", False, budget)
+    if budget == EXHAUSTED and backend is None:
+        return _budget_exhausted()
+    
+    prompt = f"""
+    Analyze this food description and provide nutritional breakdown: "{description}"
+
+    Please respond in this exact JSON format:
+
+    {{
+        "food_name": "summary of the food items mentioned",
+        "estimated_calories": number (total calories for all items described),
+        "confidence": number between 0-100 (confidence in text-based estimation),
+        "portion_size": "summary of portions mentioned",
+        "analysis_method": "text-only",
+        "nutritional_info": {{
+            "protein": "amount in grams",
+            "carbohydrates": "amount in grams", 
+            "fat": "amount in grams",
+            "fiber": "amount in grams",
+            "sugar": "amount in grams"
+        }},
+        "health_notes": "brief nutritional assessment",
+        "interpretation": "how you interpreted the user's description"
+    }}
+
+    Guidelines:
+    - Base calculations on standard nutritional databases (USDA, etc.)
+    - If measurements are vague, estimate standard portions
+    - Consider cooking methods for calorie adjustments
+    - Be conservative with confidence if description is unclear
+    - Note any assumptions made in the interpretation field
+    """
+    
+    try:
+        backend, response = await model_router.generate("estimate", prompt, backend)
+        response_text = response.text.strip()
+    except GeminiError as gemini_error:
+        logger.error(f"Gemini API error in estimate ({type(gemini_error).__name__}): {gemini_error}")
+        return {
+            "error": gemini_error.describe(),
+            "calories": 0,
+            "food_name": "Unknown",
+            "confidence": 0,
+            "nutritional_info": {}
+        }
+    except Exception as e:
+        logger.error(f"Error estimating calories: {e}")
+        return {
+            "error": f"Estimation failed: {str(e)}",
+            "calories": 0,
+            "food_name": "Unknown",
+            "confidence": 0,
+            "nutritional_info": {}
+        }
+    
+    result = parse_estimate(response_text)
+    if not result["error"]:
+        _estimate_cache[cache_key] = dict(result)
+        if len(_estimate_cache) > ESTIMATE_CACHE_SIZE:
+            _estimate_cache.popitem(last=False)
+    result["usage"] = _usage(backend, response)
+    return result
@@ -0,0 +1,116 @@
+import argparse
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+import requests
+from config import DISCORD_TOKEN
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CALORIES_FILE = "user_calories.json"
+SNAPSHOT_FILE = "user_calories.snap"
+DEFAULT_STORE_DIR = "user_data"
+RESTART_DELAY = 5  # Seconds to wait before restarting a crashed worker
+
+
+def fetch_recommended_shard_count() -> int:
+    """Ask Discord how many shards it recommends for this bot"""
+    response = requests.get(
+        "https://discord.com/api/v10/gateway/bot",
+        headers={"Authorization": f"Bot {DISCORD_TOKEN}"},
+        timeout=10
+    )
+    response.raise_for_status()
+    return response.json()["shards"]
+
+
+def split_shards(shard_count: int, workers: int) -> list:
+    """Spread shard IDs round-robin across worker processes"""
+    return [list(range(worker, shard_count, workers)) for worker in range(workers)]
+
+
+def prepare_shared_store(store_dir: str):
+    """Seed the shared per-user store from the single-process data file on first run"""
+    from shared_store import SharedUserStore
+    from snapshot import load_snapshot
+    from entries import user_data_to_dict
+
+    store = SharedUserStore(store_dir)
+    if not store.is_empty():
+        return
+    if os.path.exists(SNAPSHOT_FILE):
+        users = load_snapshot(SNAPSHOT_FILE, use_mmap=False)
+        store.import_snapshot({user_id_str: user_data_to_dict(users[user_id_str]) for user_id_str in users})
+        logger.info(f"Imported {SNAPSHOT_FILE} into shared store at {store_dir}")
+    elif os.path.exists(CALORIES_FILE):
+        with open(CALORIES_FILE, 'r') as f:
+            store.import_snapshot(json.load(f))
+        logger.info(f"Imported {CALORIES_FILE} into shared store at {store_dir}")
+
+
+def start_worker(shard_ids: list, shard_count: int, store_dir: str) -> subprocess.Popen:
+    """Run main.py for a subset of shards"""
+    env = dict(
+        os.environ,
+        SHARD_IDS=",".join(str(shard_id) for shard_id in shard_ids),
+        SHARD_COUNT=str(shard_count),
+        SHARED_STORE_DIR=store_dir
+    )
+    logger.info(f"Starting worker for shards {shard_ids}")
+    return subprocess.Popen([sys.executable, "main.py"], env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the bot as several sharded worker processes")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of worker processes")
+    parser.add_argument("--shards", type=int, default=None, help="Total shard count (default: Discord's recommendation)")
+    parser.add_argument("--store-dir", default=os.getenv("SHARED_STORE_DIR", DEFAULT_STORE_DIR),
+                        help="Directory for the shared per-user store")
+    args = parser.parse_args()
+
+    shard_count = args.shards or fetch_recommended_shard_count()
+    workers = max(1, min(args.workers, shard_count))
+    assignments = split_shards(shard_count, workers)
+    logger.info(f"Launching {workers} workers for {shard_count} shards")
+
+    store_dir = os.path.abspath(args.store_dir)
+    prepare_shared_store(store_dir)
+
+    processes = [start_worker(shard_ids, shard_count, store_dir) for shard_ids in assignments]
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    # Supervise workers, restarting any that crash
+    while not stopping:
+        time.sleep(1)
+        for index, process in enumerate(processes):
+            if process.poll() is not None and not stopping:
+                logger.warning(f"Worker for shards {assignments[index]} exited with code {process.returncode}, restarting in {RESTART_DELAY}s")
+                time.sleep(RESTART_DELAY)
+                processes[index] = start_worker(assignments[index], shard_count, store_dir)
+
+    logger.info("Stopping workers...")
+    for process in processes:
+        if process.poll() is None:
+            process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import asyncio
+import bisect
+import os
+from datetime import date, timedelta
+from shared_store import async_file_lock, read_json, write_json_atomic
+
+STREAK = "streak"
+CONSISTENCY = "consistency"
+GOAL = "goal"
+METRICS = (STREAK, CONSISTENCY, GOAL)
+
+CONSISTENCY_DAYS = 30  # Window for "days logged"
+GOAL_DAYS = 7          # Window for closeness to goal
+
+
+def _logged(user_data: dict, day: date) -> bool:
+    day_log = user_data.get(day.isoformat())
+    return bool(day_log and day_log.foods)
+
+
+def compute_scores(user_data: dict, goal: int, today: date) -> dict:
+    """
+    A user's score for every metric (None where it does not apply):
+    streak       days in a row with entries, up to today (or yesterday if nothing is logged yet today)
+    consistency  days with entries in the last CONSISTENCY_DAYS days
+    goal         0-100, how close daily totals over the last GOAL_DAYS logged days were to the goal
+    """
+    day = today if _logged(user_data, today) else today - timedelta(days=1)
+    streak = 0
+    while _logged(user_data, day):
+        streak += 1
+        day -= timedelta(days=1)
+
+    consistency = sum(_logged(user_data, today - timedelta(days=offset)) for offset in range(CONSISTENCY_DAYS))
+
+    closeness = None
+    if goal:
+        totals = [
+            user_data[(today - timedelta(days=offset)).isoformat()].total_calories
+            for offset in range(GOAL_DAYS) if _logged(user_data, today - timedelta(days=offset))
+        ]
+        if totals:
+            average_miss = sum(abs(total - goal) for total in totals) / len(totals)
+            closeness = round(max(0.0, 100 - average_miss / goal * 100), 1)
+
+    return {
+        STREAK: streak or None,
+        CONSISTENCY: consistency or None,
+        GOAL: closeness
+    }
+
+
+class RankingIndex:
+    """
+    One metric's scores for one guild, kept sorted best-first so the top K
+    is a slice. Updates find the old and new position by binary search.
+    """
+
+    def __init__(self):
+        self._keys = []     # (-score, user_id_str), ascending
+        self._scores = {}   # user_id_str -> score
+
+    def update(self, user_id_str: str, score):
+        """Set (or with None, drop) a user's score"""
+        old_score = self._scores.pop(user_id_str, None)
+        if old_score is not None:
+            del self._keys[bisect.bisect_left(self._keys, (-old_score, user_id_str))]
+        if score is not None:
+            self._scores[user_id_str] = score
+            bisect.insort(self._keys, (-score, user_id_str))
+
+    def top(self, k: int) -> list:
+        """[(user_id_str, score)] for the best k users"""
+        return [(user_id_str, -negative_score) for negative_score, user_id_str in self._keys[:k]]
+
+    def rank(self, user_id_str: str):
+        """1-based position of a user, or None if they have no score"""
+        score = self._scores.get(user_id_str)
+        if score is None:
+            return None
+        return bisect.bisect_left(self._keys, (-score, user_id_str)) + 1
+
+    def score(self, user_id_str: str):
+        return self._scores.get(user_id_str)
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class LeaderboardMembers:
+    """Members who opted in to each guild's leaderboard, stored in a small JSON file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._guilds = None
+        self._user_guilds = None
+        self.version = None
+
+    def _version_on_disk(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _read(self) -> tuple:
+        """(version, {guild_id_str: members}) as stored on disk"""
+        version = self._version_on_disk()
+        return version, {guild_id_str: set(members) for guild_id_str, members in read_json(self.path, {}).items()}
+
+    def _write(self, guilds: dict):
+        write_json_atomic(self.path, {guild_id_str: sorted(members) for guild_id_str, members in guilds.items() if members})
+        return self._version_on_disk()
+
+    def _set(self, version, guilds: dict):
+        self._guilds = guilds
+        self._user_guilds = {}
+        for guild_id_str, members in guilds.items():
+            for user_id_str in members:
+                self._user_guilds.setdefault(user_id_str, set()).add(guild_id_str)
+        self.version = version
+
+    def _load(self):
+        if self._guilds is None or self._version_on_disk() != self.version:
+            self._set(*self._read())
+
+    async def _update(self, change) -> bool:
+        """Apply change under the file lock, waiting for it and doing the file I/O off the event loop"""
+        loop = asyncio.get_running_loop()
+        async with async_file_lock(f"{self.path}.lock"):
+            # Re-read under the lock, another worker may have just changed the file
+            version, guilds = await loop.run_in_executor(None, self._read)
+            changed = change(guilds)
+            if changed:
+                version = await loop.run_in_executor(None, self._write, guilds)
+            self._set(version, guilds)
+        return changed
+
+    async def join(self, guild_id_str: str, user_id_str: str) -> bool:
+        def change(guilds):
+            members = guilds.setdefault(guild_id_str, set())
+            if user_id_str in members:
+                return False
+            members.add(user_id_str)
+            return True
+        return await self._update(change)
+
+    async def leave(self, guild_id_str: str, user_id_str: str) -> bool:
+        def change(guilds):
+            members = guilds.get(guild_id_str, set())
+            if user_id_str not in members:
+                return False
+            members.discard(user_id_str)
+            return True
+        return await self._update(change)
+
+    def members(self, guild_id_str: str) -> set:
+        self._load()
+        return self._guilds.get(guild_id_str, set())
+
+    def guilds_of(self, user_id_str: str) -> set:
+        self._load()
+        return self._user_guilds.get(user_id_str, set())
+
+    def refresh(self):
+        """Pick up changes made by other worker processes, returning the current version"""
+        self._load()
+        return self.version
+
+
+class Leaderboards:
+    """
+    Per-guild ranking indexes for every metric, built from the store the first
+    time a guild is queried on a given day and updated per user on every change.
+    Streaks and day counts shift at midnight without any entry changing, so a
+    guild's indexes are rebuilt once on the first query of each new day.
+    """
+
+    def __init__(self, members: LeaderboardMembers, user_data, goal_of):
+        self.members = members
+        self._user_data = user_data  # user_id_str -> {day: DayLog} or None
+        self._goal_of = goal_of      # user_id_str -> goal in kcal or None
+        self._indexes = {}           # guild_id_str -> {metric: RankingIndex}
+        self._built_on = {}          # guild_id_str -> date the indexes are valid for
+        self._members_version = None
+
+    def _scores(self, user_id_str: str, today: date) -> dict:
+        return compute_scores(self._user_data(user_id_str) or {}, self._goal_of(user_id_str), today)
+
+    def rebuild(self, guild_id_str: str, today: date = None):
+        """Recompute a guild's indexes from the store"""
+        today = today or date.today()
+        indexes = {metric: RankingIndex() for metric in METRICS}
+        for user_id_str in self.members.members(guild_id_str):
+            scores = self._scores(user_id_str, today)
+            for metric in METRICS:
+                indexes[metric].update(user_id_str, scores[metric])
+        self._indexes[guild_id_str] = indexes
+        self._built_on[guild_id_str] = today
+        return indexes
+
+    def _guild(self, guild_id_str: str, today: date) -> dict:
+        # Another worker changed who opted in
+        if self.members.refresh() != self._members_version:
+            self._members_version = self.members.version
+            self._indexes.clear()
+            self._built_on.clear()
+        if self._built_on.get(guild_id_str) != today:
+            return self.rebuild(guild_id_str, today)
+        return self._indexes[guild_id_str]
+
+    def user_changed(self, user_id_str: str):
+        """Re-score a user in every built guild index they belong to"""
+        guilds = [guild_id_str for guild_id_str in self.members.guilds_of(user_id_str) if guild_id_str in self._indexes]
+        if not guilds:
+            return
+        today = date.today()
+        scores = self._scores(user_id_str, today)
+        for guild_id_str in guilds:
+            if self._built_on[guild_id_str] != today:
+                continue  # Rebuilt on its next query anyway
+            for metric in METRICS:
+                self._indexes[guild_id_str][metric].update(user_id_str, scores[metric])
+
+    async def join(self, guild_id_str: str, user_id_str: str) -> bool:
+        return await self.members.join(guild_id_str, user_id_str)
+
+    async def leave(self, guild_id_str: str, user_id_str: str) -> bool:
+        return await self.members.leave(guild_id_str, user_id_str)
+
+    def top(self, guild_id_str: str, metric: str, k: int = 10) -> list:
+        return self._guild(guild_id_str, date.today())[metric].top(k)
+
+    def standing(self, guild_id_str: str, metric: str, user_id_str: str):
+        """(rank, score, ranked user count) for one user"""
+        index = self._guild(guild_id_str, date.today())[metric]
+        return index.rank(user_id_str), index.score(user_id_str), len(index)
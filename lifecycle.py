@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class Lifecycle:
+    """
+    Tracks analyses in flight so the bot can shut down without dropping
+    them: stop accepting new ones, let those running finish (cancelling
+    whatever is left at the deadline), then run the shutdown steps in order,
+    e.g. stopping background tasks, flushing data and closing connections.
+    """
+
+    def __init__(self, drain_timeout: float = 20):
+        self.drain_timeout = drain_timeout
+        self.accepting = True
+        self._in_flight = {}  # task -> coroutine function run if it is cancelled, or None
+        self._shutdown = None
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    @asynccontextmanager
+    async def track(self, interrupted=None):
+        """
+        Count the current task as in flight while inside the block. If a
+        shutdown has to cancel it, interrupted() (async) is awaited first,
+        e.g. to tell the user to try again.
+        """
+        task = asyncio.current_task()
+        self._in_flight[task] = interrupted
+        try:
+            yield
+        except asyncio.CancelledError:
+            if not self.accepting and interrupted:
+                try:
+                    await asyncio.wait_for(interrupted(), timeout=5)
+                except Exception as e:
+                    logger.warning(f"Could not report an interrupted analysis: {e}")
+            raise
+        finally:
+            self._in_flight.pop(task, None)
+
+    async def drain(self) -> tuple:
+        """Wait up to drain_timeout for in-flight work, then cancel the rest; (finished, cancelled)"""
+        tasks = set(self._in_flight)
+        if not tasks:
+            return 0, 0
+        logger.info(f"Waiting up to {self.drain_timeout:g}s for {len(tasks)} analyses in flight")
+        _, pending = await asyncio.wait(tasks, timeout=self.drain_timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending, timeout=10)
+        return len(tasks) - len(pending), len(pending)
+
+    def shutdown(self, steps: list):
+        """
+        Start shutting down (once; later calls return the same task). steps
+        are (name, callable) run in order after draining; a callable may
+        return an awaitable. A failing step is logged and the rest still run.
+        """
+        if self._shutdown is None:
+            self.accepting = False
+            self._shutdown = asyncio.create_task(self._run_shutdown(steps))
+        return self._shutdown
+
+    async def wait_stopped(self):
+        """Wait for a started shutdown to finish all its steps"""
+        if self._shutdown is not None:
+            await self._shutdown
+
+    async def _run_shutdown(self, steps: list):
+        started = time.monotonic()
+        finished, cancelled = await self.drain()
+        if finished or cancelled:
+            logger.info(f"Drained analyses: {finished} finished, {cancelled} cancelled")
+        for name, step in steps:
+            try:
+                result = step()
+                if asyncio.iscoroutine(result) or isinstance(result, asyncio.Future):
+                    await result
+            except Exception as e:
+                logger.error(f"Shutdown step '{name}' failed: {e}")
+        logger.info(f"Shut down in {time.monotonic() - started:.1f}s")
@@ -0,0 +1,122 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+TEXT_FORMAT = "%(levelname)s:%(name)s:%(message)s"
+
+# LogRecord attributes that aren't extra fields passed by the caller
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName", "suppressed"}
+
+
+class TextFormatter(logging.Formatter):
+    """The usual basicConfig layout, noting lines the sampler dropped"""
+
+    def __init__(self):
+        super().__init__(TEXT_FORMAT)
+
+    def format(self, record):
+        text = super().format(record)
+        if getattr(record, "suppressed", 0):
+            text += f" ({record.suppressed} similar lines suppressed)"
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; fields passed with extra={...} are included as-is"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "site": f"{os.path.basename(record.pathname)}:{record.lineno}"
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class CallSiteSampler(logging.Filter):
+    """
+    Rate limit per logging call site (file and line): each site may log
+    burst records at once and then rate per second. WARNING and above always
+    pass. The next record a site logs carries how many were dropped before
+    it (record.suppressed), so nothing disappears without a trace.
+    """
+
+    def __init__(self, rate: float = 1.0, burst: int = 10):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self._sites = {}  # (pathname, lineno) -> [tokens, last refill, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.rate <= 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.get((record.pathname, record.lineno))
+            if site is None:
+                site = self._sites[(record.pathname, record.lineno)] = [float(self.burst), now, 0]
+            site[0] = min(self.burst, site[0] + (now - site[1]) * self.rate)
+            site[1] = now
+            if site[0] < 1:
+                site[2] += 1
+                return False
+            site[0] -= 1
+            record.suppressed, site[2] = site[2], 0
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the listener thread with the message and traceback already rendered"""
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(level: str = "INFO", log_format: str = "text", sample_rate: float = 1.0, sample_burst: int = 10):
+    """
+    Route all logging through a queue: the event loop only samples and
+    enqueues records, and a background thread formats and writes them.
+    Returns the listener, which is flushed and stopped at exit.
+    """
+    output = logging.StreamHandler()
+    output.setFormatter(JsonFormatter() if log_format == "json" else TextFormatter())
+
+    records = queue.SimpleQueue()
+    handler = _QueueHandler(records)
+    handler.addFilter(CallSiteSampler(sample_rate, sample_burst))
+    listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+    listener.start()
+
+    def stop_at_exit():
+        if listener._thread is not None:  # Unless already stopped
+            listener.stop()
+    atexit.register(stop_at_exit)
+    return listener
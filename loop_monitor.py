@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _blocking_frame(frame) -> str:
+    """'file:line in function' of the innermost project frame of a stack (else the innermost frame)"""
+    stack = traceback.extract_stack(frame)
+    for summary in reversed(stack):
+        if summary.filename.startswith(PROJECT_DIR) and os.path.basename(summary.filename) != "loop_monitor.py":
+            break
+    else:
+        summary = stack[-1]
+    return f"{os.path.relpath(summary.filename, PROJECT_DIR)}:{summary.lineno} in {summary.name}"
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class _SlowCallbackHandler(logging.Handler):
+    """Picks up asyncio debug mode's "Executing <...> took 0.300 seconds" warnings"""
+
+    def __init__(self, monitor):
+        super().__init__(logging.WARNING)
+        self.monitor = monitor
+
+    def emit(self, record):
+        if isinstance(record.msg, str) and record.msg.startswith("Executing ") and len(record.args) == 2:
+            # Logged right after the callback returns, before the late tick runs
+            # Only the task name and coroutine, not what it waits for
+            description = str(record.args[0]).split(" wait_for=")[0].split(" cb=[")[0]
+            self.monitor._slow_callback = description[:150]
+
+
+class LoopLagMonitor:
+    """
+    Measures event loop scheduling lag: a tick is scheduled every interval
+    seconds and any delay beyond that is lag. A watchdog thread notices
+    when a tick is more than threshold late and records where the loop's
+    thread is stuck, so a blocking call shows up with its file and line
+    even though the loop itself can't run until it returns.
+
+    With debug=True, asyncio's debug mode also names the task or callback
+    that ran too long (e.g. the command's coroutine). Debug mode slows the
+    whole loop down, so it is off by default.
+    """
+
+    def __init__(self, interval: float = 0.25, threshold: float = 0.25, window: int = 2400, debug: bool = False,
+                 log_every: float = 600):
+        self.interval = interval
+        self.threshold = threshold
+        self.debug = debug
+        self.log_every = log_every  # Seconds between lag summaries in the log, 0 for none
+        self._lags = deque(maxlen=window)  # Seconds late of the last window ticks
+        self.stalls = deque(maxlen=20)  # (unix time, seconds, location), newest last
+        self.stall_count = 0
+        self._last_tick = None
+        self._stuck_at = None  # Where the watchdog found the loop during the current stall
+        self._slow_callback = None  # What asyncio debug mode reported as running too long
+        self._task = None
+        self._stop = None
+        self._debug_handler = None
+
+    def start(self):
+        """Start measuring on the running loop (call from it; does nothing if already started)"""
+        if self._task is not None:
+            return
+        loop = asyncio.get_running_loop()
+        self._last_tick = time.monotonic()
+        self._task = asyncio.create_task(self._tick())
+        self._stop = threading.Event()
+        threading.Thread(
+            target=self._watch, args=(threading.get_ident(), self._stop), name="loop-watchdog", daemon=True
+        ).start()
+        if self.debug:
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.threshold
+            self._debug_handler = _SlowCallbackHandler(self)
+            logging.getLogger("asyncio").addHandler(self._debug_handler)
+
+    def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        self._task = None
+        self._stop.set()
+        if self._debug_handler:
+            logging.getLogger("asyncio").removeHandler(self._debug_handler)
+            self._debug_handler = None
+
+    async def _tick(self):
+        loop = asyncio.get_running_loop()
+        next_log = loop.time() + self.log_every
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self._last_tick = time.monotonic()
+            self._lags.append(lag)
+            if lag >= self.threshold:
+                location = self._stuck_at or "unknown (stalled between watchdog checks)"
+                if self._slow_callback:
+                    location = f"{location} ({self._slow_callback})"
+                self._record_stall(lag, location)
+            self._stuck_at = self._slow_callback = None
+            if self.log_every and loop.time() >= next_log:
+                next_log = loop.time() + self.log_every
+                lag_ms = self.percentiles()
+                logger.info(
+                    f"Event loop lag p50={lag_ms['p50']:.1f}ms p95={lag_ms['p95']:.1f}ms p99={lag_ms['p99']:.1f}ms "
+                    f"max={lag_ms['max']:.1f}ms stalls={self.stall_count}"
+                )
+
+    def _watch(self, loop_thread_id: int, stop: threading.Event):
+        """Watchdog thread: captures the loop thread's stack while a tick is overdue"""
+        while not stop.wait(self.threshold / 2):
+            overdue = time.monotonic() - self._last_tick - self.interval
+            if overdue >= self.threshold and self._stuck_at is None:
+                frame = sys._current_frames().get(loop_thread_id)
+                if frame is not None:
+                    self._stuck_at = _blocking_frame(frame)
+
+    def _record_stall(self, seconds: float, location: str):
+        self.stall_count += 1
+        self.stalls.append((time.time(), seconds, location))
+        logger.warning(f"Event loop blocked for {seconds * 1000:.0f} ms at {location}")
+
+    def percentiles(self) -> dict:
+        """Lag in milliseconds over the recent window: p50, p95, p99 and max"""
+        lags = sorted(self._lags)
+        return {
+            "p50": percentile(lags, 0.50) * 1000,
+            "p95": percentile(lags, 0.95) * 1000,
+            "p99": percentile(lags, 0.99) * 1000,
+            "max": (lags[-1] if lags else 0.0) * 1000,
+            "samples": len(lags)
+        }
@@ -1,72 +1,371 @@
 import discord
 from discord.ext import commands
+from discord import app_commands
 import asyncio
 import logging
+import csv
+import io
 import json
 import os
-from datetime import datetime, date
-from config import DISCORD_TOKEN, COMMAND_PREFIX, BOT_NAME, BOT_DESCRIPTION
-from image_analysis import analyze_food_image, analyze_food_with_description, is_image_analysis_available, test_gemini_api
+import re
+import signal
+import tempfile
+import time
+import aiohttp
+from contextlib import asynccontextmanager
+from datetime import date
+from config import (
+    DISCORD_TOKEN, COMMAND_PREFIX, BOT_NAME, BOT_DESCRIPTION, SHARD_COUNT, SHARD_IDS, SHARED_STORE_DIR,
+    CALORIES_FORMAT, SNAPSHOT_MMAP, SAVE_DELAY_SECONDS, SYNC_APP_COMMANDS, APP_COMMAND_GUILD_ID, DIGEST_TIME, DIGEST_BATCH_SIZE,
+    DIGEST_BATCH_INTERVAL, RETENTION_POLICY, RETENTION_HOT_DAYS, ARCHIVE_DIR, LOOP_LAG_THRESHOLD_MS, LOOP_DEBUG,
+    SHUTDOWN_DRAIN_SECONDS, LOG_LEVEL, LOG_FORMAT, LOG_SAMPLE_RATE, LOG_SAMPLE_BURST, GEMINI_PROMPT_PRICE,
+    GEMINI_OUTPUT_PRICE, USAGE_USER_DAILY_BUDGET, USAGE_GUILD_DAILY_BUDGET, USAGE_ECONOMY_SHARE
+)
+from image_analysis import (
+    analyze_food_image, analyze_food_with_description, estimate_food_from_text, is_image_analysis_available, test_gemini_api,
+    warm_up as warm_up_gemini, shutdown_image_pool, close_recording, image_resolution
+)
+from shared_store import SharedUserStore
+from user_locks import UserLockManager
+from entries import EntryIndex, FoodEntry, DayLog, ENTRY_ID_LENGTH, user_data_to_dict, user_data_from_dict
+import snapshot
+from message_lifecycle import AnalysisMessage, PendingResults
+from digests import DigestSettings, DigestScheduler, DM, GUILD
+from leaderboard import Leaderboards, LeaderboardMembers, METRICS, STREAK
+from food_trie import FoodSuggestions
+from retention import ColdArchive, RetentionPolicy, hot_days, merge_days
+from recipes import RecipeBook, parse_recipe, parse_servings, parse_items, serving_calories
+from nutrition import parse_macros, scale_macros
+from loop_monitor import LoopLagMonitor
+from lifecycle import Lifecycle
+from usage import UsageLedger, USERS, GUILDS, NORMAL
+from model_backends import GEMINI
+from logging_setup import setup_logging
+from diagnostics import (
+    LoopProfiler, profile_report, start_tracing, stop_tracing, top_allocations, format_allocations, store_stats,
+    format_bytes
+)
+from history_io import (
+    FORMATS, parse_day_range, iter_entries, write_entries, validated_batches
+)
+from embeds import (
+    build_analysis_error_embed, build_image_analysis_embed, build_enhanced_analysis_embed, build_estimate_embed,
+    build_calories_added_embed, build_calories_declined_embed, add_logged_entry, logged_by, build_digest_embed, build_rollup_embed,
+    build_leaderboard_embed, build_food_matches_embed, build_today_embed, build_history_embed, build_month_embed,
+    build_recipe_embed, build_recipe_list_embed, build_memory_embed, build_usage_embed
+)
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
+# Set up logging: records are queued and written by a background thread
+setup_logging(LOG_LEVEL, LOG_FORMAT, LOG_SAMPLE_RATE, LOG_SAMPLE_BURST)
 logger = logging.getLogger(__name__)
 
 # Simple in-memory calorie tracking (you could enhance this with a database)
 user_calories = {}
 CALORIES_FILE = "user_calories.json"
+SNAPSHOT_FILE = "user_calories.snap"
+
+# Single-file stores: each user's record as last saved, dropped when the user changes,
+# so a save only re-encodes changed users; changes close together share one save
+encoded_users = {}
+save_lock = asyncio.Lock()
+pending_save = None
+
+# When several worker processes run (see launcher.py) they share per-user files instead
+shared_store = SharedUserStore(SHARED_STORE_DIR, encode=user_data_to_dict, decode=user_data_from_dict) if SHARED_STORE_DIR else None
+
+# Every mutation of a user's data holds that user's lock
+user_locks = UserLockManager()
+
+# Entry ID -> (day, entry) for every user, kept in step with user_calories
+entry_index = EntryIndex()
+
+# Opt-in end-of-day summaries (shared by all workers, progress tracked per worker)
+DIGEST_SETTINGS_FILE = "digest_settings.json"
+DIGEST_CHECKPOINT_FILE = f"digest_checkpoint-{'-'.join(map(str, SHARD_IDS))}.json" if SHARD_IDS else "digest_checkpoint.json"
+digest_settings = DigestSettings(DIGEST_SETTINGS_FILE)
+
+# Opt-in per-guild rankings, re-scored whenever a member's entries change
+LEADERBOARD_MEMBERS_FILE = "leaderboard_members.json"
+leaderboards = Leaderboards(
+    LeaderboardMembers(LEADERBOARD_MEMBERS_FILE),
+    user_data=lambda user_id_str: refresh_user_data(user_id_str) or user_calories.get(user_id_str),
+    goal_of=digest_settings.goal
+)
+
+# Per-user food name tries for quick logging and autocomplete
+food_suggestions = FoodSuggestions(lambda user_id_str: user_calories.get(user_id_str))
+
+# Home-cooked meals with their totals worked out once, one file per user
+RECIPES_DIR = "recipes"
+LEGACY_RECIPES_FILE = "recipes.json"  # All users in one file, split up at startup
+recipe_book = RecipeBook(RECIPES_DIR)
+
+# Only the last RETENTION_HOT_DAYS days stay in memory, older ones are archived
+cold_archive = ColdArchive(ARCHIVE_DIR)
+retention = RetentionPolicy(cold_archive, RETENTION_POLICY, RETENTION_HOT_DAYS)
+retention_task = None
+
+# Measures how late the event loop runs and logs where it was stuck
+lag_monitor = LoopLagMonitor(threshold=LOOP_LAG_THRESHOLD_MS / 1000, debug=LOOP_DEBUG)
+
+# Analyses in flight, drained before the bot shuts down
+lifecycle = Lifecycle(SHUTDOWN_DRAIN_SECONDS)
+RESTARTING_MESSAGE = "🔄 The bot is restarting. Please try again in a minute."
+
+# Model tokens and cost per user and guild per day, against the daily budgets
+USAGE_FILE = "model_usage.json"
+usage_ledger = UsageLedger(USAGE_FILE, {GEMINI: (GEMINI_PROMPT_PRICE, GEMINI_OUTPUT_PRICE)})
 
 def load_calories_data():
     """Load calorie data from file"""
     global user_calories
     try:
-        if os.path.exists(CALORIES_FILE):
-            with open(CALORIES_FILE, 'r') as f:
-                user_calories = json.load(f)
+        if shared_store:
+            user_calories = shared_store.load_all()
+        elif CALORIES_FORMAT == 'json':
+            if os.path.exists(CALORIES_FILE):
+                user_calories = snapshot.import_json(CALORIES_FILE)
+        elif os.path.exists(SNAPSHOT_FILE):
+            # Only the index is read here, users are decoded on first access
+            user_calories = snapshot.load_snapshot(SNAPSHOT_FILE, use_mmap=SNAPSHOT_MMAP)
+        elif os.path.exists(CALORIES_FILE):
+            logger.info(f"Migrating {CALORIES_FILE} to the binary snapshot {SNAPSHOT_FILE}")
+            snapshot.save_snapshot(SNAPSHOT_FILE, snapshot.import_json(CALORIES_FILE))
+            user_calories = snapshot.load_snapshot(SNAPSHOT_FILE, use_mmap=SNAPSHOT_MMAP)
     except Exception as e:
         logger.error(f"Error loading calories data: {e}")
         user_calories = {}
+    entry_index.attach(user_calories)
 
-def save_calories_data():
-    """Save calorie data to file"""
-    try:
-        with open(CALORIES_FILE, 'w') as f:
-            json.dump(user_calories, f, indent=2)
-    except Exception as e:
-        logger.error(f"Error saving calories data: {e}")
+async def save_user_data(user_id_str: str):
+    """
+    Persist a change to a user. The shared store writes the user's file right
+    away, in a thread while the caller still owns the user; the single-file
+    stores are written SAVE_DELAY_SECONDS later, once for all changes made by then.
+    """
+    global pending_save
+    if shared_store:
+        if user_id_str not in user_calories:
+            return
+        stored = user_data_to_dict(user_calories[user_id_str])
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, shared_store.write_user, user_id_str, stored)
+        except Exception as e:
+            logger.error(f"Error saving calories data for user {user_id_str}: {e}")
+        return
+    encoded_users.pop(user_id_str, None)
+    if pending_save is None:
+        pending_save = asyncio.create_task(save_later())
+
+async def save_later():
+    global pending_save
+    await asyncio.sleep(SAVE_DELAY_SECONDS)
+    pending_save = None  # Changes from here on schedule the next save
+    await write_calories_file()
 
-def add_user_calories(user_id: int, calories: int, food_name: str):
-    """Add calories for a user"""
+async def write_calories_file():
+    """Write the snapshot (or JSON) file in a thread, encoding on the loop only the users changed since the last save"""
+    async with save_lock:
+        for user_id_str in [user_id_str for user_id_str in encoded_users if user_id_str not in user_calories]:
+            del encoded_users[user_id_str]
+        loop = asyncio.get_running_loop()
+        try:
+            if CALORIES_FORMAT == 'json':
+                for user_id_str in user_calories:
+                    if user_id_str not in encoded_users:
+                        encoded_users[user_id_str] = snapshot.encode_user_json(user_calories[user_id_str])
+                records = [(user_id_str, encoded_users[user_id_str]) for user_id_str in user_calories]
+                await loop.run_in_executor(None, snapshot.write_json_records, CALORIES_FILE, records)
+            else:
+                records = snapshot.snapshot_records(user_calories, encoded_users)
+                buffer = user_calories.buffer if isinstance(user_calories, snapshot.SnapshotUsers) else None
+                index = await loop.run_in_executor(None, snapshot.write_snapshot, SNAPSHOT_FILE, records, buffer)
+                snapshot.attach_saved(user_calories, SNAPSHOT_FILE, index)
+        except Exception as e:
+            logger.error(f"Error saving calories data: {e}")
+
+def refresh_user_data(user_id_str: str):
+    """Pick up changes another worker process made to this user"""
+    if shared_store and shared_store.refresh_into(user_calories, user_id_str):
+        entry_index.index_user(user_id_str, user_calories[user_id_str])
+        leaderboards.user_changed(user_id_str)
+        food_suggestions.forget(user_id_str)
+
+@asynccontextmanager
+async def user_write_ownership(user_id_str: str):
+    """Own a user's data for the duration of a read-modify-write"""
+    if not shared_store:
+        yield
+        return
+    async with shared_store.owned_async(user_id_str):
+        refresh_user_data(user_id_str)
+        yield
+
+@asynccontextmanager
+async def editing_user(user_id_str: str):
+    """Hold a user's lock (and cross-process ownership) around a read-modify-write"""
+    async with user_locks.hold(user_id_str):
+        async with user_write_ownership(user_id_str):
+            yield
+
+async def add_user_calories(user_id: int, calories: int, food_name: str, macros: tuple = None):
+    """Add calories (and grams of each macro, if known) for a user"""
     user_id_str = str(user_id)
     today = str(date.today())
     
+    async with editing_user(user_id_str):
+        if user_id_str not in user_calories:
+            user_calories[user_id_str] = {}
+        
+        if today not in user_calories[user_id_str]:
+            user_calories[user_id_str][today] = DayLog()
+        
+        day_log = user_calories[user_id_str][today]
+        entry = FoodEntry(entry_index.new_id(user_id_str), food_name, calories, macros=macros)
+        day_log.add_food(entry)
+        entry_index.add(user_id_str, today, entry)
+        food_suggestions.record(user_id_str, food_name, calories, entry.timestamp, macros)
+        
+        await save_user_data(user_id_str)
+        leaderboards.user_changed(user_id_str)
+        return day_log.total_calories
+
+def get_user_daily_calories(user_id: int, day: str = None):
+    """Get user's calories for today (or the given YYYY-MM-DD day)"""
+    user_id_str = str(user_id)
+    day = day or str(date.today())
+    refresh_user_data(user_id_str)
+    
+    if user_id_str in user_calories and day in user_calories[user_id_str]:
+        return user_calories[user_id_str][day]
+    if retention.is_cold(day, date.today()):
+        return cold_archive.day(user_id_str, day) or DayLog()
+    return DayLog()
+
+def user_days(user_id_str: str, start: date = None, end: date = None):
+    """(day, DayLog) for a user's days in a range, oldest first, reading archived months as needed"""
+    days = hot_days(user_calories.get(user_id_str, {}), start, end)
+    if not retention.enabled:
+        return days
+    return merge_days(cold_archive.iter_days(user_id_str, start, end), days)
+
+async def compact_cold_days() -> int:
+    """Move days past the retention window out of memory, returning how many users changed"""
+    # Users not decoded from the snapshot yet are compacted once they are loaded
+    if isinstance(user_calories, snapshot.SnapshotUsers):
+        resident = user_calories.decoded_ids
+    else:
+        resident = list(user_calories)
+    
+    loop = asyncio.get_running_loop()
+    changed = 0
+    for user_id_str in resident:
+        async with editing_user(user_id_str):
+            user_data = user_calories.get(user_id_str)
+            cold = retention.cold_days(user_data, date.today()) if user_data else {}
+            if not cold:
+                continue
+            # The gzip'd months are written in a thread, before the days leave memory (see ColdArchive.store)
+            await loop.run_in_executor(None, retention.archive_days, user_id_str, cold)
+            for day in cold:
+                del user_data[day]
+            entry_index.index_user(user_id_str, user_data)
+            food_suggestions.forget(user_id_str)
+            await save_user_data(user_id_str)
+        changed += 1
+        await asyncio.sleep(0)  # Let commands run between users
+    return changed
+
+async def retention_loop():
+    """Compact once at startup and then daily"""
+    while True:
+        try:
+            started = time.monotonic()
+            changed = await compact_cold_days()
+            if changed:
+                logger.info(f"Archived old days of {changed} users in {time.monotonic() - started:.1f}s")
+        except Exception as e:
+            logger.error(f"Error archiving old days: {e}")
+        await asyncio.sleep(24 * 60 * 60)
+
+def resolve_entry(user_id_str: str, entry_ref: str):
+    """
+    Find an entry from a displayed number (today's entries) or an entry ID (any day)
+    
+    Returns:
+        (day, entry) tuple, or None if nothing matches
+    """
+    entry_ref = entry_ref.lstrip('#').lower()
+    if entry_ref.isdigit() and len(entry_ref) < ENTRY_ID_LENGTH:
+        today = str(date.today())
+        day_log = user_calories.get(user_id_str, {}).get(today)
+        foods = day_log.foods if day_log else []
+        position = int(entry_ref)
+        if 1 <= position <= len(foods):
+            return today, foods[position - 1]
+        return None
+    return entry_index.get(user_id_str, entry_ref)
+
+def entry_not_found_message(user_id_str: str, entry_ref: str) -> str:
+    """Error shown when resolve_entry finds nothing"""
+    entry_ref = entry_ref.lstrip('#').lower()
+    if entry_ref.isdigit() and len(entry_ref) < ENTRY_ID_LENGTH:
+        day_log = user_calories.get(user_id_str, {}).get(str(date.today()))
+        foods = day_log.foods if day_log else []
+        if not foods:
+            return "❌ You have no calorie entries for today!"
+        return f"❌ Invalid entry number! You have {len(foods)} entries. Use `!today` to see them."
+    message = f"❌ No entry with ID `{entry_ref}`. Use `!today` or `!history [YYYY-MM-DD]` to see entry IDs."
+    if retention.enabled:
+        message += f" Entries older than {retention.hot_days} days are archived and can no longer be changed."
+    return message
+
+def is_archived_duplicate(user_id_str: str, day: str, food_name: str, calories: int, entry_id: str) -> bool:
+    """Whether an imported entry is already in the archive"""
+    if not retention.is_cold(day, date.today()):
+        return False
+    day_log = cold_archive.day(user_id_str, day)
+    return bool(day_log) and any(
+        (food.id, food.name, food.calories) == (entry_id, food_name, calories) for food in day_log.foods
+    )
+
+def import_entries(user_id_str: str, batch: list, touched_days: set):
+    """
+    Add one batch of validated import rows (the caller holds editing_user),
+    returning (added, duplicates) and adding the days it changed to touched_days
+    """
+    added = duplicates = 0
     if user_id_str not in user_calories:
         user_calories[user_id_str] = {}
-    
-    if today not in user_calories[user_id_str]:
-        user_calories[user_id_str][today] = {
-            "total_calories": 0,  
-            "foods": []
-        }
-    
-    user_calories[user_id_str][today]["total_calories"] += calories
-    user_calories[user_id_str][today]["foods"].append({
-        "name": food_name,
-        "calories": calories,
-        "timestamp": datetime.now().isoformat()
-    })
-    
-    save_calories_data()
-    return user_calories[user_id_str][today]["total_calories"]
+    user_data = user_calories[user_id_str]
+    
+    for day, food_name, calories, timestamp, entry_id, macros in batch:
+        existing = entry_index.get(user_id_str, entry_id) if entry_id else None
+        if existing:
+            existing_day, existing_entry = existing
+            if (existing_day, existing_entry.name, existing_entry.calories) == (day, food_name, calories):
+                duplicates += 1
+                continue
+            entry_id = None  # Same ID, different entry: keep both
+        elif entry_id and is_archived_duplicate(user_id_str, day, food_name, calories, entry_id):
+            duplicates += 1
+            continue
+        
+        if day not in user_data:
+            user_data[day] = DayLog()
+        entry = FoodEntry(entry_id or entry_index.new_id(user_id_str), food_name, calories, timestamp, macros)
+        user_data[day].add_food(entry)
+        entry_index.add(user_id_str, day, entry)
+        touched_days.add(day)
+        added += 1
+    return added, duplicates
 
-def get_user_daily_calories(user_id: int):
-    """Get user's calories for today"""
-    user_id_str = str(user_id)
-    today = str(date.today())
-    
-    if user_id_str in user_calories and today in user_calories[user_id_str]:
-        return user_calories[user_id_str][today]
-    return {"total_calories": 0, "foods": []}
+def remove_entry(user_id_str: str, day: str, entry: FoodEntry) -> int:
+    """Remove one entry from a user's day and return that day's new total"""
+    day_log = user_calories[user_id_str][day]
+    day_log.remove_food(entry)
+    entry_index.discard(user_id_str, entry.id)
+    return day_log.total_calories
 
 # Bot setup with intents
 intents = discord.Intents.default()
@@ -74,12 +373,50 @@ intents.message_content = True  # Required for reading message content
 intents.guilds = True
 intents.reactions = True  # Required for reaction events
 
-# Create bot instance
-bot = commands.Bot(
-    command_prefix=COMMAND_PREFIX,
-    description=BOT_DESCRIPTION,
-    intents=intents,
-    help_command=commands.DefaultHelpCommand()
+# Create bot instance (sharded when started by launcher.py)
+if SHARD_COUNT:
+    bot = commands.AutoShardedBot(
+        command_prefix=COMMAND_PREFIX,
+        description=BOT_DESCRIPTION,
+        intents=intents,
+        help_command=commands.DefaultHelpCommand(),
+        shard_count=SHARD_COUNT,
+        shard_ids=SHARD_IDS
+    )
+else:
+    bot = commands.Bot(
+        command_prefix=COMMAND_PREFIX,
+        description=BOT_DESCRIPTION,
+        intents=intents,
+        help_command=commands.DefaultHelpCommand()
+    )
+
+def digest_day_log(user_id_str: str, day: str):
+    """One user's DayLog for a day, looked up without copying the store"""
+    refresh_user_data(user_id_str)
+    user_data = user_calories.get(user_id_str)
+    return user_data.get(day) if user_data else None
+
+async def send_digest_dm(user_id_str: str, settings: dict, day: str, day_log: DayLog):
+    # The DM channel was opened at opt-in, so this is a single REST call
+    await bot.get_partial_messageable(settings["target"]).send(embed=build_digest_embed(day, day_log, settings.get("goal")))
+
+async def send_digest_rollup(guild_id_str: str, channel_id: int, day: str, rows: list):
+    guild = bot.get_guild(int(guild_id_str))
+    await bot.get_partial_messageable(channel_id).send(embed=build_rollup_embed(guild.name if guild else "Server", day, rows))
+
+# DMs are sent by one worker only; each worker posts roll-ups for its own guilds
+digest_scheduler = DigestScheduler(
+    digest_settings,
+    DIGEST_CHECKPOINT_FILE,
+    day_log=digest_day_log,
+    send_dm=send_digest_dm,
+    send_rollup=send_digest_rollup,
+    send_time=DIGEST_TIME,
+    batch_size=DIGEST_BATCH_SIZE,
+    batch_interval=DIGEST_BATCH_INTERVAL,
+    send_dms=not SHARD_IDS or 0 in SHARD_IDS,
+    owns_guild=lambda guild_id: bot.get_guild(guild_id) is not None
 )
 
 @bot.event
@@ -88,9 +425,16 @@ async def on_ready():
     logger.info(f'{BOT_NAME} has logged in as {bot.user}!')
     logger.info(f'Bot ID: {bot.user.id}')
     logger.info(f'Connected to {len(bot.guilds)} guilds')
+    if SHARD_COUNT:
+        logger.info(f'Running shards {SHARD_IDS} of {SHARD_COUNT}')
     
-    # Load calorie data
-    load_calories_data()
+    # Start the daily digests and archiving (on_ready can fire again after reconnects)
+    if not lifecycle.accepting:
+        return
+    digest_scheduler.start()
+    global retention_task
+    if retention.enabled and retention_task is None:
+        retention_task = asyncio.create_task(retention_loop())
     
     # Set bot status
     await bot.change_presence(
@@ -100,88 +444,98 @@ async def on_ready():
         )
     )
 
+# Numbers behind the latest analysis results, logged as-is by ✅
+pending_results = PendingResults()
+
+# Titles of embeds whose calories can be logged with ✅
+ANALYSIS_TITLE_KEYWORDS = ["Food Analysis Results", "Text-based Calorie Estimation"]
+
 @bot.event
 async def on_reaction_add(ctx, user):
-    """Handle when users react to messages"""
-    # Ignore reactions from the bot itself
-    if user == bot.user:
-        return
-      # Check if the reaction is on a message from the bot
-    if ctx.message.author != bot.user:
-        return
-    
-    # Check if it's a calorie analysis message (has an embed with analysis results in title)
-    if not ctx.message.embeds:
+    """Handle ✅/❌ reactions on recent analysis results"""
+    # Fires for every reaction the bot can see; anything but a result awaiting
+    # confirmation is dropped with one lookup, before touching authors or embeds
+    if ctx.message.id not in pending_results:
         return
-    
-    embed = ctx.message.embeds[0]
-    logger.info(f"Reaction {ctx.emoji} from {user.display_name} on embed with title: '{embed.title}'")
-    
-    # Check for any type of food analysis result
-    analysis_keywords = ["Food Analysis Results", "Text-based Calorie Estimation"]
-    if not any(keyword in embed.title for keyword in analysis_keywords):
-        logger.info(f"Embed title '{embed.title}' does not contain analysis keywords, ignoring reaction")
+    if user == bot.user:
         return
     
-    logger.info(f"Processing {ctx.emoji} reaction on analysis message")
+    logger.info(f"Processing {ctx.emoji} reaction from {user.id} on analysis message {ctx.message.id}")
     
     # Handle the reaction
     if str(ctx.emoji) == "✅":
-        await handle_add_calories_reaction(ctx, user, embed)
+        await handle_add_calories_reaction(ctx, user)
     elif str(ctx.emoji) == "❌":
         await handle_decline_calories_reaction(ctx, user)
 
-async def handle_add_calories_reaction(ctx, user, embed):
-    """Handle when user clicks ✅ to add calories"""
+def parse_analysis_embed(embed: discord.Embed):
+    """(calories, food_name, macros) shown on an analysis result embed, or None"""
+    if not embed.title or not any(keyword in embed.title for keyword in ANALYSIS_TITLE_KEYWORDS):
+        return None
+    
+    # Extract calories from the embed
+    calories_field = None
+    for field in embed.fields:
+        if "Estimated Calories" in field.name:
+            calories_field = field.value
+            break
+    
+    if not calories_field:
+        logger.warning("No calories field found in embed")
+        return None
+    
+    # Extract the numeric value (e.g., "**450 kcal**" -> 450)
+    calories_match = re.search(r'\*\*(\d+)\s*kcal\*\*', calories_field)
+    if not calories_match:
+        logger.warning(f"Could not extract calories from: '{calories_field}'")
+        return None
+    
+    # Extract food name from embed description
+    food_name = embed.description.strip('**') if embed.description else "Unknown food"
+    
+    # Macros from the "**Protein:** 25g" lines of the nutrition field
+    nutrition = {}
+    for field in embed.fields:
+        if "Nutritional Info" in field.name:
+            for line in field.value.splitlines():
+                nutrient, _, amount = line.partition(":**")
+                nutrition[nutrient.strip("* ")] = amount
+    return int(calories_match.group(1)), food_name, parse_macros(nutrition)
+
+def analysis_result(message: discord.Message):
+    """(calories, food_name, macros) to log for an analysis message"""
+    remembered = pending_results.get(message.id)
+    if remembered:
+        return remembered
+    # Sent before a restart, or too long ago to be remembered
+    return parse_analysis_embed(message.embeds[0]) if message.embeds else None
+
+def claim_result(message: discord.Message, user) -> bool:
+    """Whether a user may log an analysis message's result: once per user and message"""
+    if pending_results.get(message.id) is None and message.embeds and logged_by(message.embeds[0], user.display_name):
+        # Sent before a restart, or too long ago: only the ✅ Logged field tells who logged it
+        return False
+    return pending_results.claim(message.id, user.id)
+
+async def handle_add_calories_reaction(ctx, user):
+    """Handle when user reacts ✅ to add calories (messages sent before buttons existed)"""
     try:
-        logger.info(f"Processing ✅ reaction from {user.display_name} for embed title: '{embed.title}'")
-        
-        # Extract calories from the embed
-        calories_field = None
-        for field in embed.fields:
-            logger.info(f"Checking field: '{field.name}' = '{field.value}'")
-            if "Estimated Calories" in field.name:
-                calories_field = field.value
-                logger.info(f"Found calories field: '{calories_field}'")
-                break
-        
-        if not calories_field:
-            logger.warning("No calories field found in embed")
+        parsed = analysis_result(ctx.message)
+        if not parsed:
             return
-        
-        # Extract the numeric value (e.g., "**450 kcal**" -> 450)
-        import re
-        calories_match = re.search(r'\*\*(\d+)\s*kcal\*\*', calories_field)
-        if not calories_match:
-            logger.warning(f"Could not extract calories from: '{calories_field}'")
+        calories, food_name, macros = parsed
+        if not claim_result(ctx.message, user):
             return
         
-        calories = int(calories_match.group(1))
-        logger.info(f"Extracted calories: {calories}")
-        
-        # Extract food name from embed title or description
-        food_name = embed.description.strip('**') if embed.description else "Unknown food"
-        logger.info(f"Extracted food name: '{food_name}'")
-        
         # Add calories to user's daily total
-        total_today = add_user_calories(user.id, calories, food_name)
-        logger.info(f"Added {calories} calories for user {user.id}, new total: {total_today}")
-        
-        # Send confirmation message
-        confirmation_embed = discord.Embed(
-            title="✅ Calories Added!",
-            description=f"Added **{calories} kcal** for **{food_name}**",
-            color=0x00ff00
-        )
-        confirmation_embed.add_field(
-            name="📊 Today's Total",
-            value=f"**{total_today} kcal**",
-            inline=True
-        )
-        confirmation_embed.set_footer(text=f"Logged for {user.display_name}")
+        try:
+            total_today = await add_user_calories(user.id, calories, food_name, macros)
+        except Exception:
+            pending_results.release(ctx.message.id, user.id)
+            raise
         
         # Send as a reply to the original message or in the same channel
-        await ctx.message.channel.send(embed=confirmation_embed)
+        await ctx.message.channel.send(embed=build_calories_added_embed(calories, food_name, total_today, user.display_name))
         
         logger.info(f"Added {calories} calories for user {user.id} ({user.display_name})")
         
@@ -190,24 +544,53 @@ async def handle_add_calories_reaction(ctx, user, embed):
         await ctx.message.channel.send("❌ Error adding calories. Please try using the `!addcalories` command instead.")
 
 async def handle_decline_calories_reaction(ctx, user):
-    """Handle when user clicks ❌ to decline adding calories"""
+    """Handle when user reacts ❌ to decline adding calories"""
     try:
-        # Send a simple acknowledgment
-        decline_embed = discord.Embed(
-            title="❌ Calories Not Added",
-            description="No worries! The analysis wasn't added to your daily total.",
-            color=0xff6b6b
-        )
-        decline_embed.set_footer(text=f"Declined by {user.display_name}")
-        
-        # Send as a reply to the original message or in the same channel  
-        await ctx.message.channel.send(embed=decline_embed)
-        
+        await ctx.message.channel.send(embed=build_calories_declined_embed(user.display_name))
         logger.info(f"User {user.id} ({user.display_name}) declined adding calories")
-        
     except Exception as e:
         logger.error(f"Error handling decline calories reaction: {e}")
 
+class ConfirmCaloriesView(discord.ui.View):
+    """
+    ✅/❌ buttons under an analysis result. The view is persistent and stateless:
+    what to log comes from pending_results, or is read back from the message's
+    embed, so buttons keep working after a restart.
+    """
+
+    def __init__(self):
+        super().__init__(timeout=None)
+
+    @discord.ui.button(emoji="✅", label="Log calories", style=discord.ButtonStyle.success, custom_id="calories:add")
+    async def add_calories_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        parsed = analysis_result(interaction.message)
+        if not parsed:
+            await interaction.response.send_message("❌ Could not read the analysis result. Please use `!addcalories` instead.", ephemeral=True)
+            return
+        calories, food_name, macros = parsed
+        if not claim_result(interaction.message, interaction.user):
+            await interaction.response.send_message("✅ You already logged this one.", ephemeral=True)
+            return
+        
+        try:
+            total_today = await add_user_calories(interaction.user.id, calories, food_name, macros)
+        except Exception as e:
+            pending_results.release(interaction.message.id, interaction.user.id)
+            logger.error(f"Error adding calories from button: {e}")
+            await interaction.response.send_message("❌ Error adding calories. Please try using the `!addcalories` command instead.", ephemeral=True)
+            return
+        
+        # The confirmation goes onto the result itself instead of a new message
+        embed = add_logged_entry(interaction.message.embeds[0], interaction.user.display_name, calories, total_today)
+        await interaction.response.edit_message(embed=embed)
+        logger.info(f"Added {calories} calories for user {interaction.user.id} ({interaction.user.display_name})")
+
+    @discord.ui.button(emoji="❌", label="Skip", style=discord.ButtonStyle.secondary, custom_id="calories:decline")
+    async def decline_calories_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        # Only the person declining sees this, nothing changes for anyone else
+        await interaction.response.send_message(embed=build_calories_declined_embed(interaction.user.display_name), ephemeral=True)
+        logger.info(f"User {interaction.user.id} ({interaction.user.display_name}) declined adding calories")
+
 # Basic Commands
 @bot.command(name='ping')
 async def ping(ctx):
@@ -226,10 +609,111 @@ async def info(ctx):
     embed.add_field(name="Servers", value=len(bot.guilds), inline=True)
     embed.add_field(name="Users", value=len(bot.users), inline=True)
     embed.add_field(name="Prefix", value=COMMAND_PREFIX, inline=True)
+    lag = lag_monitor.percentiles()
+    if lag["samples"]:
+        embed.add_field(
+            name="⏱️ Event loop lag",
+            value=(
+                f"p50 {lag['p50']:.1f} ms • p95 {lag['p95']:.1f} ms • p99 {lag['p99']:.1f} ms • max {lag['max']:.0f} ms\n"
+                f"{lag_monitor.stall_count} stalls over {LOOP_LAG_THRESHOLD_MS:.0f} ms since start"
+            ),
+            inline=False
+        )
+        if lag_monitor.stalls:
+            _, seconds, location = lag_monitor.stalls[-1]
+            embed.add_field(name="🐢 Last stall", value=f"{seconds * 1000:.0f} ms at `{location}`"[:1024], inline=False)
+    tiers = image_resolution.summary()
+    if tiers["requests"]:
+        # Negative when more photos needed the full image than the thumbnails saved
+        saved = f"{format_bytes(abs(tiers['bytes_saved']))} {'less' if tiers['bytes_saved'] >= 0 else 'more'} uploaded to the model"
+        if tiers["seconds_saved"] is not None:
+            seconds = tiers["seconds_saved"]
+            saved += f" • ~{abs(seconds):.0f}s of model time {'saved' if seconds >= 0 else 'added'}"
+        embed.add_field(
+            name="🖼️ Adaptive image resolution",
+            value=(f"{tiers['thumbnail_share']:.0%} of {tiers['requests']} photos answered from a thumbnail\n{saved}"
+                   + (f"\n{tiers['failed_escalations']} full-size retries failed" if tiers["failed_escalations"] else "")),
+            inline=False
+        )
     embed.set_footer(text="Made with discord.py")
     
     await ctx.send(embed=embed)
 
+# Owner-only diagnostics, safe to run on the live bot
+loop_profiler = LoopProfiler()
+
+async def owner_command_error(ctx, error):
+    if isinstance(error, commands.NotOwner):
+        await ctx.send("❌ Only the bot owner can use this command.")
+    else:
+        logger.error(f"Error in {COMMAND_PREFIX}{ctx.command}: {error}")
+
+@bot.command(name='profile', hidden=True)
+@commands.is_owner()
+async def profile_loop(ctx, action: str = "status"):
+    """Profile the event loop: !profile start, then !profile stop for the report"""
+    action = action.lower()
+    if action == "start":
+        if not loop_profiler.start(asyncio.get_running_loop()):
+            await ctx.send(f"⚠️ A profile is already running. Use `{COMMAND_PREFIX}profile stop` to collect it.")
+            return
+        logger.info(f"Event loop profiling started by {ctx.author.id}")
+        await ctx.send(
+            f"⏱️ Profiling the event loop. Use `{COMMAND_PREFIX}profile stop` for the report "
+            f"(profiling ends by itself after {loop_profiler.max_seconds // 60} minutes)."
+        )
+    elif action == "stop":
+        finished = loop_profiler.stop()
+        if finished is None:
+            await ctx.send(f"❌ No profile is running. Start one with `{COMMAND_PREFIX}profile start`.")
+            return
+        profile, elapsed = finished
+        report, raw = await asyncio.get_running_loop().run_in_executor(None, profile_report, profile, elapsed)
+        logger.info(f"Event loop profile of {elapsed:.1f}s collected")
+        await ctx.send(
+            f"📊 Event loop profile over {elapsed:.0f}s (`profile.pstats` opens in pstats or snakeviz)",
+            files=[
+                discord.File(io.BytesIO(report.encode('utf-8')), filename="profile.txt"),
+                discord.File(io.BytesIO(raw), filename="profile.pstats")
+            ]
+        )
+    else:
+        state = "running" if loop_profiler.running else "not running"
+        await ctx.send(f"⏱️ Profiler is {state}. Use `{COMMAND_PREFIX}profile start|stop`.")
+
+@bot.command(name='memsnap', hidden=True)
+@commands.is_owner()
+async def memory_snapshot(ctx, action: str = None):
+    """Memory use of the calorie store and caches; !memsnap start|stop traces allocations"""
+    if action and action.lower() == "start":
+        started = start_tracing()
+        await ctx.send(
+            f"🔎 Tracing allocations from now on. Run `{COMMAND_PREFIX}memsnap` later to see the top allocators."
+            if started else "⚠️ Allocations are already being traced."
+        )
+        return
+    if action and action.lower() == "stop":
+        await ctx.send("🛑 Stopped tracing allocations." if stop_tracing() else "⚠️ Allocations were not being traced.")
+        return
+    
+    caches = {
+        "Message cache": f"{len(bot.cached_messages)} messages",
+        "Pending results": f"{len(pending_results)} of {pending_results.max_size}",
+        "Entry index": f"{entry_index.indexed_users} users",
+        "Food tries": f"{food_suggestions.cached_users} of {food_suggestions.max_users} users",
+        "Archived months": f"{cold_archive.loaded_months} of {cold_archive.cached_months} loaded"
+    }
+    allocations = await asyncio.get_running_loop().run_in_executor(None, top_allocations)
+    embed = build_memory_embed(store_stats(user_calories), caches, allocations)
+    if allocations:
+        report = discord.File(io.BytesIO(format_allocations(allocations).encode('utf-8')), filename="memsnap.txt")
+        await ctx.send(embed=embed, file=report)
+    else:
+        await ctx.send(embed=embed)
+
+profile_loop.error(owner_command_error)
+memory_snapshot.error(owner_command_error)
+
 # Calorie tracking commands
 @bot.command(name='addcalories', aliases=['add'])
 async def add_calories(ctx, calories: int, *, food_name="Unknown food"):
@@ -239,7 +723,7 @@ async def add_calories(ctx, calories: int, *, food_name="Unknown food"):
         return
     
     # Add to user's daily total
-    total_today = add_user_calories(ctx.author.id, calories, food_name)
+    total_today = await add_user_calories(ctx.author.id, calories, food_name)
     
     embed = discord.Embed(
         title="✅ Calories Added",
@@ -255,60 +739,357 @@ async def add_calories(ctx, calories: int, *, food_name="Unknown food"):
     
     await ctx.send(embed=embed)
 
+class QuickLogView(discord.ui.View):
+    """One button per suggested food; clicking logs it again with its last calorie value"""
+
+    def __init__(self, owner_id: int, foods: list):
+        super().__init__(timeout=120)
+        self.owner_id = owner_id
+        self.message = None
+        for food in foods[:5]:
+            button = discord.ui.Button(label=f"{food.name[:60]} • {food.calories} kcal", style=discord.ButtonStyle.primary)
+            button.callback = self._log_callback(food.name, food.calories, food.macros)
+            self.add_item(button)
+
+    def _log_callback(self, food_name: str, calories: int, macros: tuple):
+        async def callback(interaction: discord.Interaction):
+            total_today = await add_user_calories(self.owner_id, calories, food_name, macros)
+            self.stop()
+            await interaction.response.edit_message(
+                embed=build_calories_added_embed(calories, food_name, total_today, interaction.user.display_name),
+                view=None
+            )
+        return callback
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.owner_id:
+            await interaction.response.send_message("❌ These are someone else's foods. Try `!quick` or `!fav` yourself!", ephemeral=True)
+            return False
+        return True
+
+    async def on_timeout(self):
+        if self.message:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
+
+@bot.command(name='quick', aliases=['q', 'again'])
+async def quick_log(ctx, *, food_prefix: str):
+    """Log a food you've had before by typing the start of its name (no AI call needed)"""
+    user_id_str = str(ctx.author.id)
+    matches = food_suggestions.trie(user_id_str).search(food_prefix)
+    
+    if not matches:
+        await ctx.send(f"❌ No foods in your history match '{food_prefix}'. Log it once with `!addcalories` or an analysis first.")
+        return
+    
+    # An exact name (or a single match) is logged right away
+    exact = food_suggestions.trie(user_id_str).exact(food_prefix)
+    if exact or len(matches) == 1:
+        food = exact or matches[0]
+        total_today = await add_user_calories(ctx.author.id, food.calories, food.name, food.macros)
+        await ctx.send(embed=build_calories_added_embed(food.calories, food.name, total_today, ctx.author.display_name))
+        return
+    
+    view = QuickLogView(ctx.author.id, matches)
+    view.message = await ctx.send(embed=build_food_matches_embed(f"⚡ Foods matching '{food_prefix}'", matches), view=view)
+
+@bot.command(name='fav', aliases=['favorites', 'favs'])
+async def favorite_foods(ctx):
+    """Your most logged foods, with one-click buttons to log them again"""
+    favorites = food_suggestions.trie(str(ctx.author.id)).favorites()
+    if not favorites:
+        await ctx.send("❌ You haven't logged any foods yet. Use `!addcalories` or analyze a meal to get started!")
+        return
+    
+    view = QuickLogView(ctx.author.id, favorites)
+    view.message = await ctx.send(embed=build_food_matches_embed(f"⭐ {ctx.author.display_name}'s Favorite Foods", favorites), view=view)
+
+def resolve_ingredients(user_id_str: str, items: list):
+    """
+    Fill in kcal per portion for parsed recipe items, from the user's known
+    ingredients or foods they logged before (e.g. analysis results).
+    Returns (resolved items, [(unknown name, closest logged food or None)]).
+    """
+    trie = food_suggestions.trie(user_id_str)
+    resolved, unknown = [], []
+    for quantity, name, calories in items:
+        if calories is None:
+            known = recipe_book.ingredient(user_id_str, name)
+            logged = trie.exact(name)
+            calories = known["calories"] if known else logged.calories if logged else None
+        if calories is None:
+            closest = trie.search(name, limit=1)
+            unknown.append((name, closest[0] if closest else None))
+        else:
+            resolved.append((quantity, name, calories))
+    return resolved, unknown
+
+def budget_mode(user, guild) -> str:
+    """How an analysis for this user and guild may spend today (usage.NORMAL, ECONOMY or EXHAUSTED)"""
+    return usage_ledger.mode(
+        str(user.id), str(guild.id) if guild else None,
+        USAGE_USER_DAILY_BUDGET, USAGE_GUILD_DAILY_BUDGET, USAGE_ECONOMY_SHARE
+    )
+
+def estimate_from_known_foods(user_id_str: str, description: str):
+    """
+    Estimate from the user's known ingredients and logged foods without the
+    model ("2 eggs, toast"), or None if any item is unknown. The free path
+    tried first when the user or guild is near its budget.
+    """
+    try:
+        items = parse_items(description)
+    except ValueError:
+        return None
+    resolved, unknown = resolve_ingredients(user_id_str, items)
+    if unknown:
+        return None
+    breakdown = ", ".join(f"{quantity:g} × {name} ({calories} kcal)" for quantity, name, calories in resolved)
+    return {
+        "calories": round(sum(quantity * calories for quantity, _, calories in resolved)),
+        "food_name": description,
+        "confidence": 70,
+        "portion_size": "As described",
+        "nutritional_info": {},
+        "health_notes": "",
+        "interpretation": f"From foods you logged before: {breakdown}",
+        "error": None,
+        "usage": None
+    }
+
+async def record_usage(user, guild, result: dict):
+    """Count the model tokens an analysis used against the user and guild, and save them"""
+    if result.get("usage"):
+        usage_ledger.record(str(user.id), str(guild.id) if guild else None, result["usage"])
+        await asyncio.get_running_loop().run_in_executor(None, usage_ledger.flush)
+
+@bot.command(name='recipe', aliases=['recipes'])
+async def recipe_command(ctx, action: str = None, *, text: str = None):
+    """Save meals you cook: !recipe add <name> [serves N]: <ingredients> | show <name> | remove <name> | ingredient <name> <kcal>"""
+    user_id_str = str(ctx.author.id)
+    action = (action or "list").lower()
+    
+    if action == "add":
+        try:
+            name, servings, items = parse_recipe(text or "")
+        except ValueError as e:
+            await ctx.send(f"❌ {e}. Example: `!recipe add Chili serves 4: 500g beef mince = 1250, 2 can beans = 220, onion`")
+            return
+        items, unknown = resolve_ingredients(user_id_str, items)
+        if unknown:
+            lines = [
+                f"• **{name}**" + (f" (did you mean **{closest.name}**, {closest.calories} kcal?)" if closest else "")
+                for name, closest in unknown
+            ]
+            await ctx.send("❌ I don't know the calories of:\n" + "\n".join(lines) +
+                           "\nUse the exact name of a food you logged, or add `= kcal` after it, e.g. `olive oil = 120`.")
+            return
+        recipe, updated = await recipe_book.save_recipe(user_id_str, name, servings, items)
+        await ctx.send(embed=build_recipe_embed(recipe, recipe_book.recipe_items(user_id_str, recipe), updated))
+    
+    elif action in ("show", "remove", "delete"):
+        recipe = recipe_book.recipe(user_id_str, text or "")
+        if not recipe:
+            await ctx.send(f"❌ No recipe called '{text}'. Use `!recipe` to see yours.")
+            return
+        if action == "show":
+            await ctx.send(embed=build_recipe_embed(recipe, recipe_book.recipe_items(user_id_str, recipe)))
+        else:
+            await recipe_book.remove_recipe(user_id_str, recipe["name"])
+            await ctx.send(f"🗑️ Removed the recipe **{recipe['name']}**.")
+    
+    elif action == "ingredient":
+        parts = (text or "").rsplit(maxsplit=1)
+        if len(parts) != 2 or not parts[1].isdigit() or int(parts[1]) <= 0:
+            await ctx.send("❌ Please give the ingredient and its kcal per portion, e.g. `!recipe ingredient olive oil 120`")
+            return
+        updated = await recipe_book.set_ingredient(user_id_str, parts[0], int(parts[1]))
+        message = f"✅ **{parts[0]}** is now {int(parts[1])} kcal per portion."
+        if updated:
+            message += f" Updated: {', '.join(updated)}."
+        await ctx.send(message)
+    
+    else:
+        await ctx.send(embed=build_recipe_list_embed(ctx.author.display_name, recipe_book.recipes(user_id_str)))
+
+@bot.command(name='eat')
+async def eat_recipe(ctx, *, text: str):
+    """Log servings of one of your recipes: !eat chili 2 (no AI call needed)"""
+    try:
+        name, servings = parse_servings(text)
+    except ValueError as e:
+        await ctx.send(f"❌ {e}")
+        return
+    recipe = recipe_book.recipe(str(ctx.author.id), name)
+    if not recipe:
+        await ctx.send(f"❌ No recipe called '{name}'. Add it with `!recipe add {name}: <ingredients>`.")
+        return
+    
+    try:
+        calories = serving_calories(recipe, servings)
+    except ValueError as e:
+        await ctx.send(f"❌ {e}")
+        return
+    food_name = recipe["name"] if servings == 1 else f"{recipe['name']} ({servings:g} servings)"
+    total_today = await add_user_calories(ctx.author.id, calories, food_name)
+    await ctx.send(embed=build_calories_added_embed(calories, food_name, total_today, ctx.author.display_name))
+
 @bot.command(name='today', aliases=['daily', 'calories'])
 async def view_today_calories(ctx):
     """View your calories for today"""
     daily_data = get_user_daily_calories(ctx.author.id)
-    total_calories = daily_data["total_calories"]
-    foods = daily_data["foods"]
+    await ctx.send(embed=build_today_embed(ctx.author.display_name, daily_data))
+
+@bot.command(name='month', aliases=['monthly'])
+async def month_report(ctx, month: str = None):
+    """Daily totals for a month (default: this month): !month 2025-06"""
+    month = month or date.today().isoformat()[:7]
+    try:
+        if len(month) != 7:
+            raise ValueError
+        start, end = parse_day_range(month, date.today())
+    except ValueError:
+        await ctx.send("❌ Please give the month as YYYY-MM, e.g. `!month 2025-06`")
+        return
     
-    embed = discord.Embed(
-        title=f"📊 {ctx.author.display_name}'s Calories Today",
-        description=f"**Total: {total_calories} kcal**",
-        color=0x0099ff
-    )
+    user_id_str = str(ctx.author.id)
+    # Held so a day being compacted isn't counted both in memory and in the summaries
+    async with user_locks.hold(user_id_str):
+        refresh_user_data(user_id_str)
+        days = {
+            day: (day_log.total_calories, len(day_log.foods))
+            for day, day_log in hot_days(user_calories.get(user_id_str, {}), start, end) if day_log.foods
+        }
+        # Archived days come from their summaries, without opening the month's archive
+        if retention.enabled:
+            for day, summary in cold_archive.summaries(user_id_str).items():
+                if start.isoformat() <= day <= end.isoformat():
+                    total, count = days.get(day, (0, 0))
+                    days[day] = (total + summary["total_calories"], count + summary["entries"])
+    await ctx.send(embed=build_month_embed(ctx.author.display_name, month, days))
+
+@bot.command(name='digest', aliases=['summary'])
+async def daily_digest(ctx, action: str = None, value: str = None):
+    """Opt in to an end-of-day summary: !digest on | here | goal <kcal> | off | channel [off]"""
+    user_id_str = str(ctx.author.id)
+    action = (action or "").lower()
     
-    if foods:
-        food_list = []
-        # Show last 10 entries with numbers for easy reference
-        display_foods = foods[-10:]
-        start_index = max(0, len(foods) - 10)
-        
-        for i, food in enumerate(display_foods, start=start_index + 1):
-            time_str = datetime.fromisoformat(food["timestamp"]).strftime("%H:%M")
-            food_list.append(f"`{i}.` `{time_str}` **{food['name']}** - {food['calories']} kcal")
-        
-        embed.add_field(
-            name="🍽️ Recent Foods",
-            value="\n".join(food_list),
-            inline=False
-        )
-        
-        if len(foods) > 10:
-            embed.set_footer(text=f"Showing last 10 of {len(foods)} entries • Use !history for all entries • Use !remove <#> to delete entries")
+    if action in ("on", "dm"):
+        try:
+            dm_channel = ctx.author.dm_channel or await ctx.author.create_dm()
+        except discord.HTTPException:
+            await ctx.send("❌ I couldn't open a DM with you. Please allow direct messages from server members.")
+            return
+        await digest_settings.subscribe(user_id_str, DM, dm_channel.id)
+        await ctx.send(f"✅ You'll get a summary of your day by DM at {DIGEST_TIME}.")
+    
+    elif action == "here":
+        if not ctx.guild:
+            await ctx.send("❌ Use `!digest here` in a server to join its daily roll-up.")
+            return
+        await digest_settings.subscribe(user_id_str, GUILD, ctx.guild.id)
+        if digest_settings.guild_channel(str(ctx.guild.id)):
+            await ctx.send(f"✅ You'll be included in **{ctx.guild.name}**'s daily roll-up at {DIGEST_TIME}.")
+        else:
+            await ctx.send(f"✅ You're in **{ctx.guild.name}**'s daily roll-up. A server manager still needs to pick a channel with `!digest channel`.")
+    
+    elif action == "goal":
+        if not value or not value.isdigit() or int(value) <= 0:
+            await ctx.send("❌ Please give your daily goal in kcal, e.g. `!digest goal 2000`")
+            return
+        await digest_settings.set_goal(user_id_str, int(value))
+        leaderboards.user_changed(user_id_str)
+        await ctx.send(f"🎯 Daily goal set to **{int(value)} kcal**.")
+    
+    elif action == "off":
+        if await digest_settings.unsubscribe(user_id_str):
+            await ctx.send("✅ Daily summaries turned off.")
+        else:
+            await ctx.send("❌ You're not signed up for daily summaries.")
+    
+    elif action == "channel":
+        if not ctx.guild or not ctx.author.guild_permissions.manage_guild:
+            await ctx.send("❌ You need the Manage Server permission to set the roll-up channel.")
+            return
+        if value and value.lower() == "off":
+            await digest_settings.set_guild_channel(str(ctx.guild.id), None)
+            await ctx.send("✅ Daily roll-ups turned off for this server.")
         else:
-            embed.set_footer(text="Use !remove <#> to delete entries • Use !history for detailed view")
+            await digest_settings.set_guild_channel(str(ctx.guild.id), ctx.channel.id)
+            await ctx.send(f"✅ The daily roll-up will be posted in {ctx.channel.mention} at {DIGEST_TIME}.")
+    
     else:
+        settings = digest_settings.user(user_id_str)
+        embed = discord.Embed(
+            title="🌙 Daily Summary",
+            description=f"An end-of-day summary of your calories, sent at {DIGEST_TIME}.",
+            color=0x0099ff
+        )
+        if settings and settings["mode"]:
+            where = "By DM" if settings["mode"] == DM else "In this server's roll-up"
+            embed.add_field(name="Status", value=f"✅ {where}", inline=True)
+        else:
+            embed.add_field(name="Status", value="Off", inline=True)
+        goal = digest_settings.goal(user_id_str)
+        embed.add_field(name="🎯 Goal", value=f"{goal} kcal" if goal else "Not set", inline=True)
         embed.add_field(
-            name="🍽️ No foods logged today",
-            value="Use `!addcalories` or analyze food images to start tracking!",
+            name="Commands",
+            value="`!digest on` - DM me my summary\n`!digest here` - join this server's roll-up\n"
+                  "`!digest goal <kcal>` - set a daily goal\n`!digest off` - stop summaries\n"
+                  "`!digest channel [off]` - post this server's roll-up here (Manage Server)",
             inline=False
         )
+        await ctx.send(embed=embed)
+
+@bot.command(name='leaderboard', aliases=['lb', 'top'])
+async def leaderboard(ctx, board: str = STREAK):
+    """Server rankings: !leaderboard [streak|consistency|goal], or !leaderboard join/leave"""
+    if not ctx.guild:
+        await ctx.send("❌ Leaderboards are per server, use this command in a server.")
+        return
+    guild_id_str = str(ctx.guild.id)
+    user_id_str = str(ctx.author.id)
+    board = board.lower()
     
-    await ctx.send(embed=embed)
+    if board == "join":
+        if await leaderboards.join(guild_id_str, user_id_str):
+            await ctx.send(f"✅ You're on **{ctx.guild.name}**'s leaderboard. Use `!leaderboard leave` to leave it.")
+        else:
+            await ctx.send("ℹ️ You're already on this server's leaderboard.")
+        return
+    if board == "leave":
+        if await leaderboards.leave(guild_id_str, user_id_str):
+            await ctx.send("✅ You've left this server's leaderboard.")
+        else:
+            await ctx.send("ℹ️ You're not on this server's leaderboard.")
+        return
+    if board not in METRICS:
+        await ctx.send(f"❌ Unknown leaderboard. Choose one of: {', '.join(METRICS)} (or `join` / `leave`).")
+        return
+    
+    top = leaderboards.top(guild_id_str, board)
+    standing = leaderboards.standing(guild_id_str, board, user_id_str)
+    await ctx.send(embed=build_leaderboard_embed(ctx.guild.name, board, top, standing))
 
 @bot.command(name='reset', aliases=['clear'])
 async def reset_today_calories(ctx):
     """Reset your calories for today (with confirmation)"""
+    user_id_str = str(ctx.author.id)
+    today = str(date.today())
     daily_data = get_user_daily_calories(ctx.author.id)
     
-    if daily_data["total_calories"] == 0:
+    if daily_data.total_calories == 0:
         await ctx.send("❌ You have no calories logged for today!")
         return
     
+    # Only the entries shown in the prompt are reset, anything logged while waiting is kept
+    entry_ids = {food.id for food in daily_data.foods}
+    
     embed = discord.Embed(
         title="⚠️ Reset Today's Calories?",
-        description=f"Are you sure you want to reset your **{daily_data['total_calories']} kcal** for today?",
+        description=f"Are you sure you want to reset your **{daily_data.total_calories} kcal** for today?",
         color=0xff9900
     )
     embed.add_field(
@@ -329,16 +1110,31 @@ async def reset_today_calories(ctx):
         
         if str(reaction.emoji) == "✅":
             # Reset user's data for today
-            user_id_str = str(ctx.author.id)
-            today = str(date.today())
-            
-            if user_id_str in user_calories and today in user_calories[user_id_str]:
-                del user_calories[user_id_str][today]
-                save_calories_data()
+            kept_foods = []
+            async with editing_user(user_id_str):
+                day_data = user_calories.get(user_id_str, {}).get(today)
+                if day_data:
+                    kept_foods = [food for food in day_data.foods if food.id not in entry_ids]
+                    for entry_id in entry_ids:
+                        entry_index.discard(user_id_str, entry_id)
+                    if kept_foods:
+                        day_data.foods = kept_foods
+                        day_data.total_calories = sum(food.calories for food in kept_foods)
+                        day_data.recount_macros()
+                    else:
+                        del user_calories[user_id_str][today]
+                    await save_user_data(user_id_str)
+                    leaderboards.user_changed(user_id_str)
+                    food_suggestions.forget(user_id_str)
             
+            if kept_foods:
+                description = (f"Your calories for today have been reset. {len(kept_foods)} "
+                               f"entries logged while confirming were kept ({day_data.total_calories} kcal).")
+            else:
+                description = "Your calories for today have been reset to 0."
             embed = discord.Embed(
                 title="✅ Calories Reset",
-                description="Your calories for today have been reset to 0.",
+                description=description,
                 color=0x00ff00
             )
             await message.edit(embed=embed)
@@ -372,15 +1168,25 @@ async def calorie_help(ctx):
     
     commands_list = [
         (f"{COMMAND_PREFIX}addcalories <calories> [food_name]", "Add calories for a food item"),
+        (f"{COMMAND_PREFIX}quick <food>", "Log a food from your history again (no AI needed)"),
+        (f"{COMMAND_PREFIX}fav", "Your most logged foods with one-click logging"),
+        (f"{COMMAND_PREFIX}recipe [add|show|remove|ingredient]", "Save home-cooked meals from their ingredients"),
+        (f"{COMMAND_PREFIX}eat <recipe> [servings]", "Log servings of a saved recipe (no AI needed)"),
         (f"{COMMAND_PREFIX}today", "View your calories for today"),
-        (f"{COMMAND_PREFIX}history", "View all your calorie entries for today"),
-        (f"{COMMAND_PREFIX}remove <#>", "Remove a specific calorie entry by number"),
-        (f"{COMMAND_PREFIX}edit <#> <calories> [new_name]", "Edit a calorie entry"),
+        (f"{COMMAND_PREFIX}history [YYYY-MM-DD]", "View all your calorie entries for today or a past day"),
+        (f"{COMMAND_PREFIX}month [YYYY-MM]", "Daily totals for a month, including archived days"),
+        (f"{COMMAND_PREFIX}remove <# or ID>", "Remove a calorie entry by today's number or its ID"),
+        (f"{COMMAND_PREFIX}edit <# or ID> <calories> [new_name]", "Edit a calorie entry (IDs also reach past days)"),
         (f"{COMMAND_PREFIX}reset", "Reset your calories for today (with confirmation)"),
+        (f"{COMMAND_PREFIX}export [range] [csv|jsonl]", "Download your entries (e.g. `all`, `30d`, `2025-06`)"),
+        (f"{COMMAND_PREFIX}import", "Add entries from an attached CSV/JSONL export"),
+        (f"{COMMAND_PREFIX}digest [on|here|goal|off]", "Opt in to an end-of-day summary by DM or in a server roll-up"),
+        (f"{COMMAND_PREFIX}leaderboard [streak|consistency|goal|join|leave]", "Server rankings for members who joined"),
         (f"{COMMAND_PREFIX}analyzeimage", "Analyze food image for calories (attach image)"),
         (f"{COMMAND_PREFIX}analyzefood [description]", "Enhanced analysis with measurements (e.g., '350g chicken')"),
         (f"{COMMAND_PREFIX}estimate <description>", "Text-only calorie estimation (no image needed)"),
-        (f"{COMMAND_PREFIX}testapi", "Test if Gemini AI is working properly"),
+        (f"{COMMAND_PREFIX}testapi [gemini|local]", "Test if the AI model is working properly"),
+        (f"{COMMAND_PREFIX}usage", "AI tokens and cost used by you and this server"),
         (f"{COMMAND_PREFIX}ping", "Check bot responsiveness"),
         (f"{COMMAND_PREFIX}info", "Show bot information"),
     ]
@@ -391,7 +1197,7 @@ async def calorie_help(ctx):
     # Add reaction instructions
     embed.add_field(
         name="🔥 Quick Logging",
-        value="After AI analysis, react with ✅ to add calories or ❌ to decline",
+        value="After AI analysis, click ✅ to add calories or ❌ to decline",
         inline=False
     )
         
@@ -405,26 +1211,41 @@ async def calorie_help(ctx):
     else:
         embed.add_field(
             name="🤖 AI Image Analysis", 
-            value="❌ Unavailable - Gemini API key not configured", 
+            value="❌ Unavailable - No AI model configured", 
             inline=False
         )
     
     await ctx.send(embed=embed)
 
+@bot.command(name='usage')
+async def usage_report(ctx):
+    """AI tokens and cost you (and this server) used today and over the last 7 and 30 days"""
+    periods = {"Today": 1, "7 days": 7, "30 days": 30}
+    user_id_str = str(ctx.author.id)
+    user_rows = {label: usage_ledger.totals(USERS, user_id_str, days) for label, days in periods.items()}
+    guild_rows = None
+    if ctx.guild:
+        guild_rows = {label: usage_ledger.totals(GUILDS, str(ctx.guild.id), days) for label, days in periods.items()}
+    embed = build_usage_embed(
+        ctx.author.display_name, user_rows, USAGE_USER_DAILY_BUDGET, budget_mode(ctx.author, ctx.guild),
+        ctx.guild.name if ctx.guild else None, guild_rows, USAGE_GUILD_DAILY_BUDGET
+    )
+    await ctx.send(embed=embed)
+
 # API Test Command
 @bot.command(name='testapi', aliases=['test'])
-async def test_api(ctx):
-    """Test if the Gemini API is working properly"""
-    thinking_msg = await ctx.send("🧪 Testing Gemini API connection...")
+async def test_api(ctx, backend: str = None):
+    """Test if the AI model is working properly"""
+    thinking_msg = await ctx.send("🧪 Testing AI model connection...")
     
     try:
-        result = await test_gemini_api()
+        result = await test_gemini_api(backend.lower() if backend else None)
         await thinking_msg.delete()
         
         if result["status"] == "success":
             embed = discord.Embed(
                 title="✅ API Test Successful",
-                description="Gemini AI is working correctly!",
+                description=f"{result['backend'].capitalize()} AI is working correctly!",
                 color=0x00ff00
             )
             embed.add_field(
@@ -434,7 +1255,7 @@ async def test_api(ctx):
             )
             embed.add_field(
                 name="Status",
-                value="🟢 Ready for image analysis",
+                value=f"🟢 Ready for image analysis (answered in {result['latency']:.1f}s)",
                 inline=False
             )
         else:
@@ -479,7 +1300,7 @@ async def analyze_image(ctx):
     
     # Check if image analysis is available
     if not is_image_analysis_available():
-        await ctx.send("❌ Image analysis is not available. The bot administrator needs to configure the Gemini API key.")
+        await ctx.send("❌ Image analysis is not available. The bot administrator needs to configure a Gemini API key or a local model.")
         return
     
     # Check if an image was attached
@@ -511,128 +1332,40 @@ async def analyze_image(ctx):
         await ctx.send("❌ Image file is too large. Please use an image smaller than 10MB.")
         return
     
-    # Send thinking message
-    thinking_msg = await ctx.send("🤔 Analyzing your food image... This may take a few seconds.")
+    if not lifecycle.accepting:
+        await ctx.send(RESTARTING_MESSAGE)
+        return
     
-    try:
-        logger.info(f"Starting analysis for image: {attachment.filename}")
-        
-        # Analyze the image
-        result = await analyze_food_image(attachment.url)
-        
-        logger.info(f"Analysis completed, deleting thinking message")
-        
-        # Delete thinking message
-        await thinking_msg.delete()
-        
-        if result.get("error"):
+    # One message goes from the status text to the result with its buttons
+    analysis_msg = AnalysisMessage(ctx)
+    
+    async with lifecycle.track(lambda: analysis_msg.fail(build_analysis_error_embed(RESTARTING_MESSAGE))):
+        try:
+            await analysis_msg.analyzing("🤔 Analyzing your food image... This may take a few seconds.")
+            logger.info(f"Starting analysis for image: {attachment.filename}")
+            
+            # Analyze the image
+            result = await analyze_food_image(attachment.url, budget_mode(ctx.author, ctx.guild))
+            await record_usage(ctx.author, ctx.guild, result)
+            
+            if result.get("error"):
+                await analysis_msg.fail(build_analysis_error_embed(result["error"]))
+                return
+            
+            logger.info(f"Showing result for {result.get('food_name', 'Unknown')} - {result.get('calories', 0)} kcal")
+            
+            embed = build_image_analysis_embed(result, ctx.author.display_name, attachment.url)
+            await analysis_msg.show_result(embed, ConfirmCaloriesView())
+            pending_results.remember(analysis_msg.message.id, result)
+            
+        except Exception as e:
+            logger.error(f"Error in analyze_image command: {e}")
             embed = discord.Embed(
-                title="❌ Analysis Failed",
-                description=result["error"],
+                title="❌ Analysis Error",
+                description="An unexpected error occurred while analyzing the image. Please try again.",
                 color=0xff0000
             )
-            await ctx.send(embed=embed)
-            return
-        
-        logger.info(f"Creating result embed for {result.get('food_name', 'Unknown')} - {result.get('calories', 0)} kcal")
-        
-        # Create result embed
-        confidence = result.get("confidence", 0)
-        
-        # Choose color based on confidence
-        if confidence >= 80:
-            color = 0x00ff00  # Green - high confidence
-            confidence_emoji = "🎯"
-        elif confidence >= 60:
-            color = 0xffff00  # Yellow - medium confidence  
-            confidence_emoji = "⚠️"
-        else:
-            color = 0xff9900  # Orange - low confidence
-            confidence_emoji = "❓"
-        
-        embed = discord.Embed(
-            title=f"🍽️ Food Analysis Results",
-            description=f"**{result['food_name']}**",
-            color=color
-        )
-        
-        # Add calorie information
-        embed.add_field(
-            name="🔥 Estimated Calories",
-            value=f"**{result['calories']} kcal**",
-            inline=True
-        )
-        
-        embed.add_field(
-            name=f"{confidence_emoji} Confidence",
-            value=f"{confidence}%",
-            inline=True
-        )
-        
-        embed.add_field(
-            name="📏 Portion Size",
-            value=result.get('portion_size', 'Unknown'),
-            inline=True
-        )
-        
-        # Add nutritional information if available
-        nutrition = result.get('nutritional_info', {})
-        if nutrition:
-            nutrition_text = []
-            for nutrient, amount in nutrition.items():
-                if amount and str(amount) != "0":
-                    nutrition_text.append(f"**{nutrient.title()}:** {amount}")
-            
-            if nutrition_text:
-                embed.add_field(
-                    name="📊 Nutritional Info",
-                    value="\n".join(nutrition_text),
-                    inline=False
-                )
-        
-        # Add health notes if available
-        health_notes = result.get('health_notes', '')
-        if health_notes:
-            embed.add_field(
-                name="💡 Health Notes",
-                value=health_notes,
-                inline=False
-            )
-          # Add footer with disclaimer and reaction instructions
-        embed.set_footer(
-            text=f"Analyzed by {ctx.author.display_name} • React with ✅ to log calories • Estimates may vary - consult nutritional labels for accuracy"
-        )
-        
-        # Add thumbnail with the analyzed image
-        embed.set_thumbnail(url=attachment.url)
-        
-        logger.info(f"Sending result message...")
-        
-        # Send the main result with embedded reactions
-        result_message = await ctx.send(embed=embed)
-        
-        logger.info(f"Result message sent, adding reactions...")
-        
-        # Add reaction buttons to the main message instead of creating a separate one
-        await result_message.add_reaction("✅")  # Yes, add calories
-        await result_message.add_reaction("❌")  # No, don't add
-        
-        logger.info(f"Reactions added successfully")
-        
-    except Exception as e:
-        # Delete thinking message if it still exists
-        try:
-            await thinking_msg.delete()
-        except:
-            pass
-        
-        logger.error(f"Error in analyze_image command: {e}")
-        embed = discord.Embed(
-            title="❌ Analysis Error",
-            description="An unexpected error occurred while analyzing the image. Please try again.",
-            color=0xff0000
-        )
-        await ctx.send(embed=embed)
+            await analysis_msg.fail(embed)
 
 # Enhanced AI Image Analysis Command with Description
 @bot.command(name='analyzefood', aliases=['afood', 'describe'])
@@ -641,7 +1374,7 @@ async def analyze_food_with_desc(ctx, *, description: str = None):
     
     # Check if image analysis is available
     if not is_image_analysis_available():
-        await ctx.send("❌ Image analysis is not available. The bot administrator needs to configure the Gemini API key.")
+        await ctx.send("❌ Image analysis is not available. The bot administrator needs to configure a Gemini API key or a local model.")
         return
     
     # Check if an image was attached
@@ -687,144 +1420,36 @@ async def analyze_food_with_desc(ctx, *, description: str = None):
         status_msg += f" with description: '{description[:50]}{'...' if len(description) > 50 else ''}'"
     status_msg += "... This may take a few seconds."
     
-    thinking_msg = await ctx.send(status_msg)
+    if not lifecycle.accepting:
+        await ctx.send(RESTARTING_MESSAGE)
+        return
     
-    try:
-        # Analyze the image with optional description
-        result = await analyze_food_with_description(attachment.url, description)
-        
-        # Delete thinking message
-        await thinking_msg.delete()
-        
-        if result.get("error"):
-            embed = discord.Embed(
-                title="❌ Analysis Failed",
-                description=result["error"],
-                color=0xff0000
-            )
-            await ctx.send(embed=embed)
-            return
-        
-        # Create enhanced result embed
-        confidence = result.get("confidence", 0)
-        
-        # Choose color based on confidence (enhanced accuracy should have higher confidence)
-        if confidence >= 85:
-            color = 0x00aa00  # Darker green - very high confidence
-            confidence_emoji = "🎯"
-        elif confidence >= 70:
-            color = 0x00ff00  # Green - high confidence
-            confidence_emoji = "✅"
-        elif confidence >= 50:
-            color = 0xffff00  # Yellow - medium confidence  
-            confidence_emoji = "⚠️"
-        else:
-            color = 0xff9900  # Orange - low confidence
-            confidence_emoji = "❓"
-        
-        # Title changes based on whether description was used
-        title = "🍽️ Enhanced Food Analysis Results" if result.get("user_description_used") else "🍽️ Food Analysis Results"
-        
-        embed = discord.Embed(
-            title=title,
-            description=f"**{result['food_name']}**",
-            color=color
-        )
-        
-        # Add calorie information
-        embed.add_field(
-            name="🔥 Estimated Calories",
-            value=f"**{result['calories']} kcal**",
-            inline=True
-        )
-        
-        embed.add_field(
-            name=f"{confidence_emoji} Confidence",
-            value=f"{confidence}%",
-            inline=True
-        )
-        
-        embed.add_field(
-            name="📏 Portion Size",
-            value=result.get('portion_size', 'Unknown'),
-            inline=True
-        )
-        
-        # Show if user description was used and accuracy
-        if result.get("user_description_used"):
-            description_accuracy = result.get("description_accuracy", "")
-            accuracy_emoji = {
-                "good": "✅",
-                "partial": "⚠️", 
-                "poor": "❌"
-            }.get(description_accuracy.lower(), "ℹ️")
+    analysis_msg = AnalysisMessage(ctx)
+    
+    async with lifecycle.track(lambda: analysis_msg.fail(build_analysis_error_embed(RESTARTING_MESSAGE))):
+        try:
+            await analysis_msg.analyzing(status_msg)
             
-            embed.add_field(
-                name="📝 Description Used",
-                value=f"{accuracy_emoji} {description_accuracy.title() if description_accuracy else 'Yes'} match with image",
-                inline=True
-            )
+            # Analyze the image with optional description
+            result = await analyze_food_with_description(attachment.url, description, budget_mode(ctx.author, ctx.guild))
+            await record_usage(ctx.author, ctx.guild, result)
             
-            embed.add_field(
-                name="💬 Your Description",
-                value=f"*{result.get('original_description', 'N/A')}*",
-                inline=False
-            )
-        
-        # Add nutritional information if available
-        nutrition = result.get('nutritional_info', {})
-        if nutrition:
-            nutrition_text = []
-            for nutrient, amount in nutrition.items():
-                if amount and str(amount) != "0":
-                    nutrition_text.append(f"**{nutrient.title()}:** {amount}")
+            if result.get("error"):
+                await analysis_msg.fail(build_analysis_error_embed(result["error"]))
+                return
             
-            if nutrition_text:
-                embed.add_field(
-                    name="📊 Nutritional Info",
-                    value="\n".join(nutrition_text),
-                    inline=False
-                )
-        
-        # Add health notes if available
-        health_notes = result.get('health_notes', '')
-        if health_notes:
-            embed.add_field(
-                name="💡 Health Notes",
-                value=health_notes,
-                inline=False
+            embed = build_enhanced_analysis_embed(result, ctx.author.display_name, attachment.url)
+            await analysis_msg.show_result(embed, ConfirmCaloriesView())
+            pending_results.remember(analysis_msg.message.id, result)
+            
+        except Exception as e:
+            logger.error(f"Error in analyze_food_with_desc command: {e}")
+            embed = discord.Embed(
+                title="❌ Analysis Error",
+                description="An unexpected error occurred while analyzing the image. Please try again.",
+                color=0xff0000
             )
-          # Enhanced footer with reaction instructions
-        footer_text = f"Analyzed by {ctx.author.display_name}"
-        if result.get("user_description_used"):
-            footer_text += " • Enhanced with description"
-        footer_text += " • React with ✅ to log calories • Estimates may vary - consult nutritional labels for accuracy"
-        embed.set_footer(text=footer_text)
-        
-        # Add thumbnail with the analyzed image
-        embed.set_thumbnail(url=attachment.url)
-        
-        # Send the main result with embedded reactions
-        result_message = await ctx.send(embed=embed)
-        
-        # Add reaction buttons to the main message instead of creating a separate one
-        await result_message.add_reaction("✅")  # Yes, add calories
-        await result_message.add_reaction("❌")  # No, don't add
-        
-    except Exception as e:
-        # Delete thinking message if it still exists
-        try:
-            await thinking_msg.delete()
-        except:
-            pass
-        
-        logger.error(f"Error in analyze_food_with_desc command: {e}")
-        embed = discord.Embed(
-            title="❌ Analysis Error",
-            description="An unexpected error occurred while analyzing the image. Please try again.",
-            color=0xff0000
-        )
-        await ctx.send(embed=embed)
+            await analysis_msg.fail(embed)
 
 # Text-only food analysis command
 @bot.command(name='estimate', aliases=['calc'])
@@ -835,7 +1460,7 @@ async def estimate_calories(ctx, *, description: str):
     
     # Check if image analysis is available (we use the same API)
     if not is_image_analysis_available():
-        await ctx.send("❌ Calorie estimation is not available. The bot administrator needs to configure the Gemini API key.")
+        await ctx.send("❌ Calorie estimation is not available. The bot administrator needs to configure a Gemini API key or a local model.")
         return
     
     if not description.strip():
@@ -857,213 +1482,201 @@ async def estimate_calories(ctx, *, description: str):
         await ctx.send(embed=embed)
         return
     
-    thinking_msg = await ctx.send(f"🤔 Analyzing food description: '{description[:100]}{'...' if len(description) > 100 else ''}'")
+    if not lifecycle.accepting:
+        await ctx.send(RESTARTING_MESSAGE)
+        return
+    
+    analysis_msg = AnalysisMessage(ctx)
     
-    try:
-        # Use Gemini for text-only analysis
-        import google.generativeai as genai
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        
-        prompt = f"""
-        Analyze this food description and provide nutritional breakdown: "{description}"
-
-        Please respond in this exact JSON format:
-
-        {{
-            "food_name": "summary of the food items mentioned",
-            "estimated_calories": number (total calories for all items described),
-            "confidence": number between 0-100 (confidence in text-based estimation),
-            "portion_size": "summary of portions mentioned",
-            "analysis_method": "text-only",
-            "nutritional_info": {{
-                "protein": "amount in grams",
-                "carbohydrates": "amount in grams", 
-                "fat": "amount in grams",
-                "fiber": "amount in grams",
-                "sugar": "amount in grams"
-            }},
-            "health_notes": "brief nutritional assessment",
-            "interpretation": "how you interpreted the user's description"
-        }}
-
-        Guidelines:
-        - Base calculations on standard nutritional databases (USDA, etc.)
-        - If measurements are vague, estimate standard portions
-        - Consider cooking methods for calorie adjustments
-        - Be conservative with confidence if description is unclear
-        - Note any assumptions made in the interpretation field
-        """
-        
-        response = model.generate_content(prompt)
-        response_text = response.text.strip()
-        
-        # Delete thinking message
-        await thinking_msg.delete()
-        
-        # Parse JSON response
-        import json
+    async with lifecycle.track(lambda: analysis_msg.fail(build_analysis_error_embed(RESTARTING_MESSAGE))):
         try:
-            if "```json" in response_text:
-                json_start = response_text.find("```json") + 7
-                json_end = response_text.find("```", json_start)
-                json_text = response_text[json_start:json_end].strip()
-            elif "{" in response_text and "}" in response_text:
-                json_start = response_text.find("{")
-                json_end = response_text.rfind("}") + 1
-                json_text = response_text[json_start:json_end]
-            else:
-                json_text = response_text
+            await analysis_msg.analyzing(f"🤔 Analyzing food description: '{description[:100]}{'...' if len(description) > 100 else ''}'")
+            budget = budget_mode(ctx.author, ctx.guild)
+            result = estimate_from_known_foods(str(ctx.author.id), description) if budget != NORMAL else None
+            if result is None:
+                result = await estimate_food_from_text(description, budget)
+                await record_usage(ctx.author, ctx.guild, result)
             
-            result = json.loads(json_text)
-            
-            # Create result embed
-            confidence = result.get("confidence", 0)
-            
-            # Color based on confidence
-            if confidence >= 75:
-                color = 0x00ff00  # Green
-                confidence_emoji = "✅"
-            elif confidence >= 50:
-                color = 0xffff00  # Yellow
-                confidence_emoji = "⚠️"
-            else:
-                color = 0xff9900  # Orange
-                confidence_emoji = "❓"
-            
-            embed = discord.Embed(
-                title="📝 Text-based Calorie Estimation",
-                description=f"**{result['food_name']}**",
-                color=color
-            )
-            
-            embed.add_field(
-                name="🔥 Estimated Calories",
-                value=f"**{result['estimated_calories']} kcal**",
-                inline=True
-            )
-            
-            embed.add_field(
-                name=f"{confidence_emoji} Confidence",
-                value=f"{confidence}%",
-                inline=True
-            )
-            
-            embed.add_field(
-                name="📏 Portion Summary",
-                value=result.get('portion_size', 'See description'),
-                inline=True
-            )
-            
-            embed.add_field(
-                name="💭 Your Description",
-                value=f"*{description}*",
-                inline=False
-            )
-            
-            # Add interpretation if available
-            interpretation = result.get('interpretation', '')
-            if interpretation:
-                embed.add_field(
-                    name="🧠 AI Interpretation",
-                    value=interpretation,
-                    inline=False
+            if result.get("error"):
+                embed = discord.Embed(
+                    title="❌ Estimation Failed",
+                    description=result["error"],
+                    color=0xff0000
                 )
+                await analysis_msg.fail(embed)
+                return
             
-            # Add nutritional info
-            nutrition = result.get('nutritional_info', {})
-            if nutrition:
-                nutrition_text = []
-                for nutrient, amount in nutrition.items():
-                    if amount and str(amount) != "0":
-                        nutrition_text.append(f"**{nutrient.title()}:** {amount}")
+            embed = build_estimate_embed(result, description, ctx.author.display_name)
+            await analysis_msg.show_result(embed, ConfirmCaloriesView())
+            pending_results.remember(analysis_msg.message.id, result)
                 
-                if nutrition_text:
-                    embed.add_field(
-                        name="📊 Nutritional Info",
-                        value="\n".join(nutrition_text),
-                        inline=False
-                    )
-              # Add health notes
-            health_notes = result.get('health_notes', '')
-            if health_notes:
-                embed.add_field(
-                    name="💡 Health Notes",
-                    value=health_notes,
-                    inline=False
-                )
-            
-            embed.set_footer(text=f"Text-based analysis by {ctx.author.display_name} • React with ✅ to log calories • For better accuracy, use !analyzefood with an image")
-            
-            # Send the main result
-            result_message = await ctx.send(embed=embed)
-            
-            # Add reaction buttons to the main message instead of creating a separate one
-            await result_message.add_reaction("✅")  # Yes, add calories
-            await result_message.add_reaction("❌")  # No, don't add
-            
-        except json.JSONDecodeError:
+        except Exception as e:
+            logger.error(f"Error in estimate_calories command: {e}")
             embed = discord.Embed(
-                title="❌ Analysis Error",
-                description="Could not parse the analysis results. Please try rephrasing your description.",
+                title="❌ Estimation Error",
+                description="An error occurred while analyzing your description. Please try again.",
                 color=0xff0000
             )
-            await ctx.send(embed=embed)
-            
-    except Exception as e:
-        try:
-            await thinking_msg.delete()
-        except:
-            pass
-        
-        logger.error(f"Error in estimate_calories command: {e}")
-        embed = discord.Embed(
-            title="❌ Estimation Error",
-            description="An error occurred while analyzing your description. Please try again.",
-            color=0xff0000
-        )
-        await ctx.send(embed=embed)
+            await analysis_msg.fail(embed)
 
-@bot.command(name='remove', aliases=['delete', 'del'])
-async def remove_calorie_entry(ctx, entry_number: int):
-    """Remove a specific calorie entry by number (use !today to see numbers)"""
-    user_id_str = str(ctx.author.id)
-    today = str(date.today())
-    
-    # Check if user has any entries today
-    if user_id_str not in user_calories or today not in user_calories[user_id_str]:
-        await ctx.send("❌ You have no calorie entries for today!")
+EXPORT_FALLBACK_SIZE_LIMIT = 8 * 1024 * 1024  # Upload limit outside servers
+IMPORT_MAX_BYTES = 25 * 1024 * 1024
+IMPORT_BATCH_SIZE = 1000
+
+@bot.command(name='export')
+async def export_history(ctx, date_range: str = "all", file_format: str = "csv"):
+    """Download your entries: !export [all|7d|2025-06|2025-06-01..2025-06-30] [csv|jsonl]"""
+    # Allow just a format, e.g. !export jsonl
+    if date_range.lower() in FORMATS:
+        date_range, file_format = "all", date_range
+    file_format = file_format.lower()
+    if file_format not in FORMATS:
+        await ctx.send("❌ Format must be `csv` or `jsonl`.")
+        return
+    try:
+        start, end = parse_day_range(date_range, date.today())
+    except ValueError:
+        await ctx.send("❌ Range must be `all`, a number of days like `30d`, a month like `2025-06`, a day, or `2025-06-01..2025-06-30`.")
         return
     
-    foods = user_calories[user_id_str][today]["foods"]
-    
-    # Check if entry number is valid
-    if entry_number < 1 or entry_number > len(foods):
-        await ctx.send(f"❌ Invalid entry number! You have {len(foods)} entries. Use `!today` to see them.")
+    user_id_str = str(ctx.author.id)
+    refresh_user_data(user_id_str)
+    size_limit = ctx.guild.filesize_limit if ctx.guild else EXPORT_FALLBACK_SIZE_LIMIT
+    
+    # Entries are streamed row by row into a temporary file, never built up in memory.
+    # Long histories take a moment, so this runs in a thread while the user's lock
+    # keeps their entries from changing underneath it.
+    with tempfile.TemporaryFile() as export_file:
+        async with user_locks.hold(user_id_str):
+            entries = iter_entries(user_days(user_id_str, start, end))
+            count = await asyncio.get_running_loop().run_in_executor(None, write_entries, entries, export_file, file_format)
+        if count == 0:
+            await ctx.send("❌ You have no entries in that range.")
+            return
+        if export_file.tell() > size_limit:
+            await ctx.send("❌ That export is too large to upload. Please choose a smaller range, e.g. `!export 2025-06`.")
+            return
+        export_file.seek(0)
+        
+        filename = f"calories-{date_range.replace('..', '_to_')}.{file_format}"
+        message = f"📦 {count} entries ({date_range})"
+        # History is personal, so exports requested in a server go to DMs
+        try:
+            if ctx.guild:
+                await ctx.author.send(message, file=discord.File(export_file, filename=filename))
+                await ctx.send(f"📬 {ctx.author.mention}, your export is in your DMs.")
+            else:
+                await ctx.send(message, file=discord.File(export_file, filename=filename))
+        except discord.Forbidden:
+            await ctx.send("❌ I couldn't DM you the export. Please allow direct messages from server members, or run `!export` in a DM with me.")
+
+@bot.command(name='import')
+async def import_history(ctx):
+    """Add entries from a CSV or JSONL file (same columns as !export), attached to the message"""
+    if not ctx.message.attachments:
+        await ctx.send(f"❌ Attach a `.csv` or `.jsonl` file with columns {', '.join(['date', 'time', 'food', 'calories'])} (as produced by `{COMMAND_PREFIX}export`).")
+        return
+    attachment = ctx.message.attachments[0]
+    file_format = attachment.filename.lower().rsplit('.', 1)[-1]
+    if file_format not in FORMATS:
+        await ctx.send("❌ Please attach a `.csv` or `.jsonl` file.")
+        return
+    if attachment.size > IMPORT_MAX_BYTES:
+        await ctx.send("❌ Import files are limited to 25MB, please split it up.")
         return
     
-    # Get the entry to remove (convert to 0-based index)
-    entry_to_remove = foods[entry_number - 1]
-    removed_calories = entry_to_remove["calories"]
-    removed_food = entry_to_remove["name"]
+    user_id_str = str(ctx.author.id)
+    status = await ctx.send(f"📥 Importing `{attachment.filename}`...")
+    added = duplicates = invalid = 0
+    problems = []
+    
+    with tempfile.TemporaryFile() as source:
+        # Download in chunks so memory use doesn't grow with the file size
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.get(attachment.url) as response:
+                    response.raise_for_status()
+                    async for chunk in response.content.iter_chunked(64 * 1024):
+                        source.write(chunk)
+        except aiohttp.ClientError as e:
+            logger.error(f"Error downloading import file: {e}")
+            await status.edit(content="❌ Could not download the attached file. Please try again.")
+            return
+        source.seek(0)
+        
+        loop = asyncio.get_running_loop()
+        batches = validated_batches(source, file_format, IMPORT_BATCH_SIZE)
+        touched_days = set()
+        # The user is owned for the whole import and saved once at the end; other users' commands keep running
+        async with editing_user(user_id_str):
+            try:
+                while True:
+                    # Reading and validating run in a thread, only adding the rows runs on the loop
+                    batch = await loop.run_in_executor(None, next, batches, None)
+                    if batch is None:
+                        break
+                    rows, rejected = batch
+                    invalid += len(rejected)
+                    problems.extend(f"Line {line_number}: {reason}" for line_number, reason in rejected[:max(0, 10 - len(problems))])
+                    batch_added, batch_duplicates = import_entries(user_id_str, rows, touched_days)
+                    added += batch_added
+                    duplicates += batch_duplicates
+                    await asyncio.sleep(0)
+            except (UnicodeDecodeError, csv.Error) as e:
+                problems.append(f"Stopped reading the file: {e}")
+            
+            if added:
+                # Imported entries may be older than ones already logged that day
+                for day in touched_days:
+                    user_calories[user_id_str][day].foods.sort(key=lambda food: food.timestamp)
+                await save_user_data(user_id_str)
+                leaderboards.user_changed(user_id_str)
+                food_suggestions.forget(user_id_str)
     
-    # Remove the entry
-    foods.pop(entry_number - 1)
+    embed = discord.Embed(
+        title="📥 Import Finished" if added or duplicates else "❌ Nothing Imported",
+        color=0x00ff00 if added else 0xff9900
+    )
+    embed.add_field(name="Added", value=str(added), inline=True)
+    embed.add_field(name="Already present", value=str(duplicates), inline=True)
+    embed.add_field(name="Invalid rows", value=str(invalid), inline=True)
+    if problems:
+        embed.add_field(name="⚠️ Problems", value="\n".join(problems)[:1024], inline=False)
+    embed.set_footer(text=f"Imported for {ctx.author.display_name} • Use !history YYYY-MM-DD to check a day")
+    await status.edit(content=None, embed=embed)
+
+@bot.command(name='remove', aliases=['delete', 'del'])
+async def remove_calorie_entry(ctx, entry_ref: str):
+    """Remove a calorie entry by today's number or by entry ID (use !today or !history to see them)"""
+    user_id_str = str(ctx.author.id)
+    today = str(date.today())
     
-    # Update total calories
-    user_calories[user_id_str][today]["total_calories"] -= removed_calories
+    # Mutate while holding the user's lock, reply afterwards
+    async with editing_user(user_id_str):
+        found = resolve_entry(user_id_str, entry_ref)
+        if found:
+            day, entry_to_remove = found
+            new_total = remove_entry(user_id_str, day, entry_to_remove)
+            await save_user_data(user_id_str)
+            leaderboards.user_changed(user_id_str)
+            food_suggestions.forget(user_id_str)
+    
+    # Check if the entry number or ID is valid
+    if not found:
+        await ctx.send(entry_not_found_message(user_id_str, entry_ref))
+        return
     
-    # Save changes
-    save_calories_data()
+    removed_calories = entry_to_remove.calories
+    removed_food = entry_to_remove.name
     
     # Send confirmation
-    new_total = user_calories[user_id_str][today]["total_calories"]
     embed = discord.Embed(
         title="🗑️ Entry Removed",
-        description=f"Removed **{removed_food}** ({removed_calories} kcal)",
+        description=f"Removed **{removed_food}** ({removed_calories} kcal)" + (f" from {day}" if day != today else ""),
         color=0xff6b6b
     )
     embed.add_field(
-        name="📊 Updated Total",
+        name="📊 Updated Total" if day == today else f"📊 Updated Total ({day})",
         value=f"**{new_total} kcal**",
         inline=True
     )
@@ -1072,59 +1685,22 @@ async def remove_calorie_entry(ctx, entry_number: int):
     await ctx.send(embed=embed)
 
 @bot.command(name='history', aliases=['all', 'full'])
-async def view_full_history(ctx):
-    """View all your calorie entries for today"""
-    daily_data = get_user_daily_calories(ctx.author.id)
-    total_calories = daily_data["total_calories"]
-    foods = daily_data["foods"]
-    
-    embed = discord.Embed(
-        title=f"📈 {ctx.author.display_name}'s Full History Today",
-        description=f"**Total: {total_calories} kcal**",
-        color=0x9932cc
-    )
-    
-    if foods:
-        # Group foods into chunks to avoid Discord message limits
-        food_chunks = []
-        current_chunk = []
-        
-        for i, food in enumerate(foods, 1):
-            time_str = datetime.fromisoformat(food["timestamp"]).strftime("%H:%M")
-            entry = f"`{i}.` `{time_str}` **{food['name']}** - {food['calories']} kcal"
-            
-            # Check if adding this entry would exceed Discord's field limit
-            if len('\n'.join(current_chunk + [entry])) > 1000:
-                food_chunks.append(current_chunk)
-                current_chunk = [entry]
-            else:
-                current_chunk.append(entry)
-        
-        if current_chunk:
-            food_chunks.append(current_chunk)
-        
-        # Add fields for each chunk
-        for i, chunk in enumerate(food_chunks):
-            field_name = f"🍽️ Foods" if i == 0 else f"🍽️ Foods (continued {i+1})"
-            embed.add_field(
-                name=field_name,
-                value="\n".join(chunk),
-                inline=False
-            )
-        
-        embed.set_footer(text=f"Total: {len(foods)} entries • Use !remove <#> to delete entries")
-    else:
-        embed.add_field(
-            name="🍽️ No foods logged today",
-            value="Use `!addcalories` or analyze food images to start tracking!",
-            inline=False
-        )
+async def view_full_history(ctx, day: str = None):
+    """View all your calorie entries for today, or for a past day (YYYY-MM-DD)"""
+    if day:
+        try:
+            day = date.fromisoformat(day).isoformat()
+        except ValueError:
+            await ctx.send("❌ Please give the day as YYYY-MM-DD, e.g. `!history 2025-06-04`")
+            return
     
-    await ctx.send(embed=embed)
+    daily_data = get_user_daily_calories(ctx.author.id, day)
+    day_label = f"on {day}" if day and day != str(date.today()) else "Today"
+    await ctx.send(embed=build_history_embed(ctx.author.display_name, daily_data, day_label))
 
 @bot.command(name='edit', aliases=['modify'])
-async def edit_calorie_entry(ctx, entry_number: int, new_calories: int, *, new_food_name: str = None):
-    """Edit a calorie entry (use !today to see numbers)"""
+async def edit_calorie_entry(ctx, entry_ref: str, new_calories: int, *, new_food_name: str = None):
+    """Edit a calorie entry by today's number or by entry ID (use !today or !history to see them)"""
     user_id_str = str(ctx.author.id)
     today = str(date.today())
     
@@ -1133,41 +1709,41 @@ async def edit_calorie_entry(ctx, entry_number: int, new_calories: int, *, new_f
         await ctx.send("❌ Calories must be a positive number!")
         return
     
-    # Check if user has any entries today
-    if user_id_str not in user_calories or today not in user_calories[user_id_str]:
-        await ctx.send("❌ You have no calorie entries for today!")
-        return
-    
-    foods = user_calories[user_id_str][today]["foods"]
-    
-    # Check if entry number is valid
-    if entry_number < 1 or entry_number > len(foods):
-        await ctx.send(f"❌ Invalid entry number! You have {len(foods)} entries. Use `!today` to see them.")
+    # Mutate while holding the user's lock, reply afterwards
+    async with editing_user(user_id_str):
+        found = resolve_entry(user_id_str, entry_ref)
+        if found:
+            day, entry_to_edit = found
+            day_data = user_calories[user_id_str][day]
+            old_calories = entry_to_edit.calories
+            old_food_name = entry_to_edit.name
+            
+            # Update the entry; macros follow a portion change, a different food (or a 0 kcal one, with no
+            # portion to scale from) drops them
+            if (new_food_name and new_food_name != old_food_name) or not old_calories:
+                new_macros = None
+            else:
+                new_macros = scale_macros(entry_to_edit.macros, new_calories / old_calories)
+            day_data.update_food(entry_to_edit, new_calories, new_macros)
+            if new_food_name:
+                entry_to_edit.name = new_food_name
+            if day == today:
+                entry_to_edit.timestamp = int(time.time())  # Update timestamp
+            calorie_difference = new_calories - old_calories
+            await save_user_data(user_id_str)
+            leaderboards.user_changed(user_id_str)
+            food_suggestions.forget(user_id_str)
+    
+    # Check if the entry number or ID is valid
+    if not found:
+        await ctx.send(entry_not_found_message(user_id_str, entry_ref))
         return
     
-    # Get the entry to edit (convert to 0-based index)
-    entry_to_edit = foods[entry_number - 1]
-    old_calories = entry_to_edit["calories"]
-    old_food_name = entry_to_edit["name"]
-    
-    # Update the entry
-    entry_to_edit["calories"] = new_calories
-    if new_food_name:
-        entry_to_edit["name"] = new_food_name
-    entry_to_edit["timestamp"] = datetime.now().isoformat()  # Update timestamp
-    
-    # Update total calories
-    calorie_difference = new_calories - old_calories
-    user_calories[user_id_str][today]["total_calories"] += calorie_difference
-    
-    # Save changes
-    save_calories_data()
-    
     # Send confirmation
-    new_total = user_calories[user_id_str][today]["total_calories"]
+    new_total = day_data.total_calories
     embed = discord.Embed(
         title="✏️ Entry Updated",
-        description=f"**Entry #{entry_number}** has been updated",
+        description=f"**Entry `{entry_to_edit.id}`** has been updated" + (f" ({day})" if day != today else ""),
         color=0x00ff00
     )
     
@@ -1202,14 +1778,222 @@ async def edit_calorie_entry(ctx, entry_number: int, new_calories: int, *, new_f
     
     await ctx.send(embed=embed)
 
+# Slash commands. Analysis defers the interaction (one call) and answers with a
+# single follow-up that carries the ✅/❌ buttons, so no thinking message, no
+# reactions and no message_content intent are needed.
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif', '.webp']
+
+@bot.tree.command(name="analyze", description="Analyze a food image for calories and nutrition")
+@app_commands.describe(image="Photo of your food", description="Optional details, e.g. '350g chicken and salad'")
+async def slash_analyze(interaction: discord.Interaction, image: discord.Attachment, description: str = None):
+    if not is_image_analysis_available():
+        await interaction.response.send_message("❌ Image analysis is not available. The bot administrator needs to configure a Gemini API key or a local model.", ephemeral=True)
+        return
+    if not any(image.filename.lower().endswith(ext) for ext in IMAGE_EXTENSIONS):
+        await interaction.response.send_message("❌ Please attach a valid image file (JPG, PNG, GIF, or WEBP).", ephemeral=True)
+        return
+    if image.size > 10 * 1024 * 1024:  # 10MB limit
+        await interaction.response.send_message("❌ Image file is too large. Please use an image smaller than 10MB.", ephemeral=True)
+        return
+    
+    if not lifecycle.accepting:
+        await interaction.response.send_message(RESTARTING_MESSAGE, ephemeral=True)
+        return
+    
+    # Discord shows "thinking..." until the follow-up arrives (up to 15 minutes)
+    await interaction.response.defer(thinking=True)
+    async with lifecycle.track(lambda: interaction.followup.send(embed=build_analysis_error_embed(RESTARTING_MESSAGE))):
+        try:
+            budget = budget_mode(interaction.user, interaction.guild)
+            if description:
+                result = await analyze_food_with_description(image.url, description, budget)
+            else:
+                result = await analyze_food_image(image.url, budget)
+            await record_usage(interaction.user, interaction.guild, result)
+        except Exception as e:
+            logger.error(f"Error in /analyze: {e}")
+            result = {"error": "An unexpected error occurred while analyzing the image. Please try again."}
+        
+        if result.get("error"):
+            await interaction.followup.send(embed=build_analysis_error_embed(result["error"]))
+            return
+        
+        if description:
+            embed = build_enhanced_analysis_embed(result, interaction.user.display_name, image.url)
+        else:
+            embed = build_image_analysis_embed(result, interaction.user.display_name, image.url)
+        message = await interaction.followup.send(embed=embed, view=ConfirmCaloriesView(), wait=True)
+        pending_results.remember(message.id, result)
+
+@bot.tree.command(name="estimate", description="Estimate calories from a text description")
+@app_commands.describe(description="What you ate, e.g. '2 cups rice, 150g chicken breast'")
+async def slash_estimate(interaction: discord.Interaction, description: str):
+    if not is_image_analysis_available():
+        await interaction.response.send_message("❌ Calorie estimation is not available. The bot administrator needs to configure a Gemini API key or a local model.", ephemeral=True)
+        return
+    
+    if not lifecycle.accepting:
+        await interaction.response.send_message(RESTARTING_MESSAGE, ephemeral=True)
+        return
+    
+    await interaction.response.defer(thinking=True)
+    async with lifecycle.track(lambda: interaction.followup.send(embed=build_analysis_error_embed(RESTARTING_MESSAGE))):
+        try:
+            budget = budget_mode(interaction.user, interaction.guild)
+            result = estimate_from_known_foods(str(interaction.user.id), description) if budget != NORMAL else None
+            if result is None:
+                result = await estimate_food_from_text(description, budget)
+                await record_usage(interaction.user, interaction.guild, result)
+        except Exception as e:
+            logger.error(f"Error in /estimate: {e}")
+            result = {"error": "An error occurred while analyzing your description. Please try again."}
+        
+        if result.get("error"):
+            embed = discord.Embed(
+                title="❌ Estimation Failed",
+                description=result["error"],
+                color=0xff0000
+            )
+            await interaction.followup.send(embed=embed)
+            return
+        
+        embed = build_estimate_embed(result, description, interaction.user.display_name)
+        message = await interaction.followup.send(embed=embed, view=ConfirmCaloriesView(), wait=True)
+        pending_results.remember(message.id, result)
+
+@bot.tree.command(name="today", description="View your calories for today")
+async def slash_today(interaction: discord.Interaction):
+    daily_data = get_user_daily_calories(interaction.user.id)
+    await interaction.response.send_message(embed=build_today_embed(interaction.user.display_name, daily_data))
+
+@bot.tree.command(name="history", description="View all your calorie entries for today or a past day")
+@app_commands.describe(day="Day to show as YYYY-MM-DD (default: today)")
+async def slash_history(interaction: discord.Interaction, day: str = None):
+    if day:
+        try:
+            day = date.fromisoformat(day).isoformat()
+        except ValueError:
+            await interaction.response.send_message("❌ Please give the day as YYYY-MM-DD, e.g. `2025-06-04`", ephemeral=True)
+            return
+    
+    daily_data = get_user_daily_calories(interaction.user.id, day)
+    day_label = f"on {day}" if day and day != str(date.today()) else "Today"
+    await interaction.response.send_message(embed=build_history_embed(interaction.user.display_name, daily_data, day_label))
+
+async def food_autocomplete(interaction: discord.Interaction, current: str) -> list:
+    # Served from the in-memory trie, well inside the 3 second autocomplete window
+    trie = food_suggestions.trie(str(interaction.user.id))
+    foods = trie.search(current, limit=25) if current else trie.favorites(limit=25)
+    return [
+        app_commands.Choice(name=f"{food.name} • {food.calories} kcal ({food.count}×)"[:100], value=food.name[:100])
+        for food in foods
+    ]
+
+@bot.tree.command(name="log", description="Log a food from your history (or a new one with its calories)")
+@app_commands.describe(food="Start typing a food you've logged before", calories="Calories (default: what you logged last time)")
+@app_commands.autocomplete(food=food_autocomplete)
+async def slash_log(interaction: discord.Interaction, food: str, calories: int = None):
+    macros = None
+    if calories is None:
+        known = food_suggestions.trie(str(interaction.user.id)).exact(food)
+        if not known:
+            await interaction.response.send_message(f"❌ '{food}' isn't in your history yet, please give its calories.", ephemeral=True)
+            return
+        food, calories, macros = known.name, known.calories, known.macros
+    if calories <= 0:
+        await interaction.response.send_message("❌ Calories must be a positive number!", ephemeral=True)
+        return
+    
+    total_today = await add_user_calories(interaction.user.id, calories, food, macros)
+    await interaction.response.send_message(embed=build_calories_added_embed(calories, food, total_today, interaction.user.display_name))
+
+async def warm_up_models():
+    """Set up Gemini once the gateway is connected, so it doesn't delay logging in"""
+    await bot.wait_until_ready()
+    started = time.monotonic()
+    warming = warm_up_gemini()
+    if warming:
+        await warming
+        logger.info(f"Gemini ready in {time.monotonic() - started:.2f}s")
+
+@bot.event
+async def setup_hook():
+    """Load calorie data, register the persistent confirmation buttons, start the model warm-up and lag monitor, publish slash commands"""
+    # Loaded once per process: READY fires again after every gateway reconnect,
+    # and reloading then would drop changes still waiting for their save
+    load_calories_data()
+    if os.path.exists(LEGACY_RECIPES_FILE):
+        logger.info(f"Moved the recipes of {recipe_book.import_file(LEGACY_RECIPES_FILE)} users to {RECIPES_DIR}/")
+    # Buttons on results sent before a restart keep working
+    bot.add_view(ConfirmCaloriesView())
+    asyncio.create_task(warm_up_models())
+    lag_monitor.start()
+    
+    # With several workers only the one running shard 0 syncs, the commands are global
+    if not SYNC_APP_COMMANDS or (SHARD_IDS and 0 not in SHARD_IDS):
+        return
+    try:
+        if APP_COMMAND_GUILD_ID:
+            guild = discord.Object(id=APP_COMMAND_GUILD_ID)
+            bot.tree.copy_global_to(guild=guild)
+            synced = await bot.tree.sync(guild=guild)
+        else:
+            synced = await bot.tree.sync()
+        logger.info(f"Synced {len(synced)} slash commands")
+    except discord.HTTPException as e:
+        logger.error(f"Failed to sync slash commands: {e}")
+
+def stop_background_tasks():
+    global retention_task
+    digest_scheduler.stop()
+    if retention_task:
+        retention_task.cancel()
+        retention_task = None
+    lag_monitor.stop()
+
+async def flush_calories_data():
+    """Write changes still waiting for their save (the shared store writes each user as they change)"""
+    global pending_save
+    if shared_store:
+        return
+    if pending_save:
+        pending_save.cancel()
+        pending_save = None
+    await write_calories_file()  # Waits for a save already under way
+
+def shut_down(signum: int = None):
+    """Stop taking analyses, let running ones finish, then save and disconnect (on SIGTERM/SIGINT)"""
+    if not lifecycle.accepting:
+        logger.info("Already shutting down")
+        return
+    reason = signal.Signals(signum).name if signum else "request"
+    logger.info(f"Shutting down ({reason}), {lifecycle.in_flight} analyses in flight")
+    # Background work stops right away, digests resume from their checkpoint after the restart
+    stop_background_tasks()
+    return lifecycle.shutdown([
+        ("flush calorie data", flush_calories_data),
+        ("stop image workers", shutdown_image_pool),
+        ("flush model recording", close_recording),
+        ("save model usage", lambda: asyncio.get_running_loop().run_in_executor(None, usage_ledger.flush)),
+        ("disconnect", bot.close)
+    ])
+
 async def main():
     """Main function to run the bot"""
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(signum, shut_down, signum)
+        except NotImplementedError:
+            pass  # Windows: Ctrl+C still stops the bot, without draining
     try:
         await bot.start(DISCORD_TOKEN)
     except discord.LoginFailure:
         logger.error("Invalid bot token! Please check your .env file.")
     except Exception as e:
         logger.error(f"An error occurred: {e}")
+    # bot.close() is the last shutdown step, let it finish logging
+    await lifecycle.wait_stopped()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,96 @@
+"""
+Entry memory benchmark.
+
+Builds a synthetic history (users x days x entries, names drawn from a
+small menu like real logs) and measures with tracemalloc how much memory it
+takes as the plain dicts json.load returns (the old in-memory layout) and
+as the __slots__ DayLog/FoodEntry records the bot keeps now. Fails (exit
+code 1) if the records don't save at least --min-saving of the memory.
+
+    python memory_benchmark.py [--users 200] [--days 90] [--entries 5] [--min-saving 0.3]
+"""
+import argparse
+import gc
+import json
+import random
+import sys
+import tracemalloc
+from datetime import datetime, timedelta
+
+from entries import ENTRY_ID_ALPHABET, ENTRY_ID_LENGTH, user_data_from_dict
+from nutrition import MACROS
+
+MENU = [
+    "Oatmeal with berries", "Chicken salad", "Banana", "Coffee with milk", "Spaghetti bolognese",
+    "Greek yogurt", "Apple", "Cheeseburger", "Rice and beans", "Protein shake", "Pizza slice", "Salmon"
+]
+
+
+def history_json(users: int, days: int, entries: int) -> str:
+    """Stored form of the synthetic history, as it would be read from disk"""
+    rng = random.Random(30)
+    start = datetime(2024, 1, 1)
+    data = {}
+    for user in range(users):
+        user_days = {}
+        for offset in range(days):
+            day = start + timedelta(days=offset)
+            foods = []
+            for n in range(entries):
+                food = {
+                    "id": "".join(rng.choices(ENTRY_ID_ALPHABET, k=ENTRY_ID_LENGTH)),
+                    "name": rng.choice(MENU),
+                    "calories": rng.randint(50, 900),
+                    "timestamp": (day + timedelta(hours=7 + 3 * n)).isoformat()
+                }
+                if rng.random() < 0.5:
+                    food["macros"] = {macro: round(rng.uniform(0, 60), 1) for macro in MACROS}
+                foods.append(food)
+            user_days[day.date().isoformat()] = {"total_calories": sum(f["calories"] for f in foods), "foods": foods}
+        data[str(100000 + user)] = user_days
+    return json.dumps(data)
+
+
+def measure(build) -> tuple:
+    """(bytes still allocated by what build() returns, the result)"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare memory of dict entries and __slots__ records")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--entries", type=int, default=5, help="entries per day")
+    parser.add_argument("--min-saving", type=float, default=0.3, help="smallest acceptable share of memory saved")
+    args = parser.parse_args()
+
+    blob = history_json(args.users, args.days, args.entries)
+    count = args.users * args.days * args.entries
+
+    dict_bytes, as_dicts = measure(lambda: json.loads(blob))
+    del as_dicts
+    record_bytes, as_records = measure(
+        lambda: {user: user_data_from_dict(days) for user, days in json.loads(blob).items()}
+    )
+    del as_records
+
+    print(f"{count:,} entries ({args.users} users x {args.days} days x {args.entries})")
+    print(f"{'layout':<10}{'total MB':>10}{'bytes/entry':>13}")
+    for name, used in (("dicts", dict_bytes), ("records", record_bytes)):
+        print(f"{name:<10}{used / 1e6:>10.1f}{used / count:>13.0f}")
+    saving = 1 - record_bytes / dict_bytes
+    print(f"saved {saving:.0%}")
+    if saving < args.min_saving:
+        print(f"FAIL: records saved {saving:.0%} (expected at least {args.min_saving:.0%})")
+    sys.exit(1 if saving < args.min_saving else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Analysis message benchmark.
+
+Counts the Discord REST calls one analysis costs, from the status message to
+the ✅ click, with real discord.py channel, message and interaction objects
+on top of a fake HTTP client that records each request instead of sending
+it. Compares the old flow (send a status, delete it, send the result, answer
+the click with a new message) with AnalysisMessage (one message edited in
+place, the click edits it again), for a result and for a failed analysis.
+Fails (exit code 1) if AnalysisMessage doesn't need fewer calls.
+
+    python message_benchmark.py
+"""
+import asyncio
+import os
+import sys
+
+os.environ.setdefault("DISCORD_TOKEN", "message-benchmark")  # config.py refuses to load without one
+
+import discord
+import discord.webhook.async_ as webhook_async
+from discord.http import HTTPClient
+from discord.state import ConnectionState
+
+from embeds import build_analysis_error_embed, build_image_analysis_embed, build_calories_added_embed, add_logged_entry
+from message_lifecycle import AnalysisMessage
+
+CHANNEL_ID = 42
+RESULT = {"food_name": "Chicken salad", "calories": 420, "confidence": 85, "description": "A bowl of chicken salad"}
+IMAGE_URL = "https://cdn.example.com/salad.png"
+BOT_USER = {"id": "1", "username": "bot", "discriminator": "0", "avatar": None}
+USER = {"id": "10", "username": "user", "discriminator": "0", "global_name": None, "avatar": None}
+
+
+def message_payload(message_id: int, payload: dict = None) -> dict:
+    payload = payload or {}
+    return {
+        "id": str(message_id), "channel_id": str(CHANNEL_ID), "author": BOT_USER, "content": payload.get("content") or "",
+        "timestamp": "2025-01-01T00:00:00+00:00", "edited_timestamp": None, "tts": False, "mention_everyone": False,
+        "mentions": [], "mention_roles": [], "attachments": [], "embeds": payload.get("embeds") or [],
+        "pinned": False, "type": 0, "components": payload.get("components") or []
+    }
+
+
+class RecordingHTTPClient(HTTPClient):
+    """Answers every request with a plausible payload and records (method, route) instead of sending it"""
+
+    def __init__(self, loop):
+        super().__init__(loop)
+        self.calls = []
+
+    async def request(self, route, **kwargs):
+        self.calls.append((route.method, route.path))
+        if route.method in ("POST", "PATCH") and route.path.startswith("/channels/{channel_id}/messages"):
+            return message_payload(1000 + len(self.calls), kwargs.get("json"))
+        return None
+
+
+def fake_state(http: RecordingHTTPClient) -> ConnectionState:
+    state = ConnectionState(dispatch=lambda *args: None, handlers={}, hooks={}, http=http, intents=discord.Intents.none())
+    state._get_client = lambda: None
+    # Interaction callbacks go through the webhook adapter rather than HTTPClient
+    async def callback(adapter, route, session, **kwargs):
+        http.calls.append((route.method, route.path))
+        return {"interaction": {"id": "7", "type": 3}}
+    webhook_async.AsyncWebhookAdapter.request = callback
+    return state
+
+
+def click(state: ConnectionState, message: discord.Message) -> discord.Interaction:
+    """The ✅ button press on a result message"""
+    return discord.Interaction(state=state, data={
+        "id": "7", "application_id": "2", "type": 3, "token": "token", "version": 1, "channel_id": str(CHANNEL_ID),
+        "attachment_size_limit": 8 * 1024 * 1024, "entitlements": [], "authorizing_integration_owners": {},
+        "data": {"custom_id": "calories:confirm", "component_type": 2},
+        "message": message_payload(message.id, {"embeds": [embed.to_dict() for embed in message.embeds]}), "user": USER
+    })
+
+
+def result_view() -> discord.ui.View:
+    view = discord.ui.View(timeout=None)
+    view.add_item(discord.ui.Button(emoji="✅", label="Log it", custom_id="calories:confirm"))
+    view.add_item(discord.ui.Button(emoji="❌", label="Skip", custom_id="calories:decline"))
+    return view
+
+
+async def old_flow(state, channel, failed: bool):
+    thinking = await channel.send("🤔 Analyzing your food image... This may take a few seconds.")
+    await thinking.delete()
+    if failed:
+        await channel.send(embed=build_analysis_error_embed("The image could not be analyzed."))
+        return
+    message = await channel.send(embed=build_image_analysis_embed(RESULT, "user", IMAGE_URL), view=result_view())
+    await click(state, message).response.send_message(embed=build_calories_added_embed(420, "Chicken salad", 1650, "user"))
+
+
+async def new_flow(state, channel, failed: bool):
+    analysis_msg = AnalysisMessage(channel)
+    await analysis_msg.analyzing("🤔 Analyzing your food image... This may take a few seconds.")
+    if failed:
+        await analysis_msg.fail(build_analysis_error_embed("The image could not be analyzed."))
+        return
+    await analysis_msg.show_result(build_image_analysis_embed(RESULT, "user", IMAGE_URL), result_view())
+    interaction = click(state, analysis_msg.message)
+    await interaction.response.edit_message(embed=add_logged_entry(interaction.message.embeds[0], "user", 420, 1650))
+
+
+async def count(flow, failed: bool) -> list:
+    http = RecordingHTTPClient(asyncio.get_running_loop())
+    state = fake_state(http)
+    await flow(state, discord.PartialMessageable(state=state, id=CHANNEL_ID), failed)
+    return http.calls
+
+
+LABELS = {
+    ("POST", "/channels/{channel_id}/messages"): "send",
+    ("PATCH", "/channels/{channel_id}/messages/{message_id}"): "edit",
+    ("DELETE", "/channels/{channel_id}/messages/{message_id}"): "delete",
+    ("PUT", "/channels/{channel_id}/messages/{message_id}/reactions/{emoji}/@me"): "react",
+    ("POST", "/interactions/{webhook_id}/{webhook_token}/callback"): "interaction callback"
+}
+
+
+def describe(calls: list) -> str:
+    kinds = {}
+    for call in calls:
+        kind = LABELS.get(call, " ".join(call))
+        kinds[kind] = kinds.get(kind, 0) + 1
+    return ", ".join(f"{n} {kind}" for kind, n in kinds.items())
+
+
+async def run() -> bool:
+    better = True
+    print(f"{'flow':<10}{'outcome':<9}{'calls':>6}{'channel':>9}  requests")
+    for failed in (False, True):
+        totals = []
+        for name, flow in (("old", old_flow), ("lifecycle", new_flow)):
+            calls = await count(flow, failed)
+            on_channel = sum(1 for _, path in calls if path.startswith("/channels/"))
+            totals.append(len(calls))
+            print(f"{name:<10}{'failed' if failed else 'result':<9}{len(calls):>6}{on_channel:>9}  {describe(calls)}")
+        better = better and totals[1] < totals[0]
+    return better
+
+
+def main():
+    better = asyncio.run(run())
+    if not better:
+        print("FAIL: AnalysisMessage does not save REST calls")
+    sys.exit(0 if better else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import logging
+import time
+from collections import OrderedDict
+import discord
+
+logger = logging.getLogger(__name__)
+
+# States an analysis message moves through
+ANALYZING = "analyzing"
+RESULT = "result"
+FAILED = "failed"
+
+
+class AnalysisMessage:
+    """
+    A single bot message that follows one analysis from start to finish,
+    edited in place instead of sending, deleting and reacting: analyzing →
+    result (or failed). A transition only costs a REST call when it changes
+    what the user sees, so an analysis is one send plus one edit. Clicking ✅
+    then confirms on the same message (see ConfirmCaloriesView in main.py).
+    """
+
+    def __init__(self, destination: discord.abc.Messageable):
+        self.destination = destination
+        self.message = None
+        self.state = None
+        self._rendered = None
+
+    async def _render(self, state: str, content: str = None, embed: discord.Embed = None, view: discord.ui.View = None):
+        self.state = state
+        rendered = (content, embed.to_dict() if embed else None, view is not None)
+        if rendered == self._rendered:
+            return
+        self._rendered = rendered
+        if self.message is None:
+            self.message = await self.destination.send(content=content, embed=embed, view=view)
+        else:
+            # Passing None clears the old status text, embed or buttons
+            self.message = await self.message.edit(content=content, embed=embed, view=view)
+
+    async def analyzing(self, status: str):
+        await self._render(ANALYZING, content=status)
+
+    async def show_result(self, embed: discord.Embed, view: discord.ui.View):
+        await self._render(RESULT, embed=embed, view=view)
+
+    async def fail(self, embed: discord.Embed):
+        """Replace the status (or result) with an error, or send it if nothing was sent yet"""
+        try:
+            await self._render(FAILED, embed=embed)
+        except discord.HTTPException as e:
+            # The status message may have been deleted meanwhile
+            logger.warning(f"Could not edit analysis message, sending error instead: {e}")
+            self.message = None
+            self._rendered = None
+            await self._render(FAILED, embed=embed)
+
+
+class PendingResults:
+    """
+    Parsed results (calories, food name, macros) of recent analyses by
+    message ID, so ✅ logs the numbers Gemini returned instead of reading
+    them back from the embed. Only the latest max_size, and none older than
+    max_age seconds, are kept; older results, and those from before a
+    restart, fall back to the embed.
+
+    It doubles as the index of messages awaiting confirmation: a reaction
+    on any other message is discarded with one dict lookup. Who already
+    logged each result is tracked too, so a second ✅ doesn't log it again.
+    """
+
+    def __init__(self, max_size: int = 5000, max_age: float = 24 * 60 * 60):
+        self.max_size = max_size
+        self.max_age = max_age
+        self._results = OrderedDict()  # message_id -> (expires, result), oldest first
+        self._logged = OrderedDict()  # message_id -> IDs of users who logged it, oldest first
+
+    def remember(self, message_id: int, result: dict):
+        try:
+            calories = int(result["calories"])
+        except (KeyError, TypeError, ValueError):
+            return
+        parsed = (calories, result.get("food_name") or "Unknown food", result.get("macros"))
+        self._results[message_id] = (time.monotonic() + self.max_age, parsed)
+        self._results.move_to_end(message_id)
+        if len(self._results) > self.max_size:
+            self._results.popitem(last=False)
+
+    def get(self, message_id: int):
+        entry = self._results.get(message_id)
+        if entry is None:
+            return None
+        expires, parsed = entry
+        if expires < time.monotonic():
+            del self._results[message_id]
+            return None
+        return parsed
+
+    def claim(self, message_id: int, user_id: int) -> bool:
+        """Mark a user as logging a message's result, False if they already did"""
+        users = self._logged.setdefault(message_id, set())
+        if user_id in users:
+            return False
+        users.add(user_id)
+        self._logged.move_to_end(message_id)
+        if len(self._logged) > self.max_size:
+            self._logged.popitem(last=False)
+        return True
+
+    def release(self, message_id: int, user_id: int):
+        """Undo claim() when logging failed, so the user can try again"""
+        users = self._logged.get(message_id)
+        if users:
+            users.discard(user_id)
+
+    def __contains__(self, message_id: int):
+        # Misses, by far the most common case, stop at the dict lookup
+        return message_id in self._results and self.get(message_id) is not None
+
+    def __len__(self):
+        return len(self._results)
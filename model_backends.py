@@ -0,0 +1,165 @@
+import base64
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+GEMINI = "gemini"
+LOCAL = "local"
+AUTO = "auto"  # Route to whichever available backend has been answering fastest
+
+
+class ModelHTTPError(Exception):
+    """Non-2xx answer from a local model server; ``code`` lets classify_error treat it like a Gemini status"""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(f"HTTP {code}: {message}")
+        self.code = code
+
+
+class UsageMetadata:
+    """Token counts under the same names as Gemini's response.usage_metadata"""
+    __slots__ = ("prompt_token_count", "candidates_token_count", "total_token_count")
+
+    def __init__(self, prompt_tokens: int = 0, completion_tokens: int = 0):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = completion_tokens
+        self.total_token_count = prompt_tokens + completion_tokens
+
+
+class LocalResponse:
+    """The parts of a Gemini response the bot reads: text and usage_metadata"""
+    __slots__ = ("text", "usage_metadata")
+
+    def __init__(self, text: str, usage_metadata: UsageMetadata = None):
+        self.text = text
+        self.usage_metadata = usage_metadata or UsageMetadata()
+
+
+class LocalModelBackend:
+    """
+    A model behind an OpenAI-compatible /chat/completions endpoint, such as
+    Ollama, llama.cpp's server, vLLM or LM Studio. Takes the same contents
+    as GenerativeModel.generate_content (a prompt, or a list of prompt
+    strings and {"mime_type", "data"} image blobs) and blocks like it, so
+    ResilientGeminiClient drives both the same way.
+    """
+
+    def __init__(self, base_url: str, model: str, api_key: str = None, timeout: float = 60):
+        self.url = f"{base_url.rstrip('/')}/chat/completions"
+        self.model = model
+        self.api_key = api_key
+        self.timeout = timeout
+
+    def _message(self, contents) -> dict:
+        parts = contents if isinstance(contents, list) else [contents]
+        content = []
+        for part in parts:
+            if isinstance(part, dict):
+                encoded = base64.b64encode(part["data"]).decode("ascii")
+                content.append({"type": "image_url", "image_url": {"url": f"data:{part['mime_type']};base64,{encoded}"}})
+            else:
+                content.append({"type": "text", "text": str(part)})
+        return {"role": "user", "content": content}
+
+    def generate_content(self, contents) -> LocalResponse:
+        import requests
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        payload = {"model": self.model, "messages": [self._message(contents)], "temperature": 0.2}
+        try:
+            response = requests.post(self.url, json=payload, headers=headers, timeout=self.timeout)
+        except requests.Timeout as e:
+            raise TimeoutError(str(e)) from e
+        except requests.ConnectionError as e:
+            raise ConnectionError(str(e)) from e
+        if response.status_code >= 400:
+            raise ModelHTTPError(response.status_code, response.text[:200])
+        body = response.json()
+        usage = body.get("usage") or {}
+        return LocalResponse(
+            body["choices"][0]["message"]["content"] or "",
+            UsageMetadata(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+        )
+
+
+class ModelRouter:
+    """
+    Named model clients (ResilientGeminiClient around a Gemini model or a
+    LocalModelBackend) and which one each kind of request goes to. A kind
+    routed to AUTO, or to a backend that isn't configured, goes to the
+    available backend with the lowest recent latency; backends without a
+    measurement yet are tried first, and a small share of requests explores
+    the others so their numbers stay current.
+    """
+
+    def __init__(self, default: str = GEMINI, routes: dict = None, explore: float = 0.05, smoothing: float = 0.2,
+                 recorder=None):
+        self.default = default
+        self.routes = routes or {}  # kind -> backend name or AUTO
+        self.explore = explore
+        self.smoothing = smoothing
+        self.recorder = recorder  # model_replay.ResponseRecorder that keeps every answer, or None
+        self._clients = {}  # name -> (client, handles images)
+        self._latency = {}  # name -> exponentially weighted seconds per request
+
+    def add(self, name: str, client, vision: bool = True):
+        self._clients[name] = (client, vision)
+
+    def __bool__(self):
+        return bool(self._clients)
+
+    def names(self) -> list:
+        return list(self._clients)
+
+    def latencies(self) -> dict:
+        return dict(self._latency)
+
+    def choose(self, kind: str, images: bool = False, backend: str = None):
+        """(name, client) for a request, or None if no configured backend can take it; backend overrides the route"""
+        candidates = {name: client for name, (client, vision) in self._clients.items() if vision or not images}
+        preferred = backend or self.routes.get(kind, self.default)
+        if preferred in candidates:
+            return preferred, candidates[preferred]
+        # Skip backends whose circuit breaker is open, unless that's all there is
+        available = [name for name, client in candidates.items() if client.breaker.state != client.breaker.OPEN] or list(candidates)
+        if not available:
+            return None
+        unmeasured = [name for name in available if name not in self._latency]
+        if unmeasured:
+            name = unmeasured[0]
+        elif len(available) > 1 and random.random() < self.explore:
+            name = random.choice(available)
+        else:
+            name = min(available, key=self._latency.get)
+        return name, candidates[name]
+
+    def record(self, name: str, seconds: float):
+        previous = self._latency.get(name)
+        self._latency[name] = seconds if previous is None else previous + self.smoothing * (seconds - previous)
+
+    async def generate_content(self, kind: str, contents, backend: str = None, **options):
+        """Send a request to the backend chosen for its kind; raises GeminiError like the clients do"""
+        _, response = await self.generate(kind, contents, backend, **options)
+        return response
+
+    async def generate(self, kind: str, contents, backend: str = None, **options) -> tuple:
+        """generate_content, returning (name of the backend that answered, response)"""
+        images = isinstance(contents, list) and any(isinstance(part, dict) for part in contents)
+        chosen = self.choose(kind, images, backend)
+        if chosen is None:
+            raise LookupError(f"No model backend can handle {kind} requests")
+        name, client = chosen
+        started = time.monotonic()
+        try:
+            response = await client.generate_content(contents, **options)
+        except Exception:
+            # A failure counts as a request that took the whole deadline
+            self.record(name, max(time.monotonic() - started, client.deadline))
+            raise
+        elapsed = time.monotonic() - started
+        self.record(name, elapsed)
+        if self.recorder is not None:
+            self.recorder.record(kind, contents, response, elapsed)
+        logger.debug(f"{kind} request answered by {name} in {elapsed:.2f}s")
+        return name, response
@@ -0,0 +1,194 @@
+import asyncio
+import atexit
+import gzip
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import zlib
+from collections import defaultdict
+
+from gemini_client import CircuitBreaker, GeminiError
+from model_backends import LocalResponse, UsageMetadata
+
+logger = logging.getLogger(__name__)
+
+REPLAY = "replay"
+RECORDED = "recorded"  # Replay latency: wait as long as the recorded request took
+
+
+class ReplayMissError(GeminiError):
+    user_message = "❌ No recorded model response matches this request."
+
+
+def fingerprint(contents) -> tuple:
+    """
+    (request, prompt) fingerprints of model contents: the first covers the
+    prompt text and image bytes, the second only the text, so a request
+    with a different photo can still be served an answer to the same prompt
+    """
+    parts = contents if isinstance(contents, list) else [contents]
+    request, prompt = hashlib.sha256(), hashlib.sha256()
+    for part in parts:
+        if isinstance(part, dict):
+            request.update(part["mime_type"].encode() + b"\0")
+            request.update(hashlib.sha256(part["data"]).digest())
+        else:
+            text = str(part).encode("utf-8") + b"\0"
+            request.update(text)
+            prompt.update(text)
+    return request.hexdigest()[:20], prompt.hexdigest()[:20]
+
+
+def load_corpus(path: str) -> list:
+    """Entries of a recorded corpus in order; a torn last write (e.g. after a crash) is skipped"""
+    entries = []
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                entries.append(json.loads(line))
+    except (EOFError, gzip.BadGzipFile, json.JSONDecodeError) as e:
+        logger.warning(f"Model corpus {path} ends in a partial write, kept {len(entries)} entries: {e}")
+    return entries
+
+
+def intact_length(path: str) -> int:
+    """Bytes of a corpus up to the end of its last complete gzip member (the whole file if none is torn)"""
+    intact = offset = 0
+    decompressor = zlib.decompressobj(wbits=31)  # One gzip member, trailer CRC checked
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(1 << 20)
+            if not chunk:
+                return intact
+            while chunk:
+                try:
+                    decompressor.decompress(chunk)
+                except zlib.error:
+                    return intact
+                if not decompressor.eof:
+                    offset += len(chunk)
+                    break
+                # A member ended inside this chunk, the rest starts the next one
+                offset += len(chunk) - len(decompressor.unused_data)
+                intact = offset
+                chunk = decompressor.unused_data
+                decompressor = zlib.decompressobj(wbits=31)
+
+
+class ResponseRecorder:
+    """
+    Appends each answered model request to a corpus: gzip'd JSON lines of
+    kind, fingerprints, raw response text, latency and token usage. A
+    background thread writes them, in batches, as gzip members appended to
+    the file, so recording never blocks the event loop and the file stays
+    readable after every batch. A member torn by a crash would hide
+    everything appended after it, so the file is first cut back to its last
+    complete member.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.recorded = 0
+        self._entries = queue.SimpleQueue()
+        self._writer = threading.Thread(target=self._write, name="model-recorder", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def record(self, kind: str, contents, response, seconds: float):
+        request_fp, prompt_fp = fingerprint(contents)
+        usage = getattr(response, "usage_metadata", None)
+        self._entries.put({
+            "kind": kind,
+            "fp": request_fp,
+            "prompt_fp": prompt_fp,
+            "text": response.text,
+            "latency": round(seconds, 4),
+            "usage": [getattr(usage, "prompt_token_count", 0) or 0, getattr(usage, "candidates_token_count", 0) or 0]
+        })
+        self.recorded += 1
+
+    def close(self):
+        """Write what is queued and stop the writer (safe to call more than once)"""
+        if self._writer.is_alive():
+            self._entries.put(None)
+            self._writer.join(timeout=10)
+
+    def _repair(self):
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return
+        try:
+            intact = intact_length(self.path)
+            if intact < size:
+                os.truncate(self.path, intact)
+                logger.warning(f"Model corpus {self.path} ended in a partial write, dropped its last {size - intact} bytes")
+        except OSError as e:
+            logger.error(f"Could not check model corpus {self.path}: {e}")
+
+    def _write(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._repair()
+        stopping = False
+        while not stopping:
+            batch = [self._entries.get()]
+            while True:
+                try:
+                    batch.append(self._entries.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                stopping = True
+                batch = [entry for entry in batch if entry is not None]
+            if not batch:
+                continue
+            try:
+                with gzip.open(self.path, "at", encoding="utf-8") as f:
+                    for entry in batch:
+                        f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+            except OSError as e:
+                logger.error(f"Could not record {len(batch)} model responses to {self.path}: {e}")
+
+
+class ReplayBackend:
+    """
+    Serves recorded responses in place of a model: an exact match on prompt
+    and images first, then any response recorded for the same prompt text.
+    Repeated requests cycle through the responses recorded for them in
+    order, so a replay run is deterministic. Waits the recorded latency, or
+    a fixed number of seconds (0 for full speed).
+    """
+
+    def __init__(self, path: str, latency=RECORDED):
+        self.latency = latency
+        self.deadline = 0
+        self.breaker = CircuitBreaker()  # Never trips; lets the router treat this like any client
+        self._by_request = defaultdict(list)
+        self._by_prompt = defaultdict(list)
+        self._served = defaultdict(int)
+        entries = load_corpus(path)
+        for entry in entries:
+            self._by_request[entry["fp"]].append(entry)
+            self._by_prompt[entry["prompt_fp"]].append(entry)
+        logger.info(f"Replaying {len(entries)} recorded model responses from {path}")
+
+    def _lookup(self, contents) -> dict:
+        request_fp, prompt_fp = fingerprint(contents)
+        for key, recorded in (("fp", self._by_request.get(request_fp)), ("prompt_fp", self._by_prompt.get(prompt_fp))):
+            if recorded:
+                served = self._served[(key, recorded[0][key])]
+                self._served[(key, recorded[0][key])] += 1
+                return recorded[served % len(recorded)]
+        raise ReplayMissError(f"No recorded response for request {request_fp}")
+
+    async def generate_content(self, contents, *, deadline: float = None, hedge: bool = None):
+        entry = self._lookup(contents)
+        delay = entry["latency"] if self.latency == RECORDED else float(self.latency)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return LocalResponse(entry["text"], UsageMetadata(*entry["usage"]))
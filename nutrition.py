@@ -0,0 +1,62 @@
+import re
+
+# Macronutrients tracked per entry, in the order they are stored
+MACROS = ("protein", "carbs", "fat", "fiber", "sugar")
+
+_ALIASES = {
+    "protein": "protein", "proteins": "protein",
+    "carbs": "carbs", "carb": "carbs", "carbohydrates": "carbs", "carbohydrate": "carbs", "total carbohydrates": "carbs",
+    "fat": "fat", "fats": "fat", "total fat": "fat",
+    "fiber": "fiber", "fibre": "fiber", "dietary fiber": "fiber",
+    "sugar": "sugar", "sugars": "sugar", "total sugars": "sugar"
+}
+_AMOUNT = re.compile(r"(\d+(?:\.\d+)?)(?:\s*(?:-|–|to)\s*(\d+(?:\.\d+)?))?\s*(mg|g|grams?)?", re.IGNORECASE)
+
+
+def parse_amount(value):
+    """Grams from a Gemini amount like 25, "25g", "~25 g", "20-30g" or "150mg", else None"""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return round(float(value), 1) if value >= 0 else None
+    match = _AMOUNT.search(str(value))
+    if not match:
+        return None
+    amount = float(match.group(1))
+    if match.group(2):
+        amount = (amount + float(match.group(2))) / 2  # A range counts as its middle
+    if (match.group(3) or "").lower() == "mg":
+        amount /= 1000
+    return round(amount, 1)
+
+
+def parse_macros(nutritional_info: dict):
+    """Grams of each of MACROS (0.0 where missing) from Gemini's nutritional_info, or None if none are given"""
+    if not isinstance(nutritional_info, dict):
+        return None
+    grams = {}
+    for nutrient, amount in nutritional_info.items():
+        macro = _ALIASES.get(" ".join(str(nutrient).lower().replace("_", " ").split()))
+        parsed = parse_amount(amount)
+        if macro and parsed is not None:
+            grams[macro] = parsed
+    if not grams:
+        return None
+    return tuple(grams.get(macro, 0.0) for macro in MACROS)
+
+
+def macros_to_dict(macros) -> dict:
+    return dict(zip(MACROS, macros))
+
+
+def macros_from_dict(data):
+    """Inverse of macros_to_dict for stored entries; None stays None"""
+    if not data:
+        return None
+    return tuple(float(data.get(macro) or 0.0) for macro in MACROS)
+
+
+def scale_macros(macros, factor: float):
+    if macros is None:
+        return None
+    return tuple(round(grams * factor, 1) for grams in macros)
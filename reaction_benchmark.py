@@ -0,0 +1,127 @@
+"""
+Reaction filter microbenchmark.
+
+on_reaction_add runs for every reaction the bot can see, almost all of them
+on messages that have nothing to do with it. This times how long the bot's
+handler takes to drop such reactions, with --pending results awaiting
+confirmation, against the filter it replaced (author checks, then matching
+the embed title). Reactions are a mix of other users' messages, bot messages
+without embeds and bot messages with other embeds. Each handler coroutine is
+driven directly, without an event loop; an empty coroutine is timed as the
+floor. Fails (exit code 1) if the handler isn't faster than the old filter.
+
+    python reaction_benchmark.py [--reactions 100000] [--pending 5000]
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("DISCORD_TOKEN", "reaction-benchmark")  # config.py refuses to load without one
+
+import discord
+
+import main as bot_main
+
+logger = logging.getLogger("main")
+
+
+class Author:
+    def __init__(self, user_id: int):
+        self.id = user_id
+
+
+class Message:
+    def __init__(self, message_id: int, author, embeds: list):
+        self.id = message_id
+        self.author = author
+        self.embeds = embeds
+
+
+class Reaction:
+    def __init__(self, message: Message, emoji: str = "👍"):
+        self.message = message
+        self.emoji = emoji
+
+
+async def old_filter(ctx, user):
+    """on_reaction_add before results were indexed by message ID, up to where it ignored the reaction"""
+    if user == bot_main.bot.user:
+        return
+    if ctx.message.author != bot_main.bot.user:
+        return
+    if not ctx.message.embeds:
+        return
+    embed = ctx.message.embeds[0]
+    if not embed.title or not any(keyword in embed.title for keyword in bot_main.ANALYSIS_TITLE_KEYWORDS):
+        logger.debug(f"Embed title '{embed.title}' does not contain analysis keywords, ignoring reaction")
+        return
+
+
+async def empty(ctx, user):
+    return
+
+
+def reactions(count: int, bot_user, rng: random.Random) -> list:
+    """80% on other users' messages, 15% on bot messages without embeds, 5% on other bot embeds"""
+    other_embed = discord.Embed(title="📊 Today's Calories")
+    result = []
+    for n in range(count):
+        roll = rng.random()
+        message_id = 10 ** 17 + n
+        if roll < 0.80:
+            message = Message(message_id, Author(rng.randrange(10 ** 17)), [])
+        elif roll < 0.95:
+            message = Message(message_id, bot_user, [])
+        else:
+            message = Message(message_id, bot_user, [other_embed])
+        result.append(Reaction(message))
+    return result
+
+
+def time_handler(handler, stream: list, user) -> float:
+    """Nanoseconds per reaction"""
+    started = time.perf_counter_ns()
+    for reaction in stream:
+        coroutine = handler(reaction, user)
+        try:
+            coroutine.send(None)
+        except StopIteration:
+            pass
+        else:
+            raise RuntimeError(f"{handler.__name__} awaited something for an irrelevant reaction")
+    return (time.perf_counter_ns() - started) / len(stream)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time how fast irrelevant reactions are dropped")
+    parser.add_argument("--reactions", type=int, default=100_000)
+    parser.add_argument("--pending", type=int, default=5000, help="analysis results awaiting confirmation")
+    parser.add_argument("--repeat", type=int, default=5, help="best of this many runs")
+    args = parser.parse_args()
+
+    rng = random.Random(46)
+    bot_user = Author(1)
+    bot_main.bot._connection.user = bot_user  # As after login
+    for n in range(args.pending):
+        bot_main.pending_results.remember(n, {"calories": 300, "food_name": "Toast"})
+    stream = reactions(args.reactions, bot_user, rng)
+    reacting_user = Author(2)
+
+    print(f"{args.reactions:,} irrelevant reactions, {len(bot_main.pending_results)} results pending")
+    timings = {}
+    for name, handler in (("empty coroutine", empty), ("old filter", old_filter), ("on_reaction_add", bot_main.on_reaction_add)):
+        timings[name] = min(time_handler(handler, stream, reacting_user) for _ in range(args.repeat))
+        net = timings[name] - timings["empty coroutine"]
+        print(f"{name:<18}{timings[name]:>8.0f} ns per reaction ({net:.0f} ns above an empty coroutine)")
+
+    faster = timings["on_reaction_add"] < timings["old filter"]
+    if not faster:
+        print("FAIL: on_reaction_add is not faster than the filter it replaced")
+    sys.exit(0 if faster else 1)
+
+
+if __name__ == "__main__":
+    main()
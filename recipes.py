@@ -0,0 +1,253 @@
+import asyncio
+import os
+import re
+from history_io import MAX_ENTRY_CALORIES
+from shared_store import async_file_lock, file_lock, read_json, write_json_atomic
+
+MAX_RECIPE_ITEMS = 30
+MAX_SERVINGS = 100
+
+_QUANTITY = re.compile(r"^(\d+(?:\.\d+)?|\d+/\d+)\s*(?:x|×)?\s+", re.IGNORECASE)
+_CALORIES = re.compile(r"\s*=\s*(\d+)\s*(?:kcal|cal)?\s*$", re.IGNORECASE)
+_SERVES = re.compile(r"\s*(?:\(?\s*serves\s+(\d+)\s*\)?)\s*$", re.IGNORECASE)
+
+
+def item_key(name: str) -> str:
+    return " ".join(name.lower().split())
+
+
+def parse_quantity(text: str):
+    """(quantity, rest) for "2 eggs", "0.5 x rice", "1/2 avocado"; quantity defaults to 1"""
+    match = _QUANTITY.match(text)
+    if not match:
+        return 1.0, text
+    number = match.group(1)
+    if "/" in number:
+        numerator, denominator = (int(part) for part in number.split("/"))
+        if denominator == 0:
+            raise ValueError(f"'{text}' divides by zero")
+        quantity = numerator / denominator
+    else:
+        quantity = float(number)
+    return quantity, text[match.end():]
+
+
+def parse_servings(text: str):
+    """(recipe name, servings) for "chili", "chili 2" or "chili 1/2", servings default to 1"""
+    match = re.match(r"^(.*?)\s+(\d+(?:\.\d+)?|\d+/\d+)$", text.strip())
+    if not match:
+        return text.strip(), 1.0
+    servings, _ = parse_quantity(f"{match.group(2)} x")
+    if not 0 < servings <= MAX_SERVINGS:
+        raise ValueError(f"Servings must be between 0 and {MAX_SERVINGS}")
+    return match.group(1), servings
+
+
+def serving_calories(recipe: dict, servings: float) -> int:
+    """Calories of servings of a recipe, held to the same 1 to MAX_ENTRY_CALORIES kcal as any logged entry"""
+    calories = round(recipe["calories"] / recipe["servings"] * servings)
+    if calories < 1:
+        raise ValueError(f"{servings:g} servings of {recipe['name']} come to less than 1 kcal, nothing to log")
+    if calories > MAX_ENTRY_CALORIES:
+        raise ValueError(f"{servings:g} servings of {recipe['name']} come to more than {MAX_ENTRY_CALORIES} kcal")
+    return calories
+
+
+def parse_recipe(text: str):
+    """
+    (name, servings, [(quantity, ingredient name, kcal per portion or None)]) from
+    "Chili serves 4: 2 beef patty, 1 can beans = 220, onion"
+    Ingredients are separated by commas or new lines.
+    """
+    if ":" not in text:
+        raise ValueError("Put a colon between the recipe name and its ingredients")
+    head, body = text.split(":", 1)
+    servings = 1
+    serves = _SERVES.search(head)
+    if serves:
+        servings = int(serves.group(1))
+        head = head[:serves.start()]
+    name = " ".join(head.split())
+    if not name:
+        raise ValueError("The recipe needs a name")
+    if not 1 <= servings <= MAX_SERVINGS:
+        raise ValueError(f"Servings must be between 1 and {MAX_SERVINGS}")
+    return name, servings, parse_items(body)
+
+
+def parse_items(text: str) -> list:
+    """[(quantity, ingredient name, kcal per portion or None)] from "2 eggs, 1 toast = 80, banana" (commas or new lines)"""
+    items = []
+    for part in re.split(r"[,\n]", text):
+        part = part.strip()
+        if not part:
+            continue
+        calories = None
+        explicit = _CALORIES.search(part)
+        if explicit:
+            calories = int(explicit.group(1))
+            part = part[:explicit.start()]
+        quantity, ingredient = parse_quantity(part)
+        ingredient = " ".join(ingredient.split())
+        if not ingredient or quantity <= 0:
+            raise ValueError(f"Can't read ingredient '{part}'")
+        items.append((quantity, ingredient, calories))
+    if not items:
+        raise ValueError("The recipe needs at least one ingredient")
+    if len(items) > MAX_RECIPE_ITEMS:
+        raise ValueError(f"Recipes are limited to {MAX_RECIPE_ITEMS} ingredients")
+    return items
+
+
+def _recipe_total(recipe: dict, ingredients: dict) -> int:
+    return round(sum(ingredients[key]["calories"] * quantity for key, quantity in recipe["items"]))
+
+
+def _empty_book() -> dict:
+    return {"ingredients": {}, "recipes": {}}
+
+
+class RecipeBook:
+    """
+    Each user's recipes and the ingredients they are made of, stored as one
+    small JSON file per user in a directory the worker processes share, so a
+    change only rewrites that user's file. A recipe's total is computed when
+    it is saved and kept with it, so logging a serving is a lookup. Changing
+    an ingredient recomputes only the recipes that use it, found through a
+    reverse index. Changes wait for the user's file lock without blocking
+    the event loop and do the file I/O in a thread.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._books = {}  # user_id_str -> (version, book) as last read or written
+        self._uses = {}   # user_id_str -> {ingredient key: {recipe key}}
+
+    def _path(self, user_id_str: str) -> str:
+        return os.path.join(self.directory, f"{user_id_str}.json")
+
+    def _version_on_disk(self, user_id_str: str):
+        # Files are replaced atomically, so a new inode means a new version
+        try:
+            stat = os.stat(self._path(user_id_str))
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns)
+
+    def _read(self, user_id_str: str) -> tuple:
+        """(version, book) as stored on disk"""
+        version = self._version_on_disk(user_id_str)
+        return version, read_json(self._path(user_id_str)) or _empty_book()
+
+    def _write(self, user_id_str: str, book: dict):
+        write_json_atomic(self._path(user_id_str), book, indent=2)
+        return self._version_on_disk(user_id_str)
+
+    def _set(self, user_id_str: str, version, book: dict):
+        self._books[user_id_str] = (version, book)
+        uses = self._uses[user_id_str] = {}
+        for recipe_key, recipe in book["recipes"].items():
+            for ingredient_key, _ in recipe["items"]:
+                uses.setdefault(ingredient_key, set()).add(recipe_key)
+
+    async def _update(self, user_id_str: str, change):
+        loop = asyncio.get_running_loop()
+        async with async_file_lock(os.path.join(self.directory, f"{user_id_str}.lock")):
+            # Re-read under the lock, another worker may have just changed the file
+            self._set(user_id_str, *await loop.run_in_executor(None, self._read, user_id_str))
+            book = self._books[user_id_str][1]
+            result = change(book)
+            version = await loop.run_in_executor(None, self._write, user_id_str, book)
+            # Rebuilds the reverse index from what was written
+            self._set(user_id_str, version, book)
+        return result
+
+    def _book(self, user_id_str: str) -> dict:
+        cached = self._books.get(user_id_str)
+        if cached is None or self._version_on_disk(user_id_str) != cached[0]:
+            self._set(user_id_str, *self._read(user_id_str))
+        return self._books[user_id_str][1]
+
+    def import_file(self, path: str) -> int:
+        """
+        Split a single recipes file (the format before per-user files) into
+        the directory, keeping users who already have a file; the old file is
+        renamed to .migrated. Returns how many users were imported.
+        """
+        with file_lock(os.path.join(self.directory, ".import.lock")):
+            data = read_json(path)
+            if data is None:
+                return 0  # Another worker got here first
+            imported = 0
+            for user_id_str, book in data.get("users", {}).items():
+                if self._version_on_disk(user_id_str) is None:
+                    write_json_atomic(self._path(user_id_str), book, indent=2)
+                    imported += 1
+            os.replace(path, f"{path}.migrated")
+        return imported
+
+    def recipe(self, user_id_str: str, name: str):
+        """A recipe by name, or by the start of its name if that is unambiguous"""
+        recipes = self._book(user_id_str)["recipes"]
+        key = item_key(name)
+        if key in recipes:
+            return recipes[key]
+        matches = [recipe for recipe_key, recipe in recipes.items() if recipe_key.startswith(key)]
+        return matches[0] if len(matches) == 1 else None
+
+    def recipes(self, user_id_str: str) -> list:
+        return sorted(self._book(user_id_str)["recipes"].values(), key=lambda recipe: recipe["name"].lower())
+
+    def ingredient(self, user_id_str: str, name: str):
+        """{"name", "calories"} of a known ingredient, or None"""
+        return self._book(user_id_str)["ingredients"].get(item_key(name))
+
+    def recipe_items(self, user_id_str: str, recipe: dict) -> list:
+        """(quantity, ingredient) pairs of a recipe"""
+        ingredients = self._book(user_id_str)["ingredients"]
+        return [(quantity, ingredients[key]) for key, quantity in recipe["items"]]
+
+    def _set_ingredients(self, user_id_str: str, book: dict, ingredients: dict, skip: str = None) -> list:
+        """Store ingredient calories and recompute the recipes using any that changed"""
+        stale = set()
+        for key, ingredient in ingredients.items():
+            if book["ingredients"].get(key) != ingredient:
+                book["ingredients"][key] = ingredient
+                stale |= self._uses.get(user_id_str, {}).get(key, set())
+        stale.discard(skip)
+        updated = []
+        for recipe_key in sorted(stale):
+            recipe = book["recipes"].get(recipe_key)
+            if recipe:
+                recipe["calories"] = _recipe_total(recipe, book["ingredients"])
+                updated.append(recipe["name"])
+        return updated
+
+    async def save_recipe(self, user_id_str: str, name: str, servings: int, items: list):
+        """
+        Add or replace a recipe; items are (quantity, ingredient name, kcal per portion).
+        Returns (recipe, names of other recipes whose totals changed).
+        """
+        def change(book):
+            ingredients = {item_key(ingredient): {"name": ingredient, "calories": calories} for _, ingredient, calories in items}
+            updated = self._set_ingredients(user_id_str, book, ingredients, skip=item_key(name))
+            recipe = book["recipes"][item_key(name)] = {
+                "name": name,
+                "servings": servings,
+                "items": [[item_key(ingredient), quantity] for quantity, ingredient, _ in items]
+            }
+            recipe["calories"] = _recipe_total(recipe, book["ingredients"])
+            return recipe, updated
+        return await self._update(user_id_str, change)
+
+    async def set_ingredient(self, user_id_str: str, name: str, calories: int) -> list:
+        """Change an ingredient's kcal per portion, returning the names of the recipes that changed"""
+        def change(book):
+            return self._set_ingredients(user_id_str, book, {item_key(name): {"name": name, "calories": calories}})
+        return await self._update(user_id_str, change)
+
+    async def remove_recipe(self, user_id_str: str, name: str) -> bool:
+        def change(book):
+            return book["recipes"].pop(item_key(name), None) is not None
+        return await self._update(user_id_str, change)
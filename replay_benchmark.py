@@ -0,0 +1,68 @@
+"""
+Replay benchmark.
+
+Runs every answer in a corpus recorded with MODEL_RECORD_PATH through the
+parser for its kind of request (image, describe, estimate), with no
+network, and reports per kind how many answers there are, how many the
+parser could not read (markdown-wrapped or malformed output falls back to
+a partial result), the parse time and the model latency that was recorded.
+Fails (exit code 1) if more answers fail to parse than --max-unparsed.
+
+    python replay_benchmark.py calls.jsonl.gz [--repeat 20] [--max-unparsed 0.05]
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+
+os.environ.setdefault("DISCORD_TOKEN", "replay-benchmark")  # config.py refuses to load without one
+
+from image_analysis import PARSERS
+from model_replay import load_corpus
+
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded model answers through the parsers")
+    parser.add_argument("corpus")
+    parser.add_argument("--repeat", type=int, default=20, help="parse each answer this many times")
+    parser.add_argument("--max-unparsed", type=float, default=0.05, help="highest acceptable share of unreadable answers")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)  # The parsers log every unreadable answer
+    entries = [entry for entry in load_corpus(args.corpus) if entry["kind"] in PARSERS]
+    if not entries:
+        print(f"No answers to replay in {args.corpus}")
+        sys.exit(1)
+
+    unparsed_total = 0
+    print(f"{'kind':<10}{'answers':>8}{'unparsed':>10}{'parse us':>10}{'model p50':>11}{'model p95':>11}")
+    for kind, parse in PARSERS.items():
+        texts = [entry["text"].strip() for entry in entries if entry["kind"] == kind]
+        if not texts:
+            continue
+        unparsed = sum(1 for text in texts if parse(text)["error"])
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            for text in texts:
+                parse(text)
+        parse_us = (time.perf_counter() - started) / (args.repeat * len(texts)) * 1e6
+        latencies = [entry["latency"] for entry in entries if entry["kind"] == kind]
+        print(f"{kind:<10}{len(texts):>8}{unparsed:>10}{parse_us:>10.1f}"
+              f"{statistics.median(latencies):>10.2f}s{percentile(latencies, 0.95):>10.2f}s")
+        unparsed_total += unparsed
+
+    share = unparsed_total / len(entries)
+    if share > args.max_unparsed:
+        print(f"FAIL: {share:.0%} of answers could not be parsed (limit {args.max_unparsed:.0%})")
+    sys.exit(1 if share > args.max_unparsed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Gemini client resilience check.
+
+Drives ResilientGeminiClient against a fault-injecting fake model (no
+network) and checks retries, the circuit breaker, deadlines and hedged
+requests behave as intended. Fails (exit code 1) if any scenario doesn't.
+
+    python resilience_check.py
+"""
+import asyncio
+import sys
+import threading
+import time
+
+from gemini_client import (
+    ResilientGeminiClient, CircuitBreaker, CircuitOpenError, DeadlineExceededError, GeminiError, PermissionDeniedError
+)
+
+
+class HTTPFault(Exception):
+    """An API error carrying a status code, like google.api_core exceptions"""
+
+    def __init__(self, code: int):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeModel:
+    """
+    Blocking generate_content that plays back a script, one step per call:
+    an exception to raise, a number of seconds to take before answering, or
+    None to answer at once. Calls past the end of the script answer at once.
+    """
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, contents):
+        with self._lock:
+            step = self.script[self.calls] if self.calls < len(self.script) else None
+            self.calls += 1
+        if isinstance(step, BaseException):
+            raise step
+        if step:
+            time.sleep(step)
+        return FakeResponse("ok")
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def client(model, breaker=None, **options) -> ResilientGeminiClient:
+    options.setdefault("base_delay", 0.001)
+    options.setdefault("max_delay", 0.005)
+    return ResilientGeminiClient(model, breaker=breaker or CircuitBreaker(), **options)
+
+
+async def outcome(gemini, deadline: float = None):
+    """("ok", seconds) or (GeminiError subclass name, seconds)"""
+    started = time.monotonic()
+    try:
+        await gemini.generate_content("prompt", deadline=deadline)
+        result = "ok"
+    except GeminiError as e:
+        result = type(e).__name__
+    return result, time.monotonic() - started
+
+
+async def retries_transient_errors():
+    model = FakeModel(HTTPFault(503), HTTPFault(429), None)
+    result, _ = await outcome(client(model, max_retries=3))
+    return result == "ok" and model.calls == 3, f"{result} after {model.calls} calls"
+
+
+async def retries_backend_timeouts():
+    # A TimeoutError from the backend (e.g. LocalModelBackend's read timeout) is transient, not the deadline
+    model = FakeModel(TimeoutError("read timed out"), None)
+    result, _ = await outcome(client(model, max_retries=3, deadline=5))
+    return result == "ok" and model.calls == 2, f"{result} after {model.calls} calls"
+
+
+async def stops_on_permanent_errors():
+    model = FakeModel(HTTPFault(403), None)
+    breaker = CircuitBreaker(failure_threshold=1)
+    result, _ = await outcome(client(model, breaker, max_retries=3))
+    passed = result == PermissionDeniedError.__name__ and model.calls == 1 and breaker.state == breaker.CLOSED
+    return passed, f"{result} after {model.calls} calls, breaker {breaker.state}"
+
+
+async def breaker_counts_calls_not_attempts():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30, clock=clock)
+    model = FakeModel(*[HTTPFault(503)] * 12)
+    gemini = client(model, breaker, max_retries=3)
+    states = []
+    for _ in range(3):
+        await outcome(gemini)
+        states.append(breaker.state)
+    calls_while_open = model.calls
+    rejected, _ = await outcome(gemini)
+    clock.now += 30
+    model.script = []  # The service recovered
+    probe, _ = await outcome(gemini)
+    passed = (
+        states == [breaker.CLOSED, breaker.CLOSED, breaker.OPEN] and rejected == CircuitOpenError.__name__
+        and model.calls == calls_while_open + 1 and probe == "ok" and breaker.state == breaker.CLOSED
+    )
+    return passed, f"states {states}, then {rejected}, probe {probe}, breaker {breaker.state}"
+
+
+async def deadline_bounds_slow_calls():
+    model = FakeModel(1.0)
+    breaker = CircuitBreaker()
+    result, seconds = await outcome(client(model, breaker), deadline=0.1)
+    passed = result == DeadlineExceededError.__name__ and seconds < 0.5
+    return passed, f"{result} in {seconds:.2f}s"
+
+
+async def hedge_answers_stragglers():
+    model = FakeModel(1.0, None)
+    result, seconds = await outcome(client(model, hedge_delay=0.05), deadline=5)
+    passed = result == "ok" and model.calls == 2 and seconds < 0.5
+    return passed, f"{result} in {seconds:.2f}s with {model.calls} requests"
+
+
+SCENARIOS = [
+    retries_transient_errors, retries_backend_timeouts, stops_on_permanent_errors,
+    breaker_counts_calls_not_attempts, deadline_bounds_slow_calls, hedge_answers_stragglers
+]
+
+
+async def run() -> int:
+    failed = 0
+    for scenario in SCENARIOS:
+        passed, detail = await scenario()
+        failed += not passed
+        print(f"{'ok  ' if passed else 'FAIL'} {scenario.__name__}: {detail}")
+    return failed
+
+
+def main():
+    failed = asyncio.run(run())
+    if failed:
+        print(f"FAIL: {failed} of {len(SCENARIOS)} scenarios")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+import gzip
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+from entries import DayLog, user_data_from_dict, user_data_to_dict
+from nutrition import MACROS
+from shared_store import file_lock, read_json
+
+OFF = "off"
+ARCHIVE = "archive"  # Old days move to gzip files per user-month, loaded on demand
+SUMMARY = "summary"  # Old days are reduced to their totals, entries are dropped
+POLICIES = (OFF, ARCHIVE, SUMMARY)
+
+MIN_HOT_DAYS = 31  # Leaderboards look back 30 days, so those always stay in memory
+
+
+def day_summary(day_log: DayLog) -> dict:
+    """Compact form of a day kept after its entries leave memory"""
+    summary = {"total_calories": day_log.total_calories, "entries": len(day_log.foods)}
+    if day_log.macro_entries:
+        summary["macros"] = day_log.macros
+        summary["macro_entries"] = day_log.macro_entries
+    return summary
+
+
+def _add_summaries(previous: dict, summary: dict) -> dict:
+    combined = {
+        "total_calories": previous["total_calories"] + summary["total_calories"],
+        "entries": previous["entries"] + summary["entries"]
+    }
+    if previous.get("macro_entries") or summary.get("macro_entries"):
+        combined["macros"] = {
+            macro: round(previous.get("macros", {}).get(macro, 0) + summary.get("macros", {}).get(macro, 0), 1)
+            for macro in MACROS
+        }
+        combined["macro_entries"] = previous.get("macro_entries", 0) + summary.get("macro_entries", 0)
+    return combined
+
+
+def _summarize_into(previous: dict, day_log: DayLog) -> dict:
+    """
+    A summary-only day's totals with day_log's entries added, unless
+    previous already counts them: the IDs of counted entries are kept with
+    the summary, so summarizing the same day twice changes nothing
+    """
+    counted = set(previous.get("ids", [])) if previous else set()
+    new_foods = [food for food in day_log.foods if food.id not in counted]
+    if previous and not new_foods:
+        return previous
+    summary = day_summary(DayLog(sum(food.calories for food in new_foods), new_foods))
+    if previous:
+        summary = _add_summaries(previous, summary)
+    summary["ids"] = sorted(counted.union(food.id for food in new_foods))
+    return summary
+
+
+def summary_day_log(summary: dict) -> DayLog:
+    """A day known only from its summary: totals, but no entries"""
+    day_log = DayLog(summary["total_calories"])
+    if summary.get("macro_entries"):
+        day_log.macro_totals = [summary["macros"][macro] for macro in MACROS]
+        day_log.macro_entries = summary["macro_entries"]
+    return day_log
+
+
+def hot_days(user_data: dict, start: date = None, end: date = None):
+    """(day, DayLog) from the in-memory store within a range, oldest first"""
+    start_key = start.isoformat() if start else None
+    end_key = end.isoformat() if end else None
+    for day in sorted(user_data):
+        if (start_key and day < start_key) or (end_key and day > end_key):
+            continue
+        yield day, user_data[day]
+
+
+def _merge_day_logs(cold: DayLog, hot: DayLog) -> DayLog:
+    """Both halves of a day; the macro sums are added, a summary-only day has them without entries"""
+    merged = DayLog(cold.total_calories + hot.total_calories, cold.foods + hot.foods)
+    merged.macro_totals = [a + b for a, b in zip(cold.macro_totals, hot.macro_totals)]
+    merged.macro_entries = cold.macro_entries + hot.macro_entries
+    return merged
+
+
+def merge_days(cold, hot):
+    """
+    Merge two ordered (day, DayLog) streams. A day can be in both when old
+    entries were imported after it was archived; it is merged until the next
+    compaction moves those entries to the archive as well.
+    """
+    hot = iter(hot)
+    pending = next(hot, None)
+    for day, day_log in cold:
+        while pending and pending[0] < day:
+            yield pending
+            pending = next(hot, None)
+        if pending and pending[0] == day:
+            day_log = _merge_day_logs(day_log, pending[1])
+            pending = next(hot, None)
+        yield day, day_log
+    while pending:
+        yield pending
+        pending = next(hot, None)
+
+
+class ColdArchive:
+    """
+    Days moved out of memory, as one gzip'd JSON file per user and month plus
+    a small summary file per user with every archived day's totals. Month
+    files are only read when a report reaches back that far; the last few
+    read are cached. store() runs in an executor and exports read from
+    their own thread, so the cache is only touched under _lock.
+    """
+
+    def __init__(self, directory: str, cached_months: int = 32):
+        self.directory = directory
+        self.cached_months = cached_months
+        self._months = OrderedDict()  # (user_id_str, YYYY-MM) -> {day: DayLog}
+        self._lock = threading.Lock()
+
+    @property
+    def loaded_months(self) -> int:
+        return len(self._months)
+
+    def _user_dir(self, user_id_str: str) -> str:
+        return os.path.join(self.directory, user_id_str)
+
+    def _month_path(self, user_id_str: str, month: str) -> str:
+        return os.path.join(self._user_dir(user_id_str), f"{month}.json.gz")
+
+    def _summary_path(self, user_id_str: str) -> str:
+        return os.path.join(self._user_dir(user_id_str), "summary.json")
+
+    def summaries(self, user_id_str: str) -> dict:
+        """{day: {"total_calories", "entries"}} for every archived day"""
+        return read_json(self._summary_path(user_id_str), {})
+
+    def _read_month(self, user_id_str: str, month: str) -> dict:
+        try:
+            with gzip.open(self._month_path(user_id_str, month), 'rt', encoding='utf-8') as f:
+                return user_data_from_dict(json.load(f))
+        except FileNotFoundError:
+            return {}
+
+    def month(self, user_id_str: str, month: str) -> dict:
+        """{day: DayLog} of one archived month (empty in summary mode)"""
+        key = (user_id_str, month)
+        # Read under the lock too: store() invalidates a month only after replacing
+        # its file, so a month read here is either dropped by it or already new
+        with self._lock:
+            days = self._months.get(key)
+            if days is None:
+                days = self._months[key] = self._read_month(user_id_str, month)
+                if len(self._months) > self.cached_months:
+                    self._months.popitem(last=False)
+            else:
+                self._months.move_to_end(key)
+            return days
+
+    def day(self, user_id_str: str, day: str):
+        """An archived day, or None; summary-only days come back without entries"""
+        day_log = self.month(user_id_str, day[:7]).get(day)
+        if day_log is not None:
+            return day_log
+        summary = self.summaries(user_id_str).get(day)
+        return summary_day_log(summary) if summary else None
+
+    def iter_days(self, user_id_str: str, start: date = None, end: date = None):
+        """
+        (day, DayLog) for archived days in a range, oldest first. Months are
+        read one at a time and not cached, so a full export stays small.
+        """
+        summaries = self.summaries(user_id_str)
+        start_key = start.isoformat() if start else None
+        end_key = end.isoformat() if end else None
+        days = [day for day in sorted(summaries) if not (start_key and day < start_key) and not (end_key and day > end_key)]
+        month, month_days = None, {}
+        for day in days:
+            if day[:7] != month:
+                month = day[:7]
+                with self._lock:
+                    month_days = self._months.get((user_id_str, month))
+                month_days = month_days or self._read_month(user_id_str, month)
+            yield day, month_days.get(day) or summary_day_log(summaries[day])
+
+    def store(self, user_id_str: str, days: dict, keep_entries: bool):
+        """
+        Add {day: DayLog} to the archive, merging into days already there.
+        Entries already archived or summarized (same ID) are skipped, so
+        storing the same days twice, e.g. after a crash before they left
+        memory, is harmless.
+        """
+        os.makedirs(self._user_dir(user_id_str), exist_ok=True)
+        with file_lock(os.path.join(self._user_dir(user_id_str), ".lock")):
+            summaries = self.summaries(user_id_str)
+            by_month = {}
+            for day, day_log in days.items():
+                by_month.setdefault(day[:7], {})[day] = day_log
+
+            for month, month_days in sorted(by_month.items()):
+                if not keep_entries:
+                    for day, day_log in month_days.items():
+                        summaries[day] = _summarize_into(summaries.get(day), day_log)
+                    continue
+                archived = self._read_month(user_id_str, month)
+                for day, day_log in month_days.items():
+                    target = archived.setdefault(day, DayLog())
+                    known_ids = {food.id for food in target.foods}
+                    for food in day_log.foods:
+                        if food.id not in known_ids:
+                            target.add_food(food)
+                    target.foods.sort(key=lambda food: food.timestamp)
+                    summaries[day] = day_summary(target)
+                self._write_gzip(self._month_path(user_id_str, month), user_data_to_dict(archived))
+                with self._lock:
+                    self._months.pop((user_id_str, month), None)
+
+            tmp_path = f"{self._summary_path(user_id_str)}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(json.dumps(dict(sorted(summaries.items())), separators=(',', ':')))
+            os.replace(tmp_path, self._summary_path(user_id_str))
+
+    def _write_gzip(self, path: str, data: dict):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        # dumps uses the C encoder, dump would stream through the Python one
+        with gzip.open(tmp_path, 'wb', compresslevel=6) as f:
+            f.write(json.dumps(data, separators=(',', ':')).encode('utf-8'))
+        os.replace(tmp_path, path)
+
+
+class RetentionPolicy:
+    """Keeps the last hot_days days of each user in memory and hands older ones to the archive"""
+
+    def __init__(self, archive: ColdArchive, policy: str = OFF, hot_days: int = 365):
+        self.archive = archive
+        self.policy = policy
+        self.hot_days = max(hot_days, MIN_HOT_DAYS)
+
+    @property
+    def enabled(self) -> bool:
+        return self.policy != OFF
+
+    def cutoff(self, today: date) -> str:
+        """Days before this one are cold"""
+        return (today - timedelta(days=self.hot_days - 1)).isoformat()
+
+    def is_cold(self, day: str, today: date) -> bool:
+        return self.enabled and day < self.cutoff(today)
+
+    def cold_days(self, user_data: dict, today: date) -> dict:
+        """{day: DayLog} of a user's days that belong in the archive (none when retention is off)"""
+        if not self.enabled:
+            return {}
+        cutoff = self.cutoff(today)
+        return {day: day_log for day, day_log in user_data.items() if day < cutoff}
+
+    def archive_days(self, user_id_str: str, cold: dict):
+        """Write cold days to the archive (blocking, gzip; run in an executor from async code)"""
+        self.archive.store(user_id_str, cold, keep_entries=self.policy == ARCHIVE)
+
+    def compact(self, user_id_str: str, user_data: dict, today: date) -> int:
+        """Move a user's cold days out of user_data, returning how many days moved"""
+        cold = self.cold_days(user_data, today)
+        if not cold:
+            return 0
+        # Written before the days leave memory, see ColdArchive.store
+        self.archive_days(user_id_str, cold)
+        for day in cold:
+            del user_data[day]
+        return len(cold)
@@ -0,0 +1,192 @@
+import asyncio
+import json
+import logging
+import os
+from contextlib import contextmanager, asynccontextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+
+def _lock_file(handle):
+    if fcntl:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+    else:
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+
+
+def _try_lock_file(handle) -> bool:
+    """Take the lock if it is free, without waiting for it"""
+    if fcntl:
+        try:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+    handle.seek(0)
+    try:
+        msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def _unlock_file(handle):
+    if fcntl:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+    else:
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def read_json(path: str, default=None):
+    """Load a JSON file, or return default if it does not exist"""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+
+def write_json_atomic(path: str, data, **dump_options):
+    """Write a JSON file through a temporary file so readers never see half of it"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, **dump_options)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def file_lock(lock_path: str):
+    """Exclusive cross-process lock held on a lock file"""
+    with open(lock_path, 'a+') as handle:
+        _lock_file(handle)
+        try:
+            yield
+        finally:
+            _unlock_file(handle)
+
+
+@asynccontextmanager
+async def async_file_lock(lock_path: str, poll: float = 0.002, max_poll: float = 0.05):
+    """
+    file_lock for coroutines: polls for the lock with a growing sleep instead
+    of blocking the event loop while another process holds it
+    """
+    with open(lock_path, 'a+') as handle:
+        delay = poll
+        while not _try_lock_file(handle):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_poll)
+        try:
+            yield
+        finally:
+            _unlock_file(handle)
+
+
+class SharedUserStore:
+    """
+    Calorie data stored as one file per user in a directory shared by every
+    worker process. Writers take an exclusive per-user file lock, so whichever
+    process holds it owns that user's data until the write is finished.
+    """
+
+    def __init__(self, directory: str, encode=None, decode=None):
+        self.directory = directory
+        # Convert between in-memory user data and its JSON form
+        self._encode = encode or (lambda data: data)
+        self._decode = decode or (lambda data: data)
+        os.makedirs(directory, exist_ok=True)
+        # Version of each user file as last seen by this process
+        self._seen_versions = {}
+
+    def _path(self, user_id_str: str) -> str:
+        return os.path.join(self.directory, f"{user_id_str}.json")
+
+    def _lock_path(self, user_id_str: str) -> str:
+        return os.path.join(self.directory, f"{user_id_str}.lock")
+
+    @contextmanager
+    def owned(self, user_id_str: str):
+        """Hold the cross-process write lock for a single user"""
+        with file_lock(self._lock_path(user_id_str)):
+            yield
+
+    @asynccontextmanager
+    async def owned_async(self, user_id_str: str):
+        """owned() for coroutines, waiting for the lock without blocking the event loop"""
+        async with async_file_lock(self._lock_path(user_id_str)):
+            yield
+
+    def _signature(self, user_id_str: str):
+        # Files are replaced atomically, so a new inode means a new version
+        try:
+            stat = os.stat(self._path(user_id_str))
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns)
+
+    def load_user(self, user_id_str: str):
+        """Read one user's data from disk, or None if the user has no file"""
+        version = self._signature(user_id_str)
+        if version is None:
+            return None
+        with open(self._path(user_id_str), 'r') as f:
+            data = self._decode(json.load(f))
+        self._seen_versions[user_id_str] = version
+        return data
+
+    def save_user(self, user_id_str: str, data: dict):
+        """Atomically replace one user's file"""
+        self.write_user(user_id_str, self._encode(data))
+
+    def write_user(self, user_id_str: str, stored):
+        """save_user for data already in its stored (JSON) form, e.g. encoded on the event loop and written in a thread"""
+        write_json_atomic(self._path(user_id_str), stored, separators=(',', ':'))
+        self._seen_versions[user_id_str] = self._signature(user_id_str)
+
+    def refresh_into(self, user_calories: dict, user_id_str: str):
+        """Reload a user into the in-memory dict if another process changed it, returning whether it did"""
+        version = self._signature(user_id_str)
+        if version is None or version == self._seen_versions.get(user_id_str):
+            return False
+        try:
+            data = self.load_user(user_id_str)
+        except (OSError, ValueError) as e:
+            logger.error(f"Error refreshing shared data for user {user_id_str}: {e}")
+            return False
+        if data is None:
+            return False
+        user_calories[user_id_str] = data
+        return True
+
+    def load_all(self) -> dict:
+        """Load every user file in the store"""
+        data = {}
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json'):
+                continue
+            user_id_str = filename[:-len('.json')]
+            try:
+                user_data = self.load_user(user_id_str)
+            except (OSError, ValueError) as e:
+                logger.error(f"Error loading shared data for user {user_id_str}: {e}")
+                continue
+            if user_data is not None:
+                data[user_id_str] = user_data
+        return data
+
+    def is_empty(self) -> bool:
+        return not any(name.endswith('.json') for name in os.listdir(self.directory))
+
+    def import_snapshot(self, user_calories: dict):
+        """Seed the store from a single-file snapshot (e.g. user_calories.json)"""
+        for user_id_str, user_data in user_calories.items():
+            with self.owned(user_id_str):
+                self.save_user(user_id_str, user_data)
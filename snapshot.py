@@ -0,0 +1,345 @@
+"""
+Compact binary snapshot of all users' calorie data.
+
+Layout (little-endian, version 2):
+
+    header   magic "CCBS", u16 version, u32 user count, u64 index offset
+    records  one length-delimited record per user (see encode_user)
+    index    per user: u16 id length, id bytes, u64 record offset, u32 record length
+
+Version 2 adds a flag and five float32 macro amounts to each food. Version 1
+files are still read; their records are re-encoded on the next save.
+
+The index sits at the end so records can be streamed out without holding the
+whole snapshot in memory. Users are decoded lazily on first access, and users
+that were never touched are copied byte-for-byte on the next save. The bot
+also keeps each decoded user's record from the last save (see
+snapshot_records), so a save only re-encodes the users that changed.
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+from collections.abc import MutableMapping
+from datetime import date
+from entries import FoodEntry, DayLog, user_data_to_dict, user_data_from_dict
+from nutrition import MACROS
+
+MAGIC = b"CCBS"
+VERSION = 2
+READABLE_VERSIONS = (1, 2)
+
+_HEADER = struct.Struct("<4sHIQ")
+_INDEX_KEY = struct.Struct("<H")
+_INDEX_POS = struct.Struct("<QI")
+_COUNT = struct.Struct("<I")
+_STRING = struct.Struct("<H")
+_DAY_COUNT = struct.Struct("<H")
+_DAY = struct.Struct("<IiI")
+_FOOD_ID = struct.Struct("<B")
+_FOOD = struct.Struct("<Iiq")
+_MACRO_FLAG = struct.Struct("<B")
+_MACROS = struct.Struct(f"<{len(MACROS)}f")
+
+
+class SnapshotError(Exception):
+    """Raised for unreadable or unsupported snapshot files"""
+
+
+def encode_user(user_data: dict) -> bytes:
+    """Pack one user's {day: DayLog} mapping into a record"""
+    names = {}
+    body = [_DAY_COUNT.pack(len(user_data))]
+    for day, day_log in user_data.items():
+        body.append(_DAY.pack(date.fromisoformat(day).toordinal(), day_log.total_calories, len(day_log.foods)))
+        for food in day_log.foods:
+            entry_id = food.id.encode()
+            name_index = names.setdefault(food.name, len(names))
+            body.append(_FOOD_ID.pack(len(entry_id)) + entry_id)
+            body.append(_FOOD.pack(name_index, food.calories, food.timestamp))
+            if food.macros:
+                body.append(_MACRO_FLAG.pack(1) + _MACROS.pack(*food.macros))
+            else:
+                body.append(_MACRO_FLAG.pack(0))
+
+    # Each distinct food name is stored once per user
+    table = [_COUNT.pack(len(names))]
+    for name in names:
+        encoded = name.encode()
+        table.append(_STRING.pack(len(encoded)) + encoded)
+    return b"".join(table + body)
+
+
+def decode_user(buffer, offset: int = 0, version: int = VERSION) -> dict:
+    """Unpack a record written by encode_user (or by an older version of it)"""
+    (name_count,) = _COUNT.unpack_from(buffer, offset)
+    offset += _COUNT.size
+    names = []
+    for _ in range(name_count):
+        (length,) = _STRING.unpack_from(buffer, offset)
+        offset += _STRING.size
+        names.append(sys.intern(bytes(buffer[offset:offset + length]).decode()))
+        offset += length
+
+    user_data = {}
+    (day_count,) = _DAY_COUNT.unpack_from(buffer, offset)
+    offset += _DAY_COUNT.size
+    for _ in range(day_count):
+        ordinal, total_calories, food_count = _DAY.unpack_from(buffer, offset)
+        offset += _DAY.size
+        foods = []
+        for _ in range(food_count):
+            (id_length,) = _FOOD_ID.unpack_from(buffer, offset)
+            offset += _FOOD_ID.size
+            entry_id = bytes(buffer[offset:offset + id_length]).decode()
+            offset += id_length
+            name_index, calories, timestamp = _FOOD.unpack_from(buffer, offset)
+            offset += _FOOD.size
+            macros = None
+            if version >= 2:
+                (has_macros,) = _MACRO_FLAG.unpack_from(buffer, offset)
+                offset += _MACRO_FLAG.size
+                if has_macros:
+                    macros = tuple(round(grams, 1) for grams in _MACROS.unpack_from(buffer, offset))
+                    offset += _MACROS.size
+            foods.append(FoodEntry(entry_id, names[name_index], calories, timestamp, macros))
+        user_data[date.fromordinal(ordinal).isoformat()] = DayLog(total_calories, foods)
+    return user_data
+
+
+class SnapshotUsers(MutableMapping):
+    """
+    user_id_str -> {day: DayLog} mapping backed by a snapshot file.
+    A user's record is only decoded the first time that user is accessed.
+    """
+
+    def __init__(self):
+        self._decoded = {}
+        self._pending = {}  # user_id_str -> (offset, length) in self._buffer
+        self._buffer = None
+        self._file = None
+        self._version = VERSION
+
+    def _attach(self, path: str, index: dict, use_mmap: bool, version: int = VERSION):
+        """Point undecoded users at (a new version of) the snapshot file"""
+        old_file, old_buffer = self._file, self._buffer
+        if use_mmap and index:
+            self._file = open(path, 'rb')
+            self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._file = None
+            with open(path, 'rb') as f:
+                self._buffer = f.read()
+        self._version = version
+        # Users decoded earlier keep their in-memory records
+        self._pending = {
+            user_id_str: position for user_id_str, position in index.items() if user_id_str not in self._decoded
+        }
+        if isinstance(old_buffer, mmap.mmap):
+            old_buffer.close()
+        if old_file:
+            old_file.close()
+
+    def raw_record(self, user_id_str: str):
+        """Encoded record (in the current format) of a user that has not been decoded yet, else None"""
+        position = self._pending.get(user_id_str)
+        if position is None:
+            return None
+        offset, length = position
+        if self._version != VERSION:
+            # Older format: transcoded without keeping the user in memory
+            return encode_user(decode_user(self._buffer, offset, self._version))
+        return self._buffer[offset:offset + length]
+
+    def raw_position(self, user_id_str: str):
+        """(offset, length) in self._buffer of an undecoded user's record, if it is in the current format"""
+        if self._version != VERSION:
+            return None
+        return self._pending.get(user_id_str)
+
+    @property
+    def buffer(self):
+        """What the (offset, length) records of snapshot_records point into"""
+        return self._buffer
+
+    @property
+    def decoded_count(self) -> int:
+        return len(self._decoded)
+
+    @property
+    def decoded_ids(self) -> list:
+        """Users currently held in memory"""
+        return list(self._decoded)
+
+    def __getitem__(self, user_id_str):
+        try:
+            return self._decoded[user_id_str]
+        except KeyError:
+            pass
+        offset, _ = self._pending.pop(user_id_str)
+        user_data = self._decoded[user_id_str] = decode_user(self._buffer, offset, self._version)
+        return user_data
+
+    def __setitem__(self, user_id_str, user_data):
+        self._pending.pop(user_id_str, None)
+        self._decoded[user_id_str] = user_data
+
+    def __delitem__(self, user_id_str):
+        if self._pending.pop(user_id_str, None) is None:
+            del self._decoded[user_id_str]
+
+    def __contains__(self, user_id_str):
+        return user_id_str in self._decoded or user_id_str in self._pending
+
+    def __iter__(self):
+        yield from list(self._decoded)
+        yield from list(self._pending)
+
+    def __len__(self):
+        return len(self._decoded) + len(self._pending)
+
+
+def _read_index(buffer):
+    """(index, format version) of a snapshot"""
+    if len(buffer) < _HEADER.size:
+        raise SnapshotError("Snapshot file is truncated")
+    magic, version, user_count, index_offset = _HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise SnapshotError("Not a calorie snapshot file")
+    if version not in READABLE_VERSIONS:
+        raise SnapshotError(f"Unsupported snapshot version {version}")
+
+    index = {}
+    offset = index_offset
+    for _ in range(user_count):
+        (length,) = _INDEX_KEY.unpack_from(buffer, offset)
+        offset += _INDEX_KEY.size
+        user_id_str = bytes(buffer[offset:offset + length]).decode()
+        offset += length
+        index[user_id_str] = _INDEX_POS.unpack_from(buffer, offset)
+        offset += _INDEX_POS.size
+    return index, version
+
+
+def load_snapshot(path: str, use_mmap: bool = True) -> SnapshotUsers:
+    """Open a snapshot; only its index is read up front"""
+    with open(path, 'rb') as f:
+        head = f.read(_HEADER.size)
+        f.seek(0)
+        if use_mmap and head:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                index, version = _read_index(buffer)
+        else:
+            index, version = _read_index(f.read())
+    users = SnapshotUsers()
+    users._attach(path, index, use_mmap, version)
+    return users
+
+
+def snapshot_records(users, encoded: dict = None) -> list:
+    """
+    (user_id_str, record) of every user, for write_snapshot: an undecoded
+    user's record as an (offset, length) slice of the current file, any other
+    as bytes. Encoded records are reused from (and added to) encoded, so the
+    caller drops a user from it whenever that user changes.
+    """
+    encoded = {} if encoded is None else encoded
+    lazy = isinstance(users, SnapshotUsers)
+    records = []
+    for user_id_str in users:
+        record = users.raw_position(user_id_str) if lazy else None
+        if record is None and lazy and user_id_str in users._pending:
+            record = users.raw_record(user_id_str)  # Older format, transcoded
+        if record is None:
+            record = encoded.get(user_id_str)
+            if record is None:
+                record = encoded[user_id_str] = encode_user(users[user_id_str])
+        records.append((user_id_str, record))
+    return records
+
+
+def write_snapshot(path: str, records: list, buffer=None) -> dict:
+    """
+    Write records from snapshot_records atomically, reading (offset, length)
+    records from buffer, and return the new file's index. Touches no user
+    data, so it can run in a thread while the records' users keep changing.
+    """
+    tmp_path = f"{path}.tmp"
+    index = {}
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, 0, 0))
+        offset = _HEADER.size
+        for user_id_str, record in records:
+            if isinstance(record, tuple):
+                record_offset, length = record
+                record = buffer[record_offset:record_offset + length]
+            f.write(record)
+            index[user_id_str] = (offset, len(record))
+            offset += len(record)
+
+        index_offset = offset
+        for user_id_str, (record_offset, length) in index.items():
+            encoded = user_id_str.encode()
+            f.write(_INDEX_KEY.pack(len(encoded)) + encoded + _INDEX_POS.pack(record_offset, length))
+
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, VERSION, len(index), index_offset))
+    os.replace(tmp_path, path)
+    return index
+
+
+def attach_saved(users, path: str, index: dict):
+    """After write_snapshot: move undecoded users over to the new file if they were read from a mapping or an older format"""
+    # An in-memory buffer stays valid after the old file is replaced
+    if isinstance(users, SnapshotUsers) and (isinstance(users._buffer, mmap.mmap) or users._version != VERSION):
+        users._attach(path, index, use_mmap=isinstance(users._buffer, mmap.mmap))
+
+
+def save_snapshot(path: str, users):
+    """Write all users atomically, copying undecoded records as-is"""
+    buffer = users.buffer if isinstance(users, SnapshotUsers) else None
+    attach_saved(users, path, write_snapshot(path, snapshot_records(users), buffer))
+
+
+def import_json(path: str) -> dict:
+    """Read a user_calories.json style file into records"""
+    with open(path, 'r') as f:
+        return {user_id_str: user_data_from_dict(user_data) for user_id_str, user_data in json.load(f).items()}
+
+
+def encode_user_json(user_data: dict) -> str:
+    """One user's entry in user_calories.json, indented to sit under the top level"""
+    return json.dumps(user_data_to_dict(user_data), indent=2).replace("\n", "\n  ")
+
+
+def write_json_records(path: str, records: list):
+    """Write (user_id_str, encode_user_json text) pairs as user_calories.json, laid out as json.dump(indent=2) would"""
+    with open(path, 'w') as f:
+        if not records:
+            f.write("{}")
+            return
+        f.write("{\n")
+        f.write(",\n".join(f"  {json.dumps(user_id_str)}: {text}" for user_id_str, text in records))
+        f.write("\n}")
+
+
+def export_json(users, path: str):
+    """Write records out in the user_calories.json layout"""
+    write_json_records(path, [(user_id_str, encode_user_json(users[user_id_str])) for user_id_str in users])
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert between JSON and binary calorie snapshots")
+    parser.add_argument("action", choices=["import", "export"], help="import: JSON -> snapshot, export: snapshot -> JSON")
+    parser.add_argument("source")
+    parser.add_argument("destination")
+    args = parser.parse_args()
+
+    if args.action == "import":
+        save_snapshot(args.destination, import_json(args.source))
+    else:
+        export_json(load_snapshot(args.source), args.destination)
+    print(f"Wrote {args.destination}")
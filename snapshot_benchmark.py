@@ -0,0 +1,131 @@
+"""
+Snapshot load/save benchmark.
+
+Writes synthetic snapshots of the given sizes (users with a year of entries
+each) and times what the bot does with them: opening one at startup (only
+the index is read, memory-mapped or read into memory), decoding a user on
+first access, and saving after one user changed, split into the part that
+runs on the event loop (snapshot_records) and the write in a thread. Fails
+(exit code 1) if the on-loop part of a save takes longer than --max-loop-ms.
+
+    python snapshot_benchmark.py [--sizes 10MB 100MB 1GB] [--dir /tmp]
+"""
+import argparse
+import mmap
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import snapshot
+from entries import DayLog, FoodEntry
+from nutrition import MACROS
+
+MENU = [
+    "Oatmeal with berries", "Chicken salad", "Banana", "Coffee with milk", "Spaghetti bolognese",
+    "Greek yogurt", "Apple", "Cheeseburger", "Rice and beans", "Protein shake", "Pizza slice", "Salmon"
+]
+UNITS = {"KB": 1e3, "MB": 1e6, "GB": 1e9}
+
+
+def parse_size(text: str) -> int:
+    text = text.strip().upper()
+    for unit, factor in UNITS.items():
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * factor)
+    return int(text)
+
+
+def synthetic_user(rng: random.Random, days: int = 365, per_day: int = 4) -> dict:
+    start = date.today() - timedelta(days=days)
+    user_data = {}
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        base = int(time.mktime(day.timetuple()))
+        day_log = DayLog()
+        for n in range(per_day):
+            macros = tuple(round(rng.uniform(0, 60), 1) for _ in MACROS) if rng.random() < 0.5 else None
+            day_log.add_food(FoodEntry(f"{offset:03x}{n:03x}", rng.choice(MENU), rng.randint(50, 900), base + 3600 * (7 + 3 * n), macros))
+        user_data[day.isoformat()] = day_log
+    return user_data
+
+
+def build(path: str, size: int, pool: list) -> int:
+    """Write a snapshot of about size bytes from copies of the pooled records, returning its user count"""
+    records = []
+    total = 0
+    while total < size:
+        record = pool[len(records) % len(pool)]
+        records.append((str(100000000000000000 + len(records)), record))
+        total += len(record)
+    snapshot.write_snapshot(path, records)
+    return len(records)
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - started, result
+
+
+def run(path: str, size: int, pool: list, rng: random.Random) -> dict:
+    users = build(path, size, pool)
+    result = {"size": os.path.getsize(path), "users": users}
+    result["load_mmap"], loaded = timed(snapshot.load_snapshot, path, True)
+    result["load_read"], unmapped = timed(snapshot.load_snapshot, path, False)
+    del unmapped
+
+    ids = list(loaded)
+    decode_times = [timed(loaded.__getitem__, user_id_str)[0] for user_id_str in rng.sample(ids, min(100, len(ids)))]
+    result["decode"] = statistics.median(decode_times)
+
+    # As the bot saves: the decoded users were cached at the previous save, one of them changed since
+    encoded = {}
+    snapshot.snapshot_records(loaded, encoded)
+    changed = loaded.decoded_ids[0]
+    loaded[changed][next(iter(loaded[changed]))].add_food(FoodEntry("zzzzzz", "Banana", 105))
+    encoded.pop(changed)
+    result["save_loop"], records = timed(snapshot.snapshot_records, loaded, encoded)
+    result["save_write"], index = timed(snapshot.write_snapshot, path, records, loaded.buffer)
+    snapshot.attach_saved(loaded, path, index)
+    if isinstance(loaded.buffer, mmap.mmap):
+        loaded.buffer.close()
+    os.remove(path)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time snapshot loads and saves at several sizes")
+    parser.add_argument("--sizes", nargs="+", default=["10MB", "100MB", "1GB"])
+    parser.add_argument("--dir", default=tempfile.gettempdir(), help="where the snapshots are written (needs the largest size free)")
+    parser.add_argument("--max-loop-ms", type=float, default=100, help="longest acceptable on-loop part of a save")
+    args = parser.parse_args()
+
+    rng = random.Random(31)
+    pool = [snapshot.encode_user(synthetic_user(rng)) for _ in range(20)]
+    path = os.path.join(args.dir, f"snapshot-benchmark-{os.getpid()}.snap")
+
+    print(f"{'size':>8}{'users':>9}{'load mmap':>11}{'load read':>11}{'decode':>9}{'save loop':>11}{'save write':>12}")
+    worst = 0
+    for size_text in args.sizes:
+        try:
+            result = run(path, parse_size(size_text), pool, rng)
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+        worst = max(worst, result["save_loop"] * 1000)
+        write_rate = result["size"] / result["save_write"] / 1e6
+        print(f"{result['size'] / 1e6:>6.0f}MB{result['users']:>9}{result['load_mmap'] * 1000:>9.1f}ms"
+              f"{result['load_read'] * 1000:>9.1f}ms{result['decode'] * 1000:>7.2f}ms{result['save_loop'] * 1000:>9.1f}ms"
+              f"{result['save_write']:>7.2f}s ({write_rate:.0f} MB/s)")
+
+    if worst > args.max_loop_ms:
+        print(f"FAIL: the on-loop part of a save took {worst:.1f} ms (limit {args.max_loop_ms:.0f} ms)")
+    sys.exit(1 if worst > args.max_loop_ms else 0)
+
+
+if __name__ == "__main__":
+    main()
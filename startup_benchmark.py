@@ -0,0 +1,73 @@
+"""
+Startup import benchmark.
+
+Imports main in fresh interpreters with `python -X importtime` and reports
+the median time until the bot could start connecting to the gateway, plus
+the slowest direct imports. Fails (exit code 1) if that takes longer than
+the budget or if a dependency that should load lazily was imported.
+
+    python startup_benchmark.py [--runs 5] [--budget-ms 800]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+# Loaded on first use (or by the warm-up after connecting), never at startup
+LAZY_MODULES = ("google.generativeai", "PIL.Image", "requests")
+
+
+def measure_once() -> dict:
+    """{module: (self us, cumulative us, depth)} for one `import main`"""
+    env = dict(os.environ)
+    env.setdefault("DISCORD_TOKEN", "startup-benchmark")  # config.py refuses to load without one
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        capture_output=True,
+        text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"import main failed:\n{completed.stderr}")
+
+    modules = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        modules[name.strip()] = (int(self_us), int(cumulative_us), depth)
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how long importing the bot takes")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=800)
+    args = parser.parse_args()
+
+    runs = [measure_once() for _ in range(args.runs)]
+    total_ms = statistics.median(run["main"][1] for run in runs) / 1000
+    print(f"import main: {total_ms:.0f} ms (median of {args.runs} runs, budget {args.budget_ms:.0f} ms)")
+
+    # Direct imports of main, slowest first
+    direct = [name for name, (_, _, depth) in runs[0].items() if depth == 1]
+    slowest = sorted(direct, key=lambda name: statistics.median(run.get(name, (0, 0, 0))[1] for run in runs), reverse=True)
+    for name in slowest[:8]:
+        print(f"  {statistics.median(run.get(name, (0, 0, 0))[1] for run in runs) / 1000:7.1f} ms  {name}")
+
+    failures = []
+    eager = [name for name in LAZY_MODULES if name in runs[0]]
+    if eager:
+        failures.append(f"imported at startup but meant to load lazily: {', '.join(eager)}")
+    if total_ms > args.budget_ms:
+        failures.append(f"import main took {total_ms:.0f} ms, over the {args.budget_ms:.0f} ms budget")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import logging
+import os
+import threading
+import time
+from datetime import date, timedelta
+from shared_store import file_lock, read_json, write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+# How an analysis may spend, depending on how much of the day's budget is used
+NORMAL = "normal"
+ECONOMY = "economy"  # Cheaper paths first (known foods, cached answers, local model, small images)
+EXHAUSTED = "exhausted"  # Only paths that cost nothing
+
+USERS = "users"
+GUILDS = "guilds"
+
+# Positions in a usage row
+REQUESTS, PROMPT_TOKENS, OUTPUT_TOKENS, COST = range(4)
+
+
+def _add(row: list, other: list):
+    for i, value in enumerate(other):
+        row[i] += value
+
+
+def _merge(days: dict, other: dict):
+    """Add the rows of other ({day: {scope: {id: row}}}) into days"""
+    for day, scopes in other.items():
+        target = days.setdefault(day, {USERS: {}, GUILDS: {}})
+        for scope, rows in scopes.items():
+            for key, row in rows.items():
+                _add(target[scope].setdefault(key, [0, 0, 0, 0.0]), row)
+
+
+class UsageLedger:
+    """
+    Model requests, tokens and cost per user and per guild for each day.
+    New usage is counted in memory and merged into a JSON file by flush()
+    (under a file lock, adding to what is there), so worker processes
+    sharing the file add up instead of overwriting each other. Days older
+    than keep_days are dropped on flush. Other workers' usage is picked up
+    from the file at most every refresh_seconds, since every analysis
+    checks the budget.
+    """
+
+    def __init__(self, path: str, prices: dict, keep_days: int = 90, refresh_seconds: float = 5):
+        self.path = path
+        self.prices = prices  # backend -> (USD per million prompt tokens, per million output tokens)
+        self.keep_days = keep_days
+        self.refresh_seconds = refresh_seconds
+        self._saved = None
+        self._version = None
+        self._next_check = 0
+        self._pending = {}  # day -> {USERS: {id: row}, GUILDS: {id: row}}
+        self._flushing = {}  # Taken from _pending by a flush that hasn't written them yet
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def _load(self) -> dict:
+        """Saved days, re-read if the file changed (the caller holds _lock)"""
+        now = time.monotonic()
+        # While a flush is writing, the file may already hold what _flushing counts; it swaps in _saved itself
+        if self._saved is not None and (self._flushing or now < self._next_check):
+            return self._saved
+        self._next_check = now + self.refresh_seconds
+        try:
+            version = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            version = None
+        if self._saved is None or version != self._version:
+            self._saved = read_json(self.path, {}).get("days", {})
+            self._version = version
+        return self._saved
+
+    def cost(self, usage: dict) -> float:
+        prompt_price, output_price = self.prices.get(usage["backend"], (0, 0))
+        return (usage["prompt_tokens"] * prompt_price + usage["output_tokens"] * output_price) / 1_000_000
+
+    def record(self, user_id_str: str, guild_id_str: str, usage: dict):
+        """Count one answered model request; usage is {"backend", "prompt_tokens", "output_tokens"}"""
+        row = [1, usage["prompt_tokens"], usage["output_tokens"], self.cost(usage)]
+        with self._lock:
+            day = self._pending.setdefault(date.today().isoformat(), {USERS: {}, GUILDS: {}})
+            _add(day[USERS].setdefault(user_id_str, [0, 0, 0, 0.0]), row)
+            if guild_id_str:
+                _add(day[GUILDS].setdefault(guild_id_str, [0, 0, 0, 0.0]), row)
+
+    def day_totals(self, scope: str, key: str, day: str = None) -> list:
+        """[requests, prompt tokens, output tokens, cost] of a user or guild on a day (default today)"""
+        day = day or date.today().isoformat()
+        row = [0, 0, 0, 0.0]
+        with self._lock:
+            for days in (self._load(), self._flushing, self._pending):
+                saved = days.get(day, {}).get(scope, {}).get(key)
+                if saved:
+                    _add(row, saved)
+        return row
+
+    def totals(self, scope: str, key: str, days: int) -> list:
+        """Usage row of a user or guild summed over the last days, today included"""
+        today = date.today()
+        row = [0, 0, 0, 0.0]
+        for offset in range(days):
+            _add(row, self.day_totals(scope, key, (today - timedelta(days=offset)).isoformat()))
+        return row
+
+    def mode(self, user_id_str: str, guild_id_str: str, user_budget: float, guild_budget: float,
+             economy_share: float = 0.8) -> str:
+        """NORMAL, ECONOMY or EXHAUSTED from today's spend against daily budgets in USD (0 = no budget)"""
+        shares = []
+        if user_budget > 0:
+            shares.append(self.day_totals(USERS, user_id_str)[COST] / user_budget)
+        if guild_budget > 0 and guild_id_str:
+            shares.append(self.day_totals(GUILDS, guild_id_str)[COST] / guild_budget)
+        used = max(shares, default=0)
+        if used >= 1:
+            return EXHAUSTED
+        return ECONOMY if used >= economy_share else NORMAL
+
+    def flush(self):
+        """Merge the usage counted since the last flush into the file (blocking; run in an executor)"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._flushing = pending
+            if not pending:
+                return
+            cutoff = (date.today() - timedelta(days=self.keep_days)).isoformat()
+            try:
+                with file_lock(f"{self.path}.lock"):
+                    days = read_json(self.path, {}).get("days", {})
+                    _merge(days, pending)
+                    days = {day: scopes for day, scopes in days.items() if day >= cutoff}
+                    write_json_atomic(self.path, {"days": days}, separators=(",", ":"))
+                    version = os.stat(self.path).st_mtime_ns
+                    # At once, so no reader counts the flushed usage both in _saved and in _flushing
+                    with self._lock:
+                        self._saved, self._version, self._flushing = days, version, {}
+                        self._next_check = time.monotonic() + self.refresh_seconds
+            except OSError as e:
+                logger.error(f"Could not save model usage: {e}")
+                with self._lock:
+                    _merge(self._pending, pending)  # Kept for the next flush
+                    self._flushing = {}
@@ -0,0 +1,36 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class UserLockManager:
+    """
+    One asyncio lock per user, created on first use and dropped again once
+    nobody holds or waits for it. Operations on different users never share a
+    lock, and the table only holds users that currently have work in flight.
+    """
+
+    def __init__(self):
+        # user_id_str -> [lock, number of holders + waiters]
+        self._locks = {}
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    def locked(self, user_id_str: str) -> bool:
+        entry = self._locks.get(user_id_str)
+        return entry is not None and entry[0].locked()
+
+    @asynccontextmanager
+    async def hold(self, user_id_str: str):
+        """Serialize mutations of a single user's calorie data"""
+        entry = self._locks.get(user_id_str)
+        if entry is None:
+            entry = self._locks[user_id_str] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[user_id_str]